@@ -0,0 +1,187 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any
+
+import telemetry
+
+
+# Retry-After hints are clamped to this range (seconds)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+# Weight of the newest request in the service-time moving average
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of admitted.
+
+    status_code is 429 when the wait queue is already full (rejected
+    immediately) and 503 when the request waited queue_timeout seconds
+    without getting a slot.
+    """
+
+    def __init__(self, path: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{path} admission rejected: {reason}")
+        self.path = path
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def to_response(self) -> Dict[str, Any]:
+        return {
+            'error': 'Server is busy, retry later',
+            'details': str(self),
+            'retry_after': self.retry_after
+        }
+
+
+class _AdmissionBudget:
+    """Concurrency and queue bookkeeping shared by the thread and asyncio controllers."""
+
+    def __init__(self, path: str, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.path = path
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_service_time = 1.0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from the queue and recent service times."""
+        estimate = self.avg_service_time * (self.queued + 1) / self.max_concurrent
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(estimate))))
+
+    def _reject(self, reason: str, status_code: int) -> AdmissionRejected:
+        self.rejected += 1
+        telemetry.ADMISSION_REJECTIONS.inc(path=self.path, reason=reason)
+        return AdmissionRejected(self.path, reason, status_code, self.retry_after())
+
+    def _on_admitted(self, waited: float):
+        self.active += 1
+        self.admitted += 1
+        telemetry.ADMISSION_WAIT.observe(waited, path=self.path)
+
+    def _on_released(self, service_time: float):
+        self.active -= 1
+        self.avg_service_time += SERVICE_TIME_SMOOTHING * (service_time - self.avg_service_time)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queued': self.max_queued,
+            'queue_timeout': self.queue_timeout,
+            'active': self.active,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_service_time': round(self.avg_service_time, 3)
+        }
+
+
+class AdmissionController(_AdmissionBudget):
+    """
+    Bounded admission for a thread-per-request server.
+
+    At most max_concurrent requests run at once and at most max_queued wait
+    for a slot; anything beyond that is rejected immediately with 429, and
+    a queued request that does not get a slot within queue_timeout seconds
+    is rejected with 503. Shedding early keeps the admitted requests within
+    their latency budget instead of letting every request time out.
+    """
+
+    def __init__(self, path: str, max_concurrent: int, max_queued: int, queue_timeout: float):
+        super().__init__(path, max_concurrent, max_queued, queue_timeout)
+        self._slots = threading.Semaphore(max_concurrent)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.queued >= self.max_queued:
+                    raise self._reject("queue_full", 429)
+                self.queued += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.queued -= 1
+            if not acquired:
+                with self._lock:
+                    raise self._reject("queue_timeout", 503)
+
+        with self._lock:
+            self._on_admitted(time.perf_counter() - start)
+        admitted_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._on_released(time.perf_counter() - admitted_at)
+            self._slots.release()
+
+
+class AsyncAdmissionController(_AdmissionBudget):
+    """asyncio counterpart of AdmissionController for the ASGI app."""
+
+    def __init__(self, path: str, max_concurrent: int, max_queued: int, queue_timeout: float):
+        super().__init__(path, max_concurrent, max_queued, queue_timeout)
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def admit(self):
+        start = time.perf_counter()
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                raise self._reject("queue_full", 429)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", 503)
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        self._on_admitted(time.perf_counter() - start)
+        admitted_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._on_released(time.perf_counter() - admitted_at)
+            self._slots.release()
+
+
+def analysis_admission_from_env(controller_cls=AdmissionController) -> Dict[str, _AdmissionBudget]:
+    """
+    Build the analysis budgets, keyed by path label: "uncached" requests
+    run the pipeline (/api/analyze, /api/compare) and get a small budget;
+    "cached" requests are answered from stored analyses without it
+    (/api/memory/analysis, and /api/analyze revalidations answered 304) and
+    get a much larger one, so a spike of new queries cannot starve them.
+    """
+    return {
+        'uncached': controller_cls(
+            'uncached',
+            max_concurrent=int(os.getenv('WATCHSENSE_MAX_CONCURRENT_ANALYSES', '8')),
+            max_queued=int(os.getenv('WATCHSENSE_MAX_QUEUED_ANALYSES', '16')),
+            queue_timeout=float(os.getenv('WATCHSENSE_ADMISSION_TIMEOUT', '10')),
+        ),
+        'cached': controller_cls(
+            'cached',
+            max_concurrent=int(os.getenv('WATCHSENSE_MAX_CONCURRENT_CACHED', '64')),
+            max_queued=int(os.getenv('WATCHSENSE_MAX_QUEUED_CACHED', '256')),
+            queue_timeout=float(os.getenv('WATCHSENSE_CACHED_ADMISSION_TIMEOUT', '2')),
+        ),
+    }
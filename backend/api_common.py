@@ -0,0 +1,514 @@
+import os
+import hmac
+import math
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import telemetry
+import tracing
+import response_shaping
+from memory_manager import EnhancedMemoryManager
+from jobs import JobManager, JobQueueFull, JOB_PRIORITIES
+from artifacts import ArtifactError, current_version, list_versions, set_current_version
+
+
+# ============================================================================
+# SHARED API LOGIC
+# ============================================================================
+# Used by both the Flask app (app.py) and the ASGI app (asgi_app.py) so the
+# two serving paths return identical payloads.
+
+ENDPOINTS = {
+    '/api/analyze': 'POST - Analyze customer reviews',
+    '/api/compare': 'POST - Compare several brands for one query',
+    '/api/health': 'GET - Health check',
+    '/api/ready': 'GET - Readiness check (pipeline warmed up)',
+    '/metrics': 'GET - Prometheus metrics',
+    '/api/memory/stats': 'GET - Get memory statistics',
+    '/api/metrics/latency': 'GET - Get p50/p90/p99 latency per pipeline node',
+    '/api/memory/clear': 'POST - Clear memory',
+    '/api/memory/export': 'POST - Export memory',
+    '/api/memory/compact': 'POST - Apply memory retention policies',
+    '/api/memory/analysis': 'POST - Get analysis details',
+    '/api/jobs': 'POST - Submit an analysis job (returns a job ID)',
+    '/api/jobs/<job_id>': 'GET - Get job status',
+    '/api/jobs/<job_id>/result': 'GET - Get job result',
+    '/api/admin/profiles': 'GET - List stored request profiles',
+    '/api/admin/profiles/<profile_id>': 'GET - Download a profile (folded stacks)',
+    '/api/admin/artifacts': 'GET - Retrieval artifact versions and swap status',
+    '/api/admin/artifacts/activate': 'POST - Hot-swap to another artifact version'
+}
+
+# Required in the X-Admin-Token header of /api/admin/* requests; while it is
+# unset every admin request is refused
+ADMIN_TOKEN = os.getenv('WATCHSENSE_ADMIN_TOKEN')
+
+# Most brands one /api/compare request may name
+MAX_COMPARE_BRANDS = int(os.getenv('WATCHSENSE_MAX_COMPARE_BRANDS', '5'))
+
+# Endpoints polled by probes and scrapers are not traced
+UNTRACED_ENDPOINTS = {'/metrics', '/api/health', '/api/ready'}
+
+
+def register_memory_gauges(memory: EnhancedMemoryManager):
+    """Compute the memory store gauges from this manager at scrape time."""
+    telemetry.MEMORY_STORE_ENTRIES.set_function(lambda: {
+        (store,): len(entries)
+        for store, entries in memory.long_term.items()
+        if isinstance(entries, (list, dict))
+    })
+    telemetry.MEMORY_STORE_BYTES.set_function(lambda: {
+        (): os.path.getsize(memory.file_path) if os.path.exists(memory.file_path) else 0
+    })
+
+
+def is_admin_request(headers) -> bool:
+    """Check the X-Admin-Token header against WATCHSENSE_ADMIN_TOKEN; fails closed if it is unset."""
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+def profile_requested(headers, args) -> bool:
+    """Whether the client asked for this request to be profiled (X-Profile: 1 or ?profile=1)."""
+    return headers.get('X-Profile') == '1' or args.get('profile') == '1'
+
+
+def register_job_gauges(jobs: JobManager):
+    """Compute the job queue depth gauge from this manager at scrape time."""
+    telemetry.JOB_QUEUE_DEPTH.set_function(lambda: {
+        (priority,): depth for priority, depth in jobs.queue_depth().items()
+    })
+
+
+def register_admission_gauges(admission: Dict[str, Any]):
+    """Compute the admission queue gauges from these controllers at scrape time."""
+    telemetry.ADMISSION_QUEUE_DEPTH.set_function(lambda: {
+        (path,): controller.queued for path, controller in admission.items()
+    })
+    telemetry.ADMISSION_ACTIVE.set_function(lambda: {
+        (path,): controller.active for path, controller in admission.items()
+    })
+
+
+def record_coalesced_request(shared: bool, llm_calls_per_analysis: int):
+    """Count a request that reused an identical in-flight analysis."""
+    tracing.set_attribute("coalesced", shared)
+    if shared:
+        telemetry.COALESCED_REQUESTS.inc()
+        telemetry.LLM_CALLS_SAVED.inc(llm_calls_per_analysis)
+        print("Coalesced with an identical in-flight analysis")
+
+
+def analysis_key(spec: Dict[str, Any]) -> str:
+    """Key under which identical analyses coalesce: normalized query|brand|min_star|max_star."""
+    query = " ".join(str(spec['query']).lower().split())
+    return f"{query}|{spec.get('brand')}|{spec.get('min_star')}|{spec.get('max_star')}"
+
+
+def run_analysis(
+    flights,
+    run_query: Callable[..., Dict[str, Any]],
+    spec: Dict[str, Any],
+    llm_calls_per_analysis: int,
+) -> Dict[str, Any]:
+    """
+    Run the pipeline for an analysis spec.
+
+    Identical specs already running in this process (per `flights`, a
+    SingleFlight) share one pipeline run.
+    """
+    def compute():
+        return run_query(
+            user_query=spec['query'],
+            brand=spec.get('brand'),
+            min_star=spec.get('min_star'),
+            max_star=spec.get('max_star')
+        )
+
+    result, shared = flights.do(analysis_key(spec), compute)
+    record_coalesced_request(shared, llm_calls_per_analysis)
+    return result
+
+
+def submit_job(jobs: JobManager, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Validate a POST /api/jobs body and queue the job; returns (payload, status)."""
+    query = data.get('query')
+    if not query:
+        return {'error': 'Query is required'}, 400
+
+    priority = data.get('priority', 'interactive')
+    if priority not in JOB_PRIORITIES:
+        return {'error': f"priority must be one of {list(JOB_PRIORITIES)}"}, 400
+
+    spec = {
+        'query': query,
+        'brand': data.get('brand'),
+        'min_star': data.get('min_star'),
+        'max_star': data.get('max_star')
+    }
+    try:
+        job = jobs.submit(spec, priority=priority)
+    except JobQueueFull as e:
+        return {'error': 'Job queue is full, try again later', 'details': str(e)}, 503
+    telemetry.JOBS_SUBMITTED.inc(priority=priority)
+    print(f"Queued {priority} job {job['job_id']} for: {query}")
+
+    return {
+        **format_job_status(job),
+        'status_url': f"/api/jobs/{job['job_id']}",
+        'result_url': f"/api/jobs/{job['job_id']}/result"
+    }, 202
+
+
+def format_job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job state without the (large) result payload."""
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'priority': job['priority'],
+        'spec': job['spec'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'error': job['error']
+    }
+
+
+def job_result_response(job: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Map a job to its result payload and status code.
+
+    202 while queued or running, then the same payloads /api/analyze returns
+    (200, or 404 when no reviews matched), or 500 if the job failed.
+    """
+    if job['status'] in ('queued', 'running'):
+        return format_job_status(job), 202
+    if job['status'] == 'failed':
+        return {
+            'error': job['error'],
+            'details': 'An error occurred during analysis. Check server logs for details.'
+        }, 500
+
+    return analysis_payload(job['result'])
+
+
+def artifact_status(retrieval_store) -> Dict[str, Any]:
+    """Available artifact versions plus this process's active/draining state."""
+    return {
+        'current': current_version(),
+        'versions': list_versions(),
+        'loaded': retrieval_store.get().stats() if retrieval_store.loaded else None
+    }
+
+
+def activate_artifacts(retrieval_store, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Point CURRENT at a version and start loading it in this process; other
+    processes follow on their next poll. Returns (payload, status).
+    """
+    version = data.get('version')
+    if not version:
+        return {'error': 'version is required'}, 400
+    try:
+        set_current_version(version)
+    except (ArtifactError, OSError) as e:
+        return {'error': 'Invalid artifact version', 'details': str(e)}, 400
+    print(f"Activating retrieval artifacts {version}")
+
+    reloading = retrieval_store.get().reload(version) if retrieval_store.loaded else False
+    return {**artifact_status(retrieval_store), 'reloading': reloading}, 202
+
+
+def parse_compare_request(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Validate a POST /api/compare body; returns (spec, None) or (None, error payload)."""
+    query = data.get('query')
+    if not query:
+        return None, {'error': 'Query is required'}
+
+    brands = data.get('brands')
+    if not isinstance(brands, list) or not all(isinstance(b, str) and b.strip() for b in brands):
+        return None, {'error': 'brands must be a list of brand names'}
+    # Drop repeats, keeping the first spelling of each
+    unique = {}
+    for brand in brands:
+        unique.setdefault(brand.strip().lower(), brand.strip())
+    brands = list(unique.values())
+    if not 2 <= len(brands) <= MAX_COMPARE_BRANDS:
+        return None, {'error': f'brands must name between 2 and {MAX_COMPARE_BRANDS} different brands'}
+
+    return {
+        'query': query,
+        'brands': brands,
+        'min_star': data.get('min_star'),
+        'max_star': data.get('max_star')
+    }, None
+
+
+def render_comparison(result: Dict[str, Any], accept_encoding: Optional[str]) -> Tuple[bytes, int, Dict[str, str]]:
+    """Serialize a compare_brands result (404 when no brand matched), compressed if accepted."""
+    status_code = 404 if "error" in result else 200
+    body, encoding = response_shaping.compress(response_shaping.dumps(result), accept_encoding)
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return body, status_code, headers
+
+
+def analysis_etag(spec: Dict[str, Any], content_hash: Optional[str], schema: str, fields) -> Optional[str]:
+    """
+    ETag of an analysis in the requested shape: the request's analysis key,
+    the stored analysis's content hash (which leaves out timing fields),
+    schema and fields. None without a content hash.
+    """
+    if not content_hash:
+        return None
+    return response_shaping.make_etag(analysis_key(spec), content_hash, schema, ",".join(fields or []))
+
+
+def revalidate_analysis(
+    memory: EnhancedMemoryManager,
+    spec: Dict[str, Any],
+    schema: str,
+    fields,
+    if_none_match: Optional[str],
+) -> Optional[str]:
+    """
+    Check an If-None-Match against the latest stored analysis for the query.
+
+    Returns the ETag if the client's copy is still current (answer 304
+    without running the pipeline), else None. An analysis stored for the
+    same query with other filters has another ETag, so it never matches.
+    """
+    if not if_none_match:
+        return None
+    stored = memory.get_analysis_by_query(spec['query'])
+    etag = analysis_etag(spec, stored.get('content_hash'), schema, fields) if stored else None
+    matched = etag is not None and response_shaping.etag_matches(if_none_match, etag)
+    tracing.set_attribute("revalidated", matched)
+    return etag if matched else None
+
+
+def render_analysis(
+    result: Dict[str, Any],
+    schema: str,
+    fields,
+    accept_encoding: Optional[str],
+    etag: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+) -> Tuple[bytes, int, Dict[str, str]]:
+    """
+    Serialize an analysis result for /api/analyze.
+
+    Applies the schema and field selection, then compresses the JSON body if
+    the client accepts it. A successful result carries its etag; if that
+    matches If-None-Match the body is replaced by an empty 304.
+    Returns (body, status_code, headers).
+    """
+    payload, status_code = analysis_payload(result)
+    if status_code != 200:
+        etag = None
+    if etag and response_shaping.etag_matches(if_none_match, etag):
+        return b'', 304, {'ETag': etag}
+    if status_code == 200:
+        payload = response_shaping.shape_payload(payload, schema, fields)
+
+    body, encoding = response_shaping.compress(response_shaping.dumps(payload), accept_encoding)
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if etag:
+        headers['ETag'] = etag
+    return body, status_code, headers
+
+
+def analysis_payload(result: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Map a pipeline result to the /api/analyze payload and status code."""
+    if "error" in result:
+        return result, 404
+    return format_analysis_response(result), 200
+
+
+def format_analysis_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Transform a run_multi_agent_query result into the frontend response."""
+    # Extract advisor data with multiple fallback paths
+    advisor_data = result.get("advisor", {})
+    
+    # Try to get advisor_recommendations, fallback to direct advisor
+    advisor_recommendations = advisor_data.get("advisor_recommendations", advisor_data)
+    
+    # Extract and format product improvements with impact
+    product_improvements = advisor_recommendations.get("product_improvements", [])
+    
+    formatted_recommendations = []
+    for rec in product_improvements:
+        if isinstance(rec, dict):
+            area = rec.get('area', 'General')
+            suggestion = rec.get('suggestion', '')
+            priority = rec.get('priority', 'medium')
+            impact = rec.get('estimated_impact', '')
+            
+            # Create rich object format for frontend
+            rec_obj = {
+                'area': area,
+                'suggestion': suggestion,
+                'priority': priority,
+                'impact': impact
+            }
+            formatted_recommendations.append(rec_obj)
+        else:
+            # Handle string format
+            formatted_recommendations.append({'suggestion': str(rec), 'priority': 'medium'})
+    
+    # Extract marketing suggestions
+    marketing_suggestions = advisor_recommendations.get("marketing_suggestions", [])
+    
+    # Extract competitive advantages  
+    competitive_advantages = advisor_recommendations.get("competitive_advantages", [])
+    
+    # Extract risk areas
+    risk_areas = advisor_recommendations.get("risk_areas", [])
+    
+    # Detect intent
+    intent = result.get("intent", "overall")
+    
+    # Get latency metrics
+    latency_metrics = result.get("latency_metrics", {})
+    eval_metrics = result.get("eval_metrics", {})
+    
+    # Build advisor object with all recommendations nested properly
+    advisor_output = {
+        "product_improvements": formatted_recommendations,
+        "marketing_suggestions": marketing_suggestions,
+        "competitive_advantages": competitive_advantages,
+        "risk_areas": risk_areas
+    }
+    
+    # Transform result for frontend compatibility
+    response_data = {
+        "query": result.get("query"),
+        "intent": intent,
+        "summary": result.get("summary", {}),
+        "feature_analysis": result.get("feature_analysis", {}),
+        "advisor": advisor_output,  # Nest everything under advisor
+        "recommendations": formatted_recommendations,  # Also keep at top level for compatibility
+        "marketing_suggestions": marketing_suggestions,
+        "competitive_advantages": competitive_advantages,
+        "risk_areas": risk_areas,
+        "metrics": {
+            "reviews_retrieved": result.get("retrieved_count", 0),
+            "avg_rating": result.get("summary", {}).get("rating_stats", {}).get("average"),
+            "total_latency": latency_metrics.get("total_latency", 0),
+            "retrieval_precision": eval_metrics.get("retrieval_precision", 0),
+            "rating_accuracy": eval_metrics.get("rating_accuracy", 0),
+            "retrieval_k": eval_metrics.get("retrieval_k"),
+            "retrieval_cutoff_score": eval_metrics.get("retrieval_cutoff_score")
+        },
+        "performance_metrics": {
+            "total_latency": latency_metrics.get("total_latency", 0),
+            "feature_extraction_time": latency_metrics.get("feature_extraction_time", 0),
+            "retrieval_time": latency_metrics.get("retrieval_time", 0),
+            "feature_analysis_time": latency_metrics.get("feature_analysis_time", 0),
+            "summary_time": latency_metrics.get("summary_time", 0),
+            "faithfulness_time": latency_metrics.get("faithfulness_time", 0),
+            "advisor_time": latency_metrics.get("advisor_time", 0),
+            "evaluation_time": latency_metrics.get("evaluation_time", 0),
+            "retrieval_count": result.get("retrieved_count", 0),
+            "retrieval_k": eval_metrics.get("retrieval_k"),
+            "retrieval_cutoff_score": eval_metrics.get("retrieval_cutoff_score"),
+            "retrieval_k_reason": eval_metrics.get("retrieval_k_reason"),
+            "retrieval_precision": eval_metrics.get("retrieval_precision", 0),
+            "rating_accuracy": eval_metrics.get("rating_accuracy", 0),
+            "faithfulness_score": eval_metrics.get("improved_faithfulness", 0),
+            "suggestions_generated": len(formatted_recommendations) + len(marketing_suggestions)
+        },
+        "total_reviews": result.get("retrieved_count", 0),
+        "avg_rating": result.get("summary", {}).get("rating_stats", {}).get("average"),
+        "overall_sentiment": result.get("summary", {}).get("rating_stats", {}).get("sentiment_percentages")
+    }
+    
+    tracing.set_attribute("advisor_items", {
+        "recommendations": len(formatted_recommendations),
+        "marketing": len(marketing_suggestions),
+        "advantages": len(competitive_advantages),
+        "risks": len(risk_areas),
+    })
+    
+    return response_data
+
+
+def build_memory_stats(memory: EnhancedMemoryManager) -> Dict[str, Any]:
+    """Build the /api/memory/stats payload."""
+    # Get basic stats
+    query_history = memory.long_term.get('query_history', [])
+    brands = memory.long_term.get('brands', [])
+    complete_analyses = memory.long_term.get('complete_analyses', [])
+    
+    # Format query history
+    formatted_history = []
+    for q in query_history[-20:]:
+        formatted_history.append({
+            'query': q.get('query', ''),
+            'timestamp': q.get('timestamp', '')
+        })
+    
+    return {
+        'total_queries': len(query_history),
+        'brands_tracked': len(brands),
+        'summaries_stored': len(complete_analyses),
+        'cache_hit_rate': round(memory.get_cache_hit_rate(), 1),
+        'cache_hits': memory.cache_stats['hits'],
+        'cache_misses': memory.cache_stats['misses'],
+        'coalesced_requests': int(telemetry.COALESCED_REQUESTS.value()),
+        'llm_calls_saved': int(telemetry.LLM_CALLS_SAVED.value()),
+        'query_history': list(reversed(formatted_history)),
+        'brands': brands
+    }
+
+
+def parse_analysis_lookup(data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Validate a POST /api/memory/analysis body; returns (spec, None) or (None, error payload)."""
+    query = data.get('query')
+    if not query:
+        return None, {'error': 'Query is required'}
+
+    min_similarity = data.get('min_similarity', 0.75)
+    try:
+        if isinstance(min_similarity, bool):
+            raise ValueError
+        min_similarity = float(min_similarity)
+    except (TypeError, ValueError):
+        return None, {'error': 'min_similarity must be a number between -1 and 1'}
+    if not math.isfinite(min_similarity) or not -1 <= min_similarity <= 1:
+        return None, {'error': 'min_similarity must be a number between -1 and 1'}
+
+    return {
+        'query': query,
+        'semantic': bool(data.get('semantic')),
+        'min_similarity': min_similarity
+    }, None
+
+
+def find_analysis(memory: EnhancedMemoryManager, spec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Look up a stored analysis, optionally falling back to semantic match; counts hits and misses."""
+    query = spec['query']
+    analysis = memory.get_analysis_by_query(query)
+    
+    # Optionally fall back to the semantically closest past analysis
+    if not analysis and spec['semantic']:
+        closest, similarity = memory.find_closest_analysis(query, min_similarity=spec['min_similarity'])
+        if closest:
+            analysis = {
+                **closest,
+                'match': {
+                    'type': 'semantic',
+                    'matched_query': closest.get('query'),
+                    'similarity': round(similarity, 4)
+                }
+            }
+    
+    memory.record_lookup(analysis is not None)
+    if analysis is not None:
+        telemetry.CACHE_HITS.inc()
+    else:
+        telemetry.CACHE_MISSES.inc()
+    return analysis
@@ -1,10 +1,42 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, send_file
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv
 import traceback
-from notebook_code import run_multi_agent_query
-from notebook_code import memory
+from notebook_code import run_multi_agent_query, compare_brands
+from notebook_code import memory, LLM_CALLS_PER_ANALYSIS, RETRIEVAL_STORE
+from notebook_code import STARTUP_STATS, start_warm_up, get_startup_report
+import telemetry
+import tracing
+import profiling
+from api_common import (
+    UNTRACED_ENDPOINTS,
+    is_admin_request,
+    profile_requested,
+    render_analysis,
+    analysis_etag,
+    revalidate_analysis,
+    ENDPOINTS,
+    register_memory_gauges,
+    build_memory_stats,
+    find_analysis,
+    parse_analysis_lookup,
+    register_job_gauges,
+    register_admission_gauges,
+    run_analysis,
+    submit_job,
+    format_job_status,
+    job_result_response,
+    artifact_status,
+    activate_artifacts,
+    parse_compare_request,
+    render_comparison,
+)
+from jobs import JobManager
+from response_shaping import parse_shaping_params
+from admission import AdmissionRejected, analysis_admission_from_env
+from singleflight import SingleFlight
 
 # Load environment variable
 load_dotenv()
@@ -21,6 +53,78 @@ CORS(app, resources={
 })
 
 
+# Load the model, index and mapping, compile the workflow and warm
+# the agents in the background; /api/ready reports when this has finished.
+# With WATCHSENSE_WARMUP=0 resources load lazily on the first analysis instead.
+if os.getenv('WATCHSENSE_WARMUP', '1') != '0':
+    start_warm_up()
+
+# Scrape-time gauges for the memory store
+register_memory_gauges(memory)
+
+# Coalesces identical in-flight /api/analyze requests by analysis key
+ANALYSIS_FLIGHTS = SingleFlight()
+
+# Concurrency and queue budgets: pipeline runs ("uncached") and answers
+# from stored analyses ("cached")
+ANALYSIS_ADMISSION = analysis_admission_from_env()
+register_admission_gauges(ANALYSIS_ADMISSION)
+
+# Background analysis jobs for /api/jobs; workers start on first use
+JOBS = JobManager(
+    runner=lambda spec: run_analysis(
+        ANALYSIS_FLIGHTS, run_multi_agent_query, spec, LLM_CALLS_PER_ANALYSIS
+    ),
+    workers=int(os.getenv('WATCHSENSE_JOB_WORKERS', '2')),
+    max_queued=int(os.getenv('WATCHSENSE_JOB_MAX_QUEUED', '100')),
+)
+register_job_gauges(JOBS)
+
+# Resume jobs left unfinished by a previous run. The pre-fork master skips
+# this (threads do not survive fork); workers start their pool on first use.
+if os.getenv('WATCHSENSE_WARMUP', '1') != '0':
+    JOBS.start()
+
+
+@app.before_request
+def start_request_timer():
+    """Track in-flight requests, start the request timer and the root trace span"""
+    g.request_start = time.perf_counter()
+    g.request_endpoint = request.endpoint or 'unknown'
+    telemetry.INFLIGHT_REQUESTS.inc(endpoint=g.request_endpoint)
+    
+    if request.path not in UNTRACED_ENDPOINTS:
+        route = request.url_rule.rule if request.url_rule else request.path
+        g.trace_scope = tracing.span(f"{request.method} {route}", http_method=request.method, route=route)
+        g.trace_span = g.trace_scope.__enter__()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency by endpoint and status"""
+    if 'request_start' in g:
+        telemetry.HTTP_LATENCY.observe(
+            time.perf_counter() - g.request_start,
+            endpoint=g.request_endpoint,
+            status=response.status_code
+        )
+    if 'trace_span' in g and g.trace_span.trace_id:
+        g.trace_span.set_attribute("http_status", response.status_code)
+        response.headers['X-Trace-Id'] = g.trace_span.trace_id
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    """Decrement in-flight requests and end the trace even if the handler raised"""
+    if 'request_endpoint' in g:
+        telemetry.INFLIGHT_REQUESTS.dec(endpoint=g.request_endpoint)
+    if 'trace_scope' in g:
+        if exc is not None:
+            g.trace_span.set_attribute("error", str(exc))
+        g.trace_scope.__exit__(None, None, None)
+
+
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze_reviews():
     """Main endpoint for review analysis"""
@@ -31,7 +135,6 @@ def analyze_reviews():
     
     try:
         data = request.json
-        print(f"Received request data: {data}")
         
         query = data.get('query')
         brand = data.get('brand')
@@ -42,129 +145,176 @@ def analyze_reviews():
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
-        print(f"Analyzing query: {query}")
-        print(f"Brand: {brand}, Min Star: {min_star}, Max Star: {max_star}")
+        # Response shape: ?schema=full|compact and ?fields=a,b.c
+        try:
+            schema, fields = parse_shaping_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Call the analysis function
-        result = run_multi_agent_query(
-            user_query=query,
-            brand=brand,
-            min_star=min_star,
-            max_star=max_star
-        )
-        
-        if "error" in result:
-            return jsonify(result), 404
-        
-        # Extract advisor data with multiple fallback paths
-        advisor_data = result.get("advisor", {})
-        print(f"Advisor data keys: {list(advisor_data.keys())}")
-        
-        # Try to get advisor_recommendations, fallback to direct advisor
-        advisor_recommendations = advisor_data.get("advisor_recommendations", advisor_data)
-        print(f"Advisor recommendations keys: {list(advisor_recommendations.keys())}")
-        
-        # Extract and format product improvements with impact
-        product_improvements = advisor_recommendations.get("product_improvements", [])
-        print(f"Found {len(product_improvements)} product improvements")
-        
-        formatted_recommendations = []
-        for rec in product_improvements:
-            if isinstance(rec, dict):
-                area = rec.get('area', 'General')
-                suggestion = rec.get('suggestion', '')
-                priority = rec.get('priority', 'medium')
-                impact = rec.get('estimated_impact', '')
-                
-                # Create rich object format for frontend
-                rec_obj = {
-                    'area': area,
-                    'suggestion': suggestion,
-                    'priority': priority,
-                    'impact': impact
-                }
-                formatted_recommendations.append(rec_obj)
-            else:
-                # Handle string format
-                formatted_recommendations.append({'suggestion': str(rec), 'priority': 'medium'})
-        
-        # Extract marketing suggestions
-        marketing_suggestions = advisor_recommendations.get("marketing_suggestions", [])
-        print(f"Found {len(marketing_suggestions)} marketing suggestions")
+        print(f"Analyzing query: {query} (brand={brand}, stars={min_star}-{max_star})")
         
-        # Extract competitive advantages  
-        competitive_advantages = advisor_recommendations.get("competitive_advantages", [])
-        print(f"Found {len(competitive_advantages)} competitive advantages")
+        # The client's copy is still the latest stored analysis for this
+        # request: answer 304 from the cached path, without the pipeline
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tracing.set_attribute("admission_path", "cached")
+            with ANALYSIS_ADMISSION['cached'].admit():
+                etag = revalidate_analysis(memory, data, schema, fields, if_none_match)
+            if etag:
+                return Response(status=304, headers={'ETag': etag})
         
-        # Extract risk areas
-        risk_areas = advisor_recommendations.get("risk_areas", [])
-        print(f"Found {len(risk_areas)} risk areas")
+        # Over the admission budget, shed the request instead of queueing it
+        tracing.set_attribute("admission_path", "uncached")
+        with ANALYSIS_ADMISSION['uncached'].admit():
+            # Opt-in (X-Profile: 1 / ?profile=1) or sampled profiling, within the guard's budget
+            profile_reason = profiling.should_profile(profile_requested(request.headers, request.args))
+            with profiling.profile_request(profile_reason, query=query,
+                                           trace_id=tracing.current_span().trace_id) as profile:
+                result = run_analysis(ANALYSIS_FLIGHTS, run_multi_agent_query, data, LLM_CALLS_PER_ANALYSIS)
+                body, status_code, headers = render_analysis(
+                    result, schema, fields, request.headers.get('Accept-Encoding'),
+                    analysis_etag(data, result.get('analysis_hash'), schema, fields), if_none_match
+                )
         
-        # Detect intent
-        intent = result.get("intent", "overall")
-        print(f"Detected intent: {intent}")
+        if profile.profile_id:
+            headers['X-Profile-Id'] = profile.profile_id
+        return Response(body, status=status_code, headers=headers)
         
-        # Get latency metrics
-        latency_metrics = result.get("latency_metrics", {})
-        eval_metrics = result.get("eval_metrics", {})
+    except AdmissionRejected as e:
+        print(f"Shedding analyze request: {e}")
+        return jsonify(e.to_response()), e.status_code, {'Retry-After': str(e.retry_after)}
         
-        # Build advisor object with all recommendations nested properly
-        advisor_output = {
-            "product_improvements": formatted_recommendations,
-            "marketing_suggestions": marketing_suggestions,
-            "competitive_advantages": competitive_advantages,
-            "risk_areas": risk_areas
-        }
+    except Exception as e:
+        print(f"Error in analyze_reviews: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'details': 'An error occurred during analysis. Check server logs for details.'
+        }), 500
+
+
+@app.route('/api/compare', methods=['POST', 'OPTIONS'])
+def compare_reviews():
+    """Compare several brands for one query with shared retrieval and one LLM call"""
+    
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    try:
+        spec, error = parse_compare_request(request.json or {})
+        if error:
+            return jsonify(error), 400
         
-        # Transform result for frontend compatibility
-        response_data = {
-            "query": result.get("query"),
-            "intent": intent,
-            "summary": result.get("summary", {}),
-            "feature_analysis": result.get("feature_analysis", {}),
-            "advisor": advisor_output,  # Nest everything under advisor
-            "recommendations": formatted_recommendations,  # Also keep at top level for compatibility
-            "marketing_suggestions": marketing_suggestions,
-            "competitive_advantages": competitive_advantages,
-            "risk_areas": risk_areas,
-            "metrics": {
-                "reviews_retrieved": result.get("retrieved_count", 0),
-                "avg_rating": result.get("summary", {}).get("rating_stats", {}).get("average"),
-                "total_latency": latency_metrics.get("total_latency", 0),
-                "retrieval_precision": eval_metrics.get("retrieval_precision", 0),
-                "rating_accuracy": eval_metrics.get("rating_accuracy", 0)
-            },
-            "performance_metrics": {
-                "total_latency": latency_metrics.get("total_latency", 0),
-                "feature_extraction_time": latency_metrics.get("feature_extraction_time", 0),
-                "retrieval_time": latency_metrics.get("retrieval_time", 0),
-                "feature_analysis_time": latency_metrics.get("feature_analysis_time", 0),
-                "summary_time": latency_metrics.get("summary_time", 0),
-                "faithfulness_time": latency_metrics.get("faithfulness_time", 0),
-                "advisor_time": latency_metrics.get("advisor_time", 0),
-                "evaluation_time": latency_metrics.get("evaluation_time", 0),
-                "retrieval_count": result.get("retrieved_count", 0),
-                "retrieval_precision": eval_metrics.get("retrieval_precision", 0),
-                "rating_accuracy": eval_metrics.get("rating_accuracy", 0),
-                "faithfulness_score": eval_metrics.get("improved_faithfulness", 0),
-                "suggestions_generated": len(formatted_recommendations) + len(marketing_suggestions)
-            },
-            "total_reviews": result.get("retrieved_count", 0),
-            "avg_rating": result.get("summary", {}).get("rating_stats", {}).get("average"),
-            "overall_sentiment": result.get("summary", {}).get("rating_stats", {}).get("sentiment_percentages")
-        }
+        print(f"Comparing brands {spec['brands']} for query: {spec['query']}")
         
-        print(f"Analysis completed successfully")
-        print(f"Sending: {len(formatted_recommendations)} recommendations, {len(marketing_suggestions)} marketing, {len(competitive_advantages)} advantages, {len(risk_areas)} risks")
+        with ANALYSIS_ADMISSION['uncached'].admit():
+            result = compare_brands(spec['query'], spec['brands'], spec['min_star'], spec['max_star'])
+            body, status_code, headers = render_comparison(result, request.headers.get('Accept-Encoding'))
+        return Response(body, status=status_code, headers=headers)
         
-        return jsonify(response_data), 200
+    except AdmissionRejected as e:
+        print(f"Shedding compare request: {e}")
+        return jsonify(e.to_response()), e.status_code, {'Retry-After': str(e.retry_after)}
         
     except Exception as e:
-        print(f"Error in analyze_reviews: {str(e)}")
+        print(f"Error in compare_reviews: {str(e)}")
         traceback.print_exc()
         return jsonify({
             'error': str(e),
-            'details': 'An error occurred during analysis. Check server logs for details.'
+            'details': 'An error occurred during comparison. Check server logs for details.'
+        }), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Submit an analysis job and return its ID immediately"""
+    try:
+        payload, status_code = submit_job(JOBS, request.json or {})
+        return jsonify(payload), status_code
+    except Exception as e:
+        print(f"Error submitting job: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Failed to submit job',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get the status of an analysis job"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(format_job_status(job)), 200
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Get the result of an analysis job (202 while it is still running)"""
+    try:
+        job = JOBS.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        payload, status_code = job_result_response(job)
+        return jsonify(payload), status_code
+    except Exception as e:
+        print(f"Error retrieving job result: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Failed to retrieve job result',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List stored request profiles, newest first"""
+    if not is_admin_request(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({
+        'profiles': profiling.STORE.list(),
+        'max_fraction': profiling.GUARD.max_fraction,
+        'sample_rate': profiling.GUARD.sample_rate,
+        'denied': profiling.GUARD.denied
+    }), 200
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """Download a profile as folded stacks (flamegraph.pl / speedscope)"""
+    if not is_admin_request(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    path = profiling.STORE.path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='text/plain', as_attachment=True,
+                     download_name=f"{profile_id}.folded")
+
+
+@app.route('/api/admin/artifacts', methods=['GET'])
+def get_artifacts():
+    """List retrieval artifact versions and this worker's swap state"""
+    if not is_admin_request(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify(artifact_status(RETRIEVAL_STORE)), 200
+
+
+@app.route('/api/admin/artifacts/activate', methods=['POST'])
+def activate_artifact_version():
+    """Verify a version, make it CURRENT and hot-swap to it in the background"""
+    if not is_admin_request(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        payload, status_code = activate_artifacts(RETRIEVAL_STORE, request.get_json(silent=True) or {})
+        return jsonify(payload), status_code
+    except Exception as e:
+        print(f"Error activating artifacts: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Failed to activate artifacts',
+            'details': str(e)
         }), 500
 
 
@@ -177,52 +327,44 @@ def health_check():
     }), 200
 
 
-@app.route('/api/memory/stats', methods=['GET'])
-def get_memory_stats():
-    """Get memory and cache statistics"""
+@app.route('/api/metrics/latency', methods=['GET'])
+def get_latency_percentiles():
+    """Get rolling latency percentiles per pipeline node"""
     try:
-        # Get basic stats
-        query_history = memory.long_term.get('query_history', [])
-        brands = memory.long_term.get('brands', [])
-        cache = memory.long_term.get('query_cache', {})
-        summaries = memory.long_term.get('summary_history', [])
-        complete_analyses = memory.long_term.get('complete_analyses', [])
-        
-        # Format cached queries
-        cached_queries = []
-        for cache_key, cache_data in cache.items():
-            parts = cache_key.split('|')
-            if len(parts) == 4:
-                query, brand, min_star, max_star = parts
-                cached_queries.append({
-                    'query': query,
-                    'filters': f"{min_star}-{max_star} stars" + (f", {brand}" if brand != 'None' else ""),
-                    'cached_at': cache_data.get('cached_at'),
-                    'access_count': cache_data.get('access_count', 1)
-                })
-        
-        # Format query history
-        formatted_history = []
-        for q in query_history[-20:]:
-            query_text = q.get('query', '')
-            # Check if this query is cached
-            is_cached = any(cache_key.startswith(query_text.lower()) for cache_key in cache.keys())
-            formatted_history.append({
-                'query': query_text,
-                'timestamp': q.get('timestamp', ''),
-                'cached': is_cached
-            })
-        
         return jsonify({
-            'total_queries': len(query_history),
-            'total_cached': len(cache),
-            'brands_tracked': len(brands),
-            'summaries_stored': len(complete_analyses),
-            'cache_hit_rate': round((len(cache) / max(len(query_history), 1)) * 100, 1),
-            'query_history': list(reversed(formatted_history)),
-            'cached_queries': cached_queries,
-            'brands': brands
+            'windows': list(memory.latency_sketches.windows.keys()),
+            'nodes': memory.get_latency_percentiles()
         }), 200
+    except Exception as e:
+        print(f"Error getting latency percentiles: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Failed to get latency percentiles',
+            'details': str(e)
+        }), 500
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the pipeline is compiled and warmed up"""
+    status_code = 200 if STARTUP_STATS['ready'] else 503
+    return jsonify({
+        'status': 'ready' if STARTUP_STATS['ready'] else 'warming_up',
+        'startup': get_startup_report()
+    }), status_code
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(telemetry.REGISTRY.render(), content_type=telemetry.CONTENT_TYPE)
+
+
+@app.route('/api/memory/stats', methods=['GET'])
+def get_memory_stats():
+    """Get memory and lookup statistics"""
+    try:
+        return jsonify(build_memory_stats(memory)), 200
     except Exception as e:
         print(f"Error getting memory stats: {e}")
         traceback.print_exc()
@@ -279,7 +421,7 @@ def export_memory():
                 'status': 'error',
                 'message': 'Failed to export memory'
             }), 500
-            
+
     except Exception as e:
         print(f"Error exporting memory: {e}")
         traceback.print_exc()
@@ -289,23 +431,48 @@ def export_memory():
         }), 500
 
 
+@app.route('/api/memory/compact', methods=['POST'])
+def compact_memory():
+    """Apply retention policies and roll up old performance metrics"""
+    try:
+        removed = memory.compact()
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Memory compacted successfully',
+            'removed': removed
+        }), 200
+        
+    except Exception as e:
+        print(f"Error compacting memory: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'error': 'Failed to compact memory',
+            'details': str(e)
+        }), 500
+
+
 @app.route('/api/memory/analysis', methods=['POST'])
 def get_query_analysis():
     """Get complete analysis for a specific query"""
     try:
-        data = request.json
-        query = data.get('query')
+        spec, error = parse_analysis_lookup(request.json or {})
+        if error:
+            return jsonify(error), 400
         
-        if not query:
-            return jsonify({'error': 'Query is required'}), 400
-        
-        analysis = memory.get_analysis_by_query(query)
+        tracing.set_attribute("admission_path", "cached")
+        with ANALYSIS_ADMISSION['cached'].admit():
+            analysis = find_analysis(memory, spec)
         
         if analysis:
             return jsonify(analysis), 200
         else:
             return jsonify({'error': 'Analysis not found for this query'}), 404
-            
+    
+    except AdmissionRejected as e:
+        print(f"Shedding analysis lookup: {e}")
+        return jsonify(e.to_response()), e.status_code, {'Retry-After': str(e.retry_after)}
+
     except Exception as e:
         print(f"Error retrieving analysis: {e}")
         traceback.print_exc()
@@ -321,14 +488,7 @@ def home():
     return jsonify({
         'message': 'WatchSense AI Backend',
         'status': 'running',
-        'endpoints': {
-            '/api/analyze': 'POST - Analyze customer reviews',
-            '/api/health': 'GET - Health check',
-            '/api/memory/stats': 'GET - Get memory statistics',
-            '/api/memory/clear': 'POST - Clear memory',
-            '/api/memory/export': 'POST - Export memory',
-            '/api/memory/analysis': 'POST - Get analysis details'
-        }
+        'endpoints': ENDPOINTS
     }), 200
 
 
@@ -342,5 +502,6 @@ def server_error(e):
     return jsonify({'error': 'Internal server error'}), 500
 
 
+# Development server only; use `gunicorn -c gunicorn.conf.py app:app` in production
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
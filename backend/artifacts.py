@@ -0,0 +1,389 @@
+"""
+Versioned retrieval artifacts with hot-swapping.
+
+    artifacts/
+        CURRENT                  # name of the active version
+        20261019_120000/
+            faiss_index.bin
+            embeddings.npy
+            mapping.csv
+            checksums.json       # sha256 of each base file
+            segments/            # delta segments for this version (segments.py)
+
+Build a version with `python ingest.py reviews.tsv --version 20261019_120000`
+(in a hidden directory, renamed into place once complete) and activate it
+with `--activate`, `python artifacts.py activate VERSION` or
+POST /api/admin/artifacts/activate. Every server process notices the new
+CURRENT within ARTIFACT_POLL_SECONDS, loads and validates the version in a
+background thread while requests keep using the old one, then switches
+atomically. Requests that already hold the old store finish on it; its
+memory is released once the last of them is done.
+
+Without an artifacts/ directory the legacy layout (artifacts in the working
+directory) is served as version "legacy".
+"""
+import os
+import gc
+import sys
+import shutil
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from persistence import atomic_write_text
+import segments
+from segments import SegmentedIndex, BASE_FILES
+
+
+ARTIFACTS_DIR = os.getenv("WATCHSENSE_ARTIFACTS_DIR", "artifacts")
+CURRENT_FILE = "CURRENT"
+CHECKSUMS_FILE = "checksums.json"
+LEGACY_VERSION = "legacy"
+
+# Permissions of version directories built with new_build_dir()
+NEW_DIR_MODE = 0o755
+
+# Minimum seconds between checks of the CURRENT pointer
+ARTIFACT_POLL_SECONDS = float(os.getenv("WATCHSENSE_ARTIFACT_POLL_SECONDS", "10"))
+
+
+class ArtifactError(Exception):
+    """A version is missing, corrupt or inconsistent."""
+
+
+# ============================================================================
+# VERSIONS AND CHECKSUMS
+# ============================================================================
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_checksums(version_dir: str) -> Dict[str, str]:
+    """Record the sha256 of each base file in checksums.json."""
+    checksums = {name: file_sha256(os.path.join(version_dir, name)) for name in BASE_FILES}
+    atomic_write_text(os.path.join(version_dir, CHECKSUMS_FILE), json.dumps(checksums, indent=2))
+    return checksums
+
+
+def verify_checksums(version_dir: str):
+    """
+    Check the base files against checksums.json.
+
+    Raises:
+        ArtifactError: checksums.json is missing or a file does not match
+    """
+    path = os.path.join(version_dir, CHECKSUMS_FILE)
+    if not os.path.exists(path):
+        raise ArtifactError(f"{version_dir} has no {CHECKSUMS_FILE}")
+    with open(path, "r") as f:
+        expected = json.load(f)
+    for name in BASE_FILES:
+        file_path = os.path.join(version_dir, name)
+        if not os.path.exists(file_path):
+            raise ArtifactError(f"{version_dir} is missing {name}")
+        if file_sha256(file_path) != expected.get(name):
+            raise ArtifactError(f"Checksum mismatch for {name} in {version_dir}")
+
+
+def version_dir(version: str, artifacts_dir: str = ARTIFACTS_DIR) -> str:
+    if version == LEGACY_VERSION:
+        return "."
+    if not version or os.path.basename(version) != version or version.startswith("."):
+        raise ArtifactError(f"Invalid version name: {version!r}")
+    return os.path.join(artifacts_dir, version)
+
+
+def list_versions(artifacts_dir: str = ARTIFACTS_DIR) -> List[str]:
+    if not os.path.isdir(artifacts_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(artifacts_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(artifacts_dir, name))
+    )
+
+
+def current_version(artifacts_dir: str = ARTIFACTS_DIR) -> str:
+    """The version named by CURRENT, or 'legacy' if there is none."""
+    try:
+        with open(os.path.join(artifacts_dir, CURRENT_FILE), "r") as f:
+            return f.read().strip() or LEGACY_VERSION
+    except OSError:
+        return LEGACY_VERSION
+
+
+def set_current_version(version: str, artifacts_dir: str = ARTIFACTS_DIR):
+    """Point CURRENT at a version after verifying it; servers pick it up on their next poll."""
+    verify_checksums(version_dir(version, artifacts_dir))
+    os.makedirs(artifacts_dir, exist_ok=True)
+    atomic_write_text(os.path.join(artifacts_dir, CURRENT_FILE), version + "\n")
+
+
+def new_version_name() -> str:
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def new_build_dir(version: str, artifacts_dir: str = ARTIFACTS_DIR) -> str:
+    """
+    Private directory to build a version in. It is hidden from
+    list_versions() until publish_version() renames it into place.
+
+    Raises:
+        ArtifactError: the version already exists
+    """
+    if version == LEGACY_VERSION or os.path.exists(version_dir(version, artifacts_dir)):
+        raise ArtifactError(f"Version {version} already exists")
+    os.makedirs(artifacts_dir, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f".build.{version}.", dir=artifacts_dir)
+    # mkdtemp creates the directory 0700, which the rename would carry over
+    os.chmod(directory, NEW_DIR_MODE)
+    return directory
+
+
+def publish_version(build_dir: str, version: str, artifacts_dir: str = ARTIFACTS_DIR) -> str:
+    """
+    Write checksums for a finished build and publish it as artifacts/VERSION
+    with a single rename, so no reader ever sees a partial version.
+
+    Raises:
+        ArtifactError: the version already exists
+    """
+    target = version_dir(version, artifacts_dir)
+    if version == LEGACY_VERSION or os.path.exists(target):
+        raise ArtifactError(f"Version {version} already exists")
+    write_checksums(build_dir)
+    os.rename(build_dir, target)
+    return target
+
+
+def merge_version(version: str, artifacts_dir: str = ARTIFACTS_DIR) -> Dict[str, Any]:
+    """
+    Fold a version's segments and tombstones into a new version.
+
+    The merged base is built in a private directory and published with
+    publish_version() while the old store is locked, then the old store is
+    marked superseded so later segments or tombstones fail instead of being
+    lost. If the merged version was active, CURRENT moves to the new one.
+    """
+    source = version_dir(version, artifacts_dir)
+    merged_version = new_version_name()
+    build_dir = new_build_dir(merged_version, artifacts_dir)
+    try:
+        with segments.store_lock(source):
+            segments.check_not_superseded(source)
+            stats = segments.merge(source, build_dir)
+            publish_version(build_dir, merged_version, artifacts_dir)
+            segments.mark_superseded(source, merged_version)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    if current_version(artifacts_dir) == version:
+        set_current_version(merged_version, artifacts_dir)
+    return {**stats, "version": merged_version, "merged_from": version}
+
+
+# ============================================================================
+# HOT-SWAP
+# ============================================================================
+
+def load_version(version: str, artifacts_dir: str = ARTIFACTS_DIR, expected_dim: Optional[int] = None) -> SegmentedIndex:
+    """
+    Load and validate a version: checksums, index/mapping row counts
+    (checked by SegmentedIndex), embedding dimension and a probe search.
+    """
+    directory = version_dir(version, artifacts_dir)
+    if version != LEGACY_VERSION:
+        verify_checksums(directory)
+    store = SegmentedIndex(directory)
+    store.version = version
+    dim = store.base.index.d
+    if expected_dim is not None and dim != expected_dim:
+        raise ArtifactError(f"Version {version} has dimension {dim}, expected {expected_dim}")
+    probe = np.full((1, dim), 1 / np.sqrt(dim), dtype=np.float32)
+    scores, ids = store.search(probe, 1)
+    if store.ntotal > 0 and len(ids) == 0:
+        raise ArtifactError(f"Probe search on version {version} returned no results")
+    return store
+
+
+class ArtifactManager:
+    """
+    Holds the active retrieval store and swaps in new versions.
+
+    Readers take the store with acquire(); a swap replaces the reference
+    under a lock, so each request sees exactly one version from start to
+    finish. Replaced stores are tracked until their last reader releases
+    them, then dropped so their memory can be reclaimed.
+    """
+
+    def __init__(self, artifacts_dir: str = ARTIFACTS_DIR, poll_seconds: float = ARTIFACT_POLL_SECONDS):
+        self.artifacts_dir = artifacts_dir
+        self.poll_seconds = poll_seconds
+        self.version: Optional[str] = None
+        self._store: Optional[SegmentedIndex] = None
+        self._readers: Dict[int, int] = {}
+        self._draining: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._loading: Optional[str] = None
+        self._last_poll = 0.0
+        self.last_swap: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self._failed_version: Optional[str] = None
+
+    def load_current(self) -> "ArtifactManager":
+        """Load the CURRENT version synchronously (first load, before serving)."""
+        version = current_version(self.artifacts_dir)
+        self._swap(version, load_version(version, self.artifacts_dir))
+        self._last_poll = time.time()
+        return self
+
+    @contextmanager
+    def acquire(self):
+        """Yield the active store; it stays valid until the block exits, even across a swap."""
+        self.maybe_reload()
+        with self._lock:
+            store = self._store
+            key = id(store)
+            self._readers[key] = self._readers.get(key, 0) + 1
+        try:
+            yield store
+        finally:
+            self._release(key)
+
+    def _release(self, key: int):
+        with self._lock:
+            self._readers[key] -= 1
+            if self._readers[key] > 0:
+                return
+            del self._readers[key]
+            version = self._draining.pop(key, None)
+        if version is not None:
+            self._released(version)
+
+    def _released(self, version: str):
+        gc.collect()
+        print(f"Released retrieval artifacts {version}")
+
+    def _swap(self, version: str, store: SegmentedIndex):
+        with self._lock:
+            old, old_version = self._store, self.version
+            self._store, self.version = store, version
+            drained = old is not None and id(old) not in self._readers
+            if old is not None and not drained:
+                self._draining[id(old)] = old_version
+        self.last_swap = {"version": version, "previous": old_version, "at": time.time()}
+        if old is not None:
+            print(f"Switched retrieval artifacts {old_version} -> {version}")
+        del old
+        if drained:
+            self._released(old_version)
+
+    def reload(self, version: Optional[str] = None, background: bool = True) -> bool:
+        """
+        Load a version (default: CURRENT) and switch to it once validated.
+
+        Returns False if a load is already in progress or the version is
+        already active (unless its store went stale). Errors keep the old
+        store serving and are kept in last_error.
+        """
+        version = version or current_version(self.artifacts_dir)
+        with self._lock:
+            if self._loading is not None or (version == self.version and not self._store.stale):
+                return False
+            self._loading = version
+            expected_dim = self._store.base.index.d if self._store is not None else None
+
+        def load():
+            start = time.time()
+            try:
+                store = load_version(version, self.artifacts_dir, expected_dim)
+                self._swap(version, store)
+                self.last_error = self._failed_version = None
+                print(f"Loaded retrieval artifacts {version} in {time.time() - start:.1f}s")
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                self._failed_version = version
+                print(f"Error loading retrieval artifacts {version}: {e}")
+            finally:
+                with self._lock:
+                    self._loading = None
+
+        if background:
+            threading.Thread(target=load, name=f"load-artifacts-{version}", daemon=True).start()
+        else:
+            load()
+        return True
+
+    def maybe_reload(self):
+        """
+        Start a background reload if CURRENT changed (checked every
+        poll_seconds), or at once if the active store went stale.
+        """
+        store = self._store
+        if store is not None and store.stale and self.version != self._failed_version:
+            self.reload(self.version)
+            return
+        now = time.time()
+        if now - self._last_poll < self.poll_seconds:
+            return
+        self._last_poll = now
+        version = current_version(self.artifacts_dir)
+        # A version that failed validation is not retried until CURRENT changes
+        if version not in (self.version, self._failed_version):
+            self.reload(version)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            draining = [
+                {"version": version, "readers": self._readers.get(key, 0)}
+                for key, version in self._draining.items()
+            ]
+            store, loading = self._store, self._loading
+        return {
+            "version": self.version,
+            "current": current_version(self.artifacts_dir),
+            "loading": loading,
+            "draining": draining,
+            "last_swap": self.last_swap,
+            "last_error": self.last_error,
+            "store": store.stats() if store is not None else None,
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts-dir", default=ARTIFACTS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show versions and the active one")
+    verify = sub.add_parser("verify", help="Check a version's checksums")
+    verify.add_argument("version")
+    activate = sub.add_parser("activate", help="Point CURRENT at a version")
+    activate.add_argument("version")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print(json.dumps({
+            "current": current_version(args.artifacts_dir),
+            "versions": list_versions(args.artifacts_dir),
+        }, indent=2))
+    elif args.command == "verify":
+        verify_checksums(version_dir(args.version, args.artifacts_dir))
+        print(f"{args.version}: checksums OK")
+    elif args.command == "activate":
+        set_current_version(args.version, args.artifacts_dir)
+        print(f"Activated {args.version}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
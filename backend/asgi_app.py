@@ -0,0 +1,494 @@
+"""
+Async (ASGI) serving path for the WatchSense API.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Serves the same endpoints and payloads as the Flask app in app.py, but
+/api/analyze awaits its LLM calls instead of blocking a worker thread, and
+the CPU-bound stages (encode, FAISS search, pandas work) run on the bounded
+CPU_EXECUTOR. One process can therefore hold hundreds of analyses in flight
+while they wait on Groq.
+"""
+import os
+import time
+import traceback
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, FileResponse
+
+from notebook_code import arun_multi_agent_query, run_multi_agent_query, run_cpu_bound, acompare_brands
+from notebook_code import memory, LLM_CALLS_PER_ANALYSIS, RETRIEVAL_STORE
+from notebook_code import STARTUP_STATS, start_warm_up, get_startup_report
+import telemetry
+import tracing
+import profiling
+from api_common import (
+    UNTRACED_ENDPOINTS,
+    is_admin_request,
+    profile_requested,
+    analysis_key,
+    render_analysis,
+    analysis_etag,
+    revalidate_analysis,
+    ENDPOINTS,
+    register_memory_gauges,
+    build_memory_stats,
+    find_analysis,
+    parse_analysis_lookup,
+    record_coalesced_request,
+    register_job_gauges,
+    register_admission_gauges,
+    run_analysis,
+    submit_job,
+    format_job_status,
+    job_result_response,
+    artifact_status,
+    activate_artifacts,
+    parse_compare_request,
+    render_comparison,
+)
+from singleflight import SingleFlight, AsyncSingleFlight
+from jobs import JobManager
+from response_shaping import parse_shaping_params
+from admission import AdmissionRejected, AsyncAdmissionController, analysis_admission_from_env
+
+# Load environment variable
+load_dotenv()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the pipeline in the background on startup; flush memory on shutdown."""
+    if os.getenv('WATCHSENSE_WARMUP', '1') != '0':
+        start_warm_up(async_workflow=True)
+    # Resume jobs left unfinished by a previous run
+    JOBS.start()
+    yield
+    memory.close()
+
+
+app = FastAPI(title="WatchSense AI Backend", lifespan=lifespan)
+
+# Configure CORS to allow requests from frontend
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type"],
+)
+
+# Scrape-time gauges for the memory store
+register_memory_gauges(memory)
+
+# Coalesces identical in-flight /api/analyze requests by analysis key
+ANALYSIS_FLIGHTS = AsyncSingleFlight()
+
+# Concurrency and queue budgets: pipeline runs ("uncached") and answers
+# from stored analyses ("cached")
+ANALYSIS_ADMISSION = analysis_admission_from_env(AsyncAdmissionController)
+register_admission_gauges(ANALYSIS_ADMISSION)
+
+# Background analysis jobs for /api/jobs. Job workers are threads, so they
+# run the synchronous pipeline and coalesce among themselves.
+JOB_FLIGHTS = SingleFlight()
+JOBS = JobManager(
+    runner=lambda spec: run_analysis(
+        JOB_FLIGHTS, run_multi_agent_query, spec, LLM_CALLS_PER_ANALYSIS
+    ),
+    workers=int(os.getenv('WATCHSENSE_JOB_WORKERS', '2')),
+    max_queued=int(os.getenv('WATCHSENSE_JOB_MAX_QUEUED', '100')),
+)
+register_job_gauges(JOBS)
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Track in-flight requests, record request latency and trace the request"""
+    endpoint = request.url.path
+    start = time.perf_counter()
+    telemetry.INFLIGHT_REQUESTS.inc(endpoint=endpoint)
+    status = 500
+    try:
+        if endpoint in UNTRACED_ENDPOINTS:
+            response = await call_next(request)
+        else:
+            with tracing.span(f"{request.method} {endpoint}", http_method=request.method, route=endpoint) as span:
+                response = await call_next(request)
+                span.set_attribute("http_status", response.status_code)
+                if span.trace_id:
+                    response.headers['X-Trace-Id'] = span.trace_id
+        status = response.status_code
+        return response
+    finally:
+        telemetry.INFLIGHT_REQUESTS.dec(endpoint=endpoint)
+        telemetry.HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@app.post('/api/analyze')
+async def analyze_reviews(request: Request):
+    """Main endpoint for review analysis"""
+    try:
+        data = await _json_body(request)
+
+        query = data.get('query')
+        brand = data.get('brand')
+        min_star = data.get('min_star')
+        max_star = data.get('max_star')
+
+        # Validate query
+        if not query:
+            return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+        # Response shape: ?schema=full|compact and ?fields=a,b.c
+        try:
+            schema, fields = parse_shaping_params(request.query_params)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        print(f"Analyzing query: {query} (brand={brand}, stars={min_star}-{max_star})")
+
+        # The client's copy is still the latest stored analysis for this
+        # request: answer 304 from the cached path, without the pipeline
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tracing.set_attribute("admission_path", "cached")
+            async with ANALYSIS_ADMISSION['cached'].admit():
+                etag = await run_cpu_bound(revalidate_analysis, memory, data, schema, fields, if_none_match)
+            if etag:
+                return Response(status_code=304, headers={'ETag': etag})
+
+        # Over the admission budget, shed the request instead of queueing it
+        tracing.set_attribute("admission_path", "uncached")
+        async with ANALYSIS_ADMISSION['uncached'].admit():
+            # Opt-in (X-Profile: 1 / ?profile=1) or sampled profiling, within the guard's budget.
+            # The event loop serves other requests too, so the profile samples
+            # only this request's work on CPU_EXECUTOR threads.
+            profile_reason = profiling.should_profile(profile_requested(request.headers, request.query_params))
+            with profiling.profile_request(profile_reason, track_current_thread=False, query=query,
+                                           trace_id=tracing.current_span().trace_id) as profile:
+                async def compute():
+                    return await arun_multi_agent_query(
+                        user_query=query,
+                        brand=brand,
+                        min_star=min_star,
+                        max_star=max_star
+                    )
+
+                # Identical requests already in flight share one computation
+                result, shared = await ANALYSIS_FLIGHTS.do(analysis_key(data), compute)
+                record_coalesced_request(shared, LLM_CALLS_PER_ANALYSIS)
+
+            # Formatting, serialization and compression are CPU work
+            body, status_code, headers = await run_cpu_bound(
+                render_analysis, result, schema, fields, request.headers.get('Accept-Encoding'),
+                analysis_etag(data, result.get('analysis_hash'), schema, fields), if_none_match
+            )
+
+        if profile.profile_id:
+            headers['X-Profile-Id'] = profile.profile_id
+        return Response(content=body, status_code=status_code, headers=headers)
+
+    except AdmissionRejected as e:
+        print(f"Shedding analyze request: {e}")
+        return JSONResponse(e.to_response(), status_code=e.status_code,
+                            headers={'Retry-After': str(e.retry_after)})
+
+    except Exception as e:
+        print(f"Error in analyze_reviews: {str(e)}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': str(e),
+            'details': 'An error occurred during analysis. Check server logs for details.'
+        }, status_code=500)
+
+
+@app.post('/api/compare')
+async def compare_reviews(request: Request):
+    """Compare several brands for one query with shared retrieval and one LLM call"""
+    try:
+        spec, error = parse_compare_request(await _json_body(request))
+        if error:
+            return JSONResponse(error, status_code=400)
+
+        print(f"Comparing brands {spec['brands']} for query: {spec['query']}")
+
+        async with ANALYSIS_ADMISSION['uncached'].admit():
+            result = await acompare_brands(spec['query'], spec['brands'], spec['min_star'], spec['max_star'])
+            body, status_code, headers = await run_cpu_bound(
+                render_comparison, result, request.headers.get('Accept-Encoding')
+            )
+        return Response(content=body, status_code=status_code, headers=headers)
+
+    except AdmissionRejected as e:
+        print(f"Shedding compare request: {e}")
+        return JSONResponse(e.to_response(), status_code=e.status_code,
+                            headers={'Retry-After': str(e.retry_after)})
+
+    except Exception as e:
+        print(f"Error in compare_reviews: {str(e)}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': str(e),
+            'details': 'An error occurred during comparison. Check server logs for details.'
+        }, status_code=500)
+
+
+@app.post('/api/jobs')
+async def create_job(request: Request):
+    """Submit an analysis job and return its ID immediately"""
+    try:
+        payload, status_code = submit_job(JOBS, await _json_body(request))
+        return JSONResponse(payload, status_code=status_code)
+    except Exception as e:
+        print(f"Error submitting job: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to submit job',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.get('/api/jobs/{job_id}')
+async def get_job_status(job_id: str):
+    """Get the status of an analysis job"""
+    job = await run_cpu_bound(JOBS.get, job_id)
+    if job is None:
+        return JSONResponse({'error': 'Job not found'}, status_code=404)
+    return format_job_status(job)
+
+
+@app.get('/api/jobs/{job_id}/result')
+async def get_job_result(job_id: str):
+    """Get the result of an analysis job (202 while it is still running)"""
+    try:
+        job = await run_cpu_bound(JOBS.get, job_id)
+        if job is None:
+            return JSONResponse({'error': 'Job not found'}, status_code=404)
+        payload, status_code = job_result_response(job)
+        return JSONResponse(payload, status_code=status_code)
+    except Exception as e:
+        print(f"Error retrieving job result: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to retrieve job result',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.get('/api/admin/profiles')
+async def list_profiles(request: Request):
+    """List stored request profiles, newest first"""
+    if not is_admin_request(request.headers):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    return {
+        'profiles': await run_cpu_bound(profiling.STORE.list),
+        'max_fraction': profiling.GUARD.max_fraction,
+        'sample_rate': profiling.GUARD.sample_rate,
+        'denied': profiling.GUARD.denied
+    }
+
+
+@app.get('/api/admin/profiles/{profile_id}')
+async def download_profile(profile_id: str, request: Request):
+    """Download a profile as folded stacks (flamegraph.pl / speedscope)"""
+    if not is_admin_request(request.headers):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    path = profiling.STORE.path(profile_id)
+    if path is None:
+        return JSONResponse({'error': 'Profile not found'}, status_code=404)
+    return FileResponse(path, media_type='text/plain', filename=f"{profile_id}.folded")
+
+
+@app.get('/api/admin/artifacts')
+async def get_artifacts(request: Request):
+    """List retrieval artifact versions and this worker's swap state"""
+    if not is_admin_request(request.headers):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    return await run_cpu_bound(artifact_status, RETRIEVAL_STORE)
+
+
+@app.post('/api/admin/artifacts/activate')
+async def activate_artifact_version(request: Request):
+    """Verify a version, make it CURRENT and hot-swap to it in the background"""
+    if not is_admin_request(request.headers):
+        return JSONResponse({'error': 'Admin token required'}, status_code=403)
+    try:
+        data = await _json_body(request)
+        # Checksumming the artifacts reads every file; keep it off the event loop
+        payload, status_code = await run_cpu_bound(activate_artifacts, RETRIEVAL_STORE, data)
+        return JSONResponse(payload, status_code=status_code)
+    except Exception as e:
+        print(f"Error activating artifacts: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to activate artifacts',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.get('/api/health')
+async def health_check():
+    """Health check endpoint"""
+    return {
+        'status': 'healthy',
+        'message': 'Backend is running',
+    }
+
+
+@app.get('/api/ready')
+async def readiness_check():
+    """Readiness probe: 200 once the pipeline is compiled and warmed up"""
+    return JSONResponse({
+        'status': 'ready' if STARTUP_STATS['ready'] else 'warming_up',
+        'startup': get_startup_report()
+    }, status_code=200 if STARTUP_STATS['ready'] else 503)
+
+
+@app.get('/api/metrics/latency')
+async def get_latency_percentiles():
+    """Get rolling latency percentiles per pipeline node"""
+    return {
+        'windows': list(memory.latency_sketches.windows.keys()),
+        'nodes': memory.get_latency_percentiles()
+    }
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(telemetry.REGISTRY.render(), media_type=telemetry.CONTENT_TYPE)
+
+
+@app.get('/api/memory/stats')
+async def get_memory_stats():
+    """Get memory and lookup statistics"""
+    try:
+        return build_memory_stats(memory)
+    except Exception as e:
+        print(f"Error getting memory stats: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to get memory stats',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.post('/api/memory/clear')
+async def clear_memory_cache(request: Request):
+    """Clear memory (short-term or all)"""
+    try:
+        data = await _json_body(request)
+
+        if data.get('type', 'short_term') == 'all':
+            memory.clear_memory()
+            message = 'All memory cleared successfully'
+        else:
+            memory.clear_short_term()
+            message = 'Short-term memory cleared successfully'
+
+        return {'status': 'success', 'message': message}
+
+    except Exception as e:
+        print(f"Error clearing memory: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to clear memory',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.post('/api/memory/export')
+async def export_memory():
+    """Export memory to file"""
+    try:
+        export_path = await run_cpu_bound(memory.export_memory)
+
+        if export_path:
+            return {
+                'status': 'success',
+                'message': 'Memory exported successfully',
+                'file_path': export_path
+            }
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Failed to export memory'
+        }, status_code=500)
+
+    except Exception as e:
+        print(f"Error exporting memory: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to export memory',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.post('/api/memory/compact')
+async def compact_memory():
+    """Apply retention policies and roll up old performance metrics"""
+    try:
+        removed = await run_cpu_bound(memory.compact)
+        return {
+            'status': 'success',
+            'message': 'Memory compacted successfully',
+            'removed': removed
+        }
+    except Exception as e:
+        print(f"Error compacting memory: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to compact memory',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.post('/api/memory/analysis')
+async def get_query_analysis(request: Request):
+    """Get complete analysis for a specific query"""
+    try:
+        spec, error = parse_analysis_lookup(await _json_body(request))
+        if error:
+            return JSONResponse(error, status_code=400)
+
+        tracing.set_attribute("admission_path", "cached")
+        async with ANALYSIS_ADMISSION['cached'].admit():
+            # Semantic fallback may embed queries, so keep it off the event loop
+            analysis = await run_cpu_bound(find_analysis, memory, spec)
+
+        if analysis:
+            return analysis
+        return JSONResponse({'error': 'Analysis not found for this query'}, status_code=404)
+
+    except AdmissionRejected as e:
+        print(f"Shedding analysis lookup: {e}")
+        return JSONResponse(e.to_response(), status_code=e.status_code,
+                            headers={'Retry-After': str(e.retry_after)})
+
+    except Exception as e:
+        print(f"Error retrieving analysis: {e}")
+        traceback.print_exc()
+        return JSONResponse({
+            'error': 'Failed to retrieve analysis',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.get('/')
+async def home():
+    """Root endpoint"""
+    return {
+        'message': 'WatchSense AI Backend',
+        'status': 'running',
+        'endpoints': ENDPOINTS
+    }
@@ -0,0 +1,165 @@
+"""
+Brand names: detection at ingest time, and resolution of user input to
+integer brand codes at query time.
+
+detect_brand() tags each review with a canonical brand when the artifacts
+are built. When the retrieval store loads, the detected_brand column is
+stored as integer codes from BRANDS, and free-text brand filters
+("g shock", "casio's", "Seiko watches", "Tisot") are resolved to the same
+codes through the alias table, falling back to fuzzy matching.
+"""
+import re
+import difflib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+# Canonical brand -> lowercase aliases matched as whole words, product title first
+BRAND_ALIASES: Dict[str, List[str]] = {
+    "Casio": ["casio", "g-shock", "g shock", "baby-g"],
+    "Timex": ["timex"],
+    "Seiko": ["seiko"],
+    "Citizen": ["citizen", "eco-drive"],
+    "Fossil": ["fossil"],
+    "Invicta": ["invicta"],
+    "Garmin": ["garmin", "forerunner", "fenix", "vivoactive"],
+    "Apple": ["apple watch", "apple"],
+    "Samsung": ["samsung", "galaxy watch", "gear s"],
+    "Fitbit": ["fitbit"],
+    "Armitron": ["armitron"],
+    "Bulova": ["bulova"],
+    "Michael Kors": ["michael kors"],
+    "Skagen": ["skagen"],
+    "Orient": ["orient"],
+    "Tissot": ["tissot"],
+    "Movado": ["movado"],
+    "Nixon": ["nixon"],
+    "Swatch": ["swatch"],
+    "Guess": ["guess"],
+}
+
+# Aliases that are also ordinary words ("I guess", "a citizen of"); only
+# trusted in product titles, never in review text
+TITLE_ONLY_ALIASES = {"guess", "orient", "citizen", "fossil", "apple"}
+
+UNKNOWN_BRAND = "Unknown"
+
+def _brand_pattern(include_title_only: bool) -> "re.Pattern":
+    aliases = [
+        alias for brand_aliases in BRAND_ALIASES.values() for alias in brand_aliases
+        if include_title_only or alias not in TITLE_ONLY_ALIASES
+    ]
+    # Longest first so "apple watch" wins over "apple"
+    aliases.sort(key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(a) for a in aliases) + r")\b")
+
+
+_TITLE_BRAND_RE = _brand_pattern(include_title_only=True)
+_TEXT_BRAND_RE = _brand_pattern(include_title_only=False)
+_ALIAS_TO_BRAND = {alias: brand for brand, aliases in BRAND_ALIASES.items() for alias in aliases}
+
+
+def detect_brand(title: Optional[str], text: Optional[str]) -> str:
+    """Return the brand named in the product title, else in the review text."""
+    for value, pattern in ((title, _TITLE_BRAND_RE), (text, _TEXT_BRAND_RE)):
+        if isinstance(value, str):
+            match = pattern.search(value.lower())
+            if match:
+                return _ALIAS_TO_BRAND[match.group(1)]
+    return UNKNOWN_BRAND
+
+
+
+# ============================================================================
+# BRAND CODES
+# ============================================================================
+
+# Minimum difflib similarity for a fuzzy match of user input to a brand alias
+FUZZY_CUTOFF = 0.8
+
+# Resolved user inputs remembered before the cache is reset
+RESOLVE_CACHE_SIZE = 10000
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+# Trailing words users add to a brand name ("seiko watches", "casio's")
+_FILLER_RE = re.compile(r"(?:\s+(?:watch|watches|brand))+$|'s$")
+
+
+def normalize_brand(value: str) -> str:
+    value = _FILLER_RE.sub("", value.strip().lower())
+    return _NON_ALNUM_RE.sub(" ", value).strip()
+
+
+class BrandTable:
+    """
+    Canonical brand names <-> small integer codes, shared by every loaded
+    store so codes stay stable across segments and artifact swaps. Brands
+    found in the data but not in BRAND_ALIASES are added on first sight.
+    """
+
+    def __init__(self, canonical: Iterable[str]):
+        self._lock = threading.Lock()
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._aliases: Dict[str, int] = {}
+        self._resolved: Dict[str, Optional[int]] = {}
+        for name in canonical:
+            self.code(name)
+        for brand, aliases in BRAND_ALIASES.items():
+            for alias in aliases:
+                self._aliases.setdefault(normalize_brand(alias), self._codes[brand])
+
+    def code(self, name: str) -> int:
+        """Code of a canonical brand name, registering it if new."""
+        code = self._codes.get(name)
+        if code is not None:
+            return code
+        with self._lock:
+            if name not in self._codes:
+                self._codes[name] = len(self.names)
+                self.names.append(name)
+                self._aliases.setdefault(normalize_brand(name), self._codes[name])
+                self._resolved.clear()
+            return self._codes[name]
+
+    def encode(self, values) -> np.ndarray:
+        """
+        Codes for a column of brand names (missing values -> Unknown).
+
+        Other spellings of a known brand ("casio", "CASIO", "g-shock") get
+        its code through the alias table, as in resolve() but without fuzzy
+        matching; a brand not known under any spelling is registered under
+        its first spelling in the column.
+        """
+        unique = {v: self._value_code(v) for v in dict.fromkeys(values)}
+        return np.fromiter((unique[v] for v in values), dtype=np.int16, count=len(values))
+
+    def _value_code(self, value) -> int:
+        key = normalize_brand(value) if isinstance(value, str) else ""
+        if not key:
+            return self.code(UNKNOWN_BRAND)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._aliases.get(key)
+        return code if code is not None else self.code(value)
+
+    def resolve(self, user_input: Optional[str]) -> Optional[int]:
+        """Code of the brand a user meant, by alias then fuzzy match, or None."""
+        if not user_input:
+            return None
+        key = normalize_brand(user_input)
+        if key in self._resolved:
+            return self._resolved[key]
+        code = self._aliases.get(key)
+        if code is None:
+            close = difflib.get_close_matches(key, list(self._aliases), n=1, cutoff=FUZZY_CUTOFF)
+            code = self._aliases[close[0]] if close else None
+        if len(self._resolved) >= RESOLVE_CACHE_SIZE:
+            self._resolved.clear()
+        self._resolved[key] = code
+        return code
+
+
+BRANDS = BrandTable([UNKNOWN_BRAND, *BRAND_ALIASES])
@@ -0,0 +1,185 @@
+"""
+Near-duplicate review clustering with MinHash and LSH.
+
+    python dedup.py                      # base artifacts in the working directory
+    python dedup.py artifacts/20261019_120000
+
+Marketplace dumps contain many copy-pasted and templated reviews. This
+offline pass reads mapping.csv in chunks, computes a MinHash signature of
+each review's word shingles, and buckets signatures by LSH bands. Reviews
+sharing a bucket whose estimated Jaccard similarity reaches
+SIMILARITY_THRESHOLD are joined into one cluster. The result is written
+next to the mapping as clusters.npy: for each row, the row id of its
+cluster's representative (its lowest row). Signatures are spilled to a
+temporary file beside the mapping and memory-mapped for clustering, so
+only one chunk of them is held in memory at a time.
+
+At query time retrieve_reviews keeps only the best-scoring review of each
+cluster among the results and records the cluster size as its weight
+(see SegmentedIndex.collapse_duplicates). ingest.py and segments.py merge
+run this automatically; clusters only span one base or segment until the
+segments are merged.
+"""
+import os
+import re
+import sys
+import time
+import zlib
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+CLUSTERS_FILE = "clusters.npy"
+# Row-major uint32 MinHash signatures, deleted once clusters.npy is written
+SIGNATURES_FILE = "signatures.bin"
+
+NUM_PERM = 128
+BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 Jaccard usually share a bucket
+SHINGLE_SIZE = 3
+SIMILARITY_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class MinHasher:
+    """MinHash signatures of word shingles under NUM_PERM universal hash functions."""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a*x + b stays below 2**64 for 32-bit x, so uint64 math is exact before the modulo
+        self.a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(text.lower()) if isinstance(text, str) else []
+        n = self.shingle_size
+        grams = [" ".join(tokens[i:i + n]) for i in range(max(1, len(tokens) - n + 1))]
+        return np.array(sorted({zlib.crc32(g.encode("utf-8")) for g in grams}), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = (np.outer(self.a, self.shingles(text)) + self.b[:, None]) % _MERSENNE_PRIME
+        return (hashes & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """Signatures of many texts: one vectorized pass per hash function over all their shingles."""
+        if not texts:
+            return np.empty((0, self.num_perm), np.uint32)
+        shingles = [self.shingles(t) for t in texts]
+        # Every text has at least one shingle, so no reduceat segment is empty
+        offsets = np.cumsum([0] + [len(s) for s in shingles[:-1]])
+        flat = np.concatenate(shingles)
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i in range(self.num_perm):
+            hashes = ((self.a[i] * flat + self.b[i]) % _MERSENNE_PRIME) & _MAX_HASH
+            out[:, i] = np.minimum.reduceat(hashes, offsets)
+        return out
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def cluster_signatures(
+    signatures: np.ndarray,
+    bands: int = BANDS,
+    threshold: float = SIMILARITY_THRESHOLD
+) -> np.ndarray:
+    """
+    Cluster rows whose signatures share an LSH band and agree on at least
+    `threshold` of their hash values. Returns each row's representative
+    (the lowest row id in its cluster).
+    """
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    parent = np.arange(n)
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows_per_band))).ravel()
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        candidates = np.flatnonzero(counts[inverse] > 1)
+        leaders = first[inverse[candidates]]
+        candidates, leaders = candidates[candidates != leaders], leaders[candidates != leaders]
+        if not len(candidates):
+            continue
+        similarity = (signatures[candidates] == signatures[leaders]).mean(axis=1)
+        for row, leader in zip(candidates[similarity >= threshold], leaders[similarity >= threshold]):
+            a, b = _find(parent, int(row)), _find(parent, int(leader))
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    return np.array([_find(parent, i) for i in range(n)], dtype=np.int64)
+
+
+def write_clusters(directory: str, chunk_size: int = 10000) -> Dict[str, float]:
+    """Cluster the reviews in directory/mapping.csv and write clusters.npy."""
+    import pandas as pd
+
+    start = time.time()
+    hasher = MinHasher()
+    spill = os.path.join(directory, f".{SIGNATURES_FILE}.tmp")
+    rows = 0
+    try:
+        with open(spill, "wb") as f:
+            for chunk in pd.read_csv(os.path.join(directory, "mapping.csv"), index_col=0, chunksize=chunk_size):
+                block = hasher.signatures(chunk["review_body"].tolist())
+                f.write(block.tobytes())
+                rows += len(block)
+        if rows:
+            signatures = np.memmap(spill, dtype=np.uint32, mode="r", shape=(rows, NUM_PERM))
+        else:
+            signatures = np.empty((0, NUM_PERM), np.uint32)
+        clusters = cluster_signatures(signatures)
+        del signatures
+    finally:
+        if os.path.exists(spill):
+            os.unlink(spill)
+
+    tmp = os.path.join(directory, f".{CLUSTERS_FILE}.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, clusters)
+    os.replace(tmp, os.path.join(directory, CLUSTERS_FILE))
+
+    duplicates = int((clusters != np.arange(len(clusters))).sum())
+    return {
+        "rows": len(clusters),
+        "clusters": len(np.unique(clusters)),
+        "duplicates": duplicates,
+        "time": round(time.time() - start, 1),
+    }
+
+
+def load_clusters(directory: str, id_start: int, rows: int) -> Optional[np.ndarray]:
+    """Global representative id per row, or None if the directory has no clusters.npy."""
+    path = os.path.join(directory, CLUSTERS_FILE)
+    if not os.path.exists(path):
+        return None
+    clusters = np.load(path)
+    if len(clusters) != rows:
+        print(f"Ignoring {path}: {len(clusters)} rows, mapping has {rows}")
+        return None
+    return clusters + id_start
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=".", help="Directory holding mapping.csv")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    stats = write_clusters(args.directory, args.chunk_size)
+    print(f"{stats['rows']:,} reviews -> {stats['clusters']:,} clusters "
+          f"({stats['duplicates']:,} near-duplicates) in {stats['time']:.1f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Production pre-fork server configuration.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master process imports the app, loads the SentenceTransformer, FAISS
+index and mapping and warms the pipeline once, then forks the workers. The
+workers share those read-only pages copy-on-write instead of each loading
+their own copy. Workers are recycled after a bounded number of requests.
+
+The default is one worker per CPU (WEB_CONCURRENCY overrides it): the
+pipeline is CPU-bound, so workers beyond the core count only add context
+switches (see loadtest_report.md). Workers share long-term memory through
+memory.json: each write holds a file lock and merges in what the other
+workers wrote (see EnhancedMemoryManager), and jobs live in jobs/. The
+/metrics counters, latency percentiles, request coalescing and admission
+budgets are per worker, so a scrape sees one worker and the admission
+limits apply to each worker separately.
+"""
+import gc
+import os
+import multiprocessing
+
+# Configure native thread pools before torch/faiss are imported by the app.
+# One thread per process keeps fork() safe (libgomp pools do not survive it)
+# and leaves parallelism to the worker processes.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Warm up synchronously in the master (see when_ready), not in a thread
+# started at import: threads are not carried across fork().
+os.environ["WATCHSENSE_WARMUP"] = "0"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# A few threads per worker overlap LLM waits; CPU-bound encode work still
+# scales with the number of worker processes
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "4"))
+
+preload_app = True
+
+# Worker recycling bounds slow memory growth (tokenizer caches, fragmentation)
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "100"))
+
+# Analyses make several LLM calls
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def when_ready(server):
+    """Load resources and warm the pipeline in the master, before forking."""
+    import notebook_code
+
+    report = notebook_code.warm_up()
+    if not report["ready"]:
+        server.log.warning(f"Pipeline warm-up failed: {report['error']}")
+
+    # Move everything allocated so far out of the GC's reach so collections
+    # in the workers do not touch (and un-share) the preloaded pages
+    gc.freeze()
+    server.log.info(f"Pipeline warmed up in {report['warmup_time']}s, forking {workers} workers")
+
+
+def post_fork(server, worker):
+    """Restart per-process threads that were lost in fork()."""
+    import notebook_code
+
+    notebook_code.memory.after_fork()
+    try:
+        import faiss
+        faiss.omp_set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def worker_exit(server, worker):
+    """Flush this worker's pending memory writes before it exits."""
+    import notebook_code
+
+    notebook_code.memory.close()
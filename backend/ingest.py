@@ -0,0 +1,291 @@
+"""
+Build the retrieval artifacts (faiss_index.bin, embeddings.npy, mapping.csv)
+from a raw review dump.
+
+    python ingest.py reviews.tsv --workers 4
+    python ingest.py reviews.jsonl --text-col body --rating-col rating
+
+The dump (CSV, TSV or JSON lines, optionally gzipped) is read in chunks
+twice: once to count usable rows, so the embeddings can be preallocated as
+an on-disk .npy memmap, and once to detect brands, encode and write. Only
+one chunk of reviews and one chunk of embeddings are in memory at a time,
+so memory stays bounded however large the dump is; the FAISS index itself
+holds every vector, as it does when the API loads it.
+
+A full build never touches a directory that servers read. It goes into a
+hidden directory under artifacts/, which is renamed to artifacts/VERSION
+with checksums once complete, so a failed or interrupted run leaves no
+half-written version behind (see artifacts.py).
+
+    python ingest.py reviews.tsv --version 20261019_120000 --activate
+
+Without --version the version is named after the current time and
+activated right away; with it, activate later with --activate or
+`python artifacts.py activate VERSION`. Running servers hot-swap to the
+active version.
+
+    python ingest.py new_reviews.tsv --delta
+
+With --delta the reviews are built into a new segment of the active
+version (or --version) instead of a new base, and served alongside it
+without re-encoding the existing corpus (see segments.py). Once more than
+--merge-threshold segments exist they are merged into a new base.
+"""
+import os
+import csv
+import sys
+import shutil
+import time
+import argparse
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import dedup
+import quantize
+import segments
+import artifacts
+from brands import detect_brand
+
+
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+
+MAPPING_COLUMNS = ["review_body", "star_rating", "detected_brand"]
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def read_chunks(path: str, chunk_size: int, columns: List[str]) -> Iterator[pd.DataFrame]:
+    """Stream the dump in chunks of at most chunk_size rows, keeping only `columns`."""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".json")):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunk_size):
+            yield chunk[[c for c in columns if c in chunk.columns]]
+        return
+
+    sep = "\t" if name.endswith((".tsv", ".txt")) else ","
+    yield from pd.read_csv(
+        path,
+        sep=sep,
+        usecols=lambda c: c in columns,
+        chunksize=chunk_size,
+        on_bad_lines="skip",
+        dtype=str,
+        # Amazon TSV dumps contain unbalanced quotes inside review text
+        quoting=csv.QUOTE_NONE if sep == "\t" else csv.QUOTE_MINIMAL,
+    )
+
+
+def _usable_rows(chunk: pd.DataFrame, text_col: str, rating_col: str):
+    """Cleaned text, numeric rating and the mask of rows worth indexing."""
+    text = chunk[text_col].astype(str).str.replace(r"<br\s*/?>", " ", regex=True).str.strip()
+    rating = pd.to_numeric(chunk[rating_col], errors="coerce")
+    keep = chunk[text_col].notna() & text.str.len().gt(0) & rating.between(1, 5)
+    return text, rating, keep
+
+
+def clean_chunk(chunk: pd.DataFrame, text_col: str, rating_col: str, title_col: Optional[str]) -> pd.DataFrame:
+    """Drop unusable rows, detect brands and map the dump's columns to the mapping.csv schema."""
+    text, rating, keep = _usable_rows(chunk, text_col, rating_col)
+    out = pd.DataFrame({
+        "review_body": text[keep],
+        "star_rating": rating[keep].astype(int),
+    })
+    titles = chunk[title_col][keep] if title_col and title_col in chunk.columns else [None] * len(out)
+    out["detected_brand"] = [detect_brand(t, b) for t, b in zip(titles, out["review_body"])]
+    return out
+
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+
+class Encoder:
+    """SentenceTransformer encoder, fanned out over a process pool when workers > 1."""
+
+    def __init__(self, workers: int, batch_size: int):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(EMBED_MODEL_NAME)
+        self.batch_size = batch_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.pool = None
+        if workers > 1:
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.pool is not None:
+            emb = self.model.encode_multi_process(texts, self.pool, batch_size=self.batch_size)
+        else:
+            emb = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        emb = np.asarray(emb, dtype=np.float32)
+        # Inner-product index over unit vectors = cosine similarity, matching retrieve_reviews
+        return emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+class Progress:
+    """Prints rows done, throughput and ETA at most every `interval` seconds."""
+
+    def __init__(self, label: str, total: Optional[int], interval: float = 5.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start = time.time()
+        self._last = 0.0
+
+    def update(self, rows: int, force: bool = False):
+        self.done += rows
+        now = time.time()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.done / elapsed
+        line = f"[{self.label}] {self.done:,}"
+        if self.total:
+            eta = (self.total - self.done) / rate if rate else 0
+            line += f"/{self.total:,} ({100 * self.done / self.total:.1f}%), ETA {eta:.0f}s"
+        print(f"{line}, {rate:,.0f} rows/s", flush=True)
+
+
+def count_rows(args) -> int:
+    """First pass: count the rows that survive cleaning, without encoding."""
+    progress = Progress("count", None)
+    total = 0
+    for chunk in read_chunks(args.input, args.chunk_size, args.columns):
+        rows = int(_usable_rows(chunk, args.text_col, args.rating_col)[2].sum())
+        total += rows
+        progress.update(rows)
+    progress.update(0, force=True)
+    return total
+
+
+def build(args) -> Dict[str, float]:
+    """Encode the dump into args.output_dir, a fresh directory no server reads yet."""
+    import faiss
+
+    start = time.time()
+    total = count_rows(args)
+    if total == 0:
+        raise SystemExit("No usable reviews found in the input")
+    print(f"{total:,} usable reviews; encoding with {args.workers} worker(s)")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = {name: os.path.join(args.output_dir, name) for name in segments.BASE_FILES}
+
+    encoder = Encoder(args.workers, args.batch_size)
+    try:
+        embeddings = np.lib.format.open_memmap(
+            paths["embeddings.npy"], mode="w+", dtype=np.float32, shape=(total, encoder.dim)
+        )
+
+        progress = Progress("encode", total)
+        row = 0
+        with open(paths["mapping.csv"], "w", newline="") as mapping_file:
+            for chunk in read_chunks(args.input, args.chunk_size, args.columns):
+                clean = clean_chunk(chunk, args.text_col, args.rating_col, args.title_col)
+                if clean.empty:
+                    continue
+                if row + len(clean) > total:
+                    raise RuntimeError("Input changed between passes; re-run ingestion")
+
+                embeddings[row:row + len(clean)] = encoder.encode(clean["review_body"].tolist())
+                # Global row ids keep mapping.csv aligned with FAISS ids
+                clean.index = pd.RangeIndex(row, row + len(clean))
+                clean[MAPPING_COLUMNS].to_csv(mapping_file, header=row == 0)
+                row += len(clean)
+                progress.update(len(clean))
+        progress.update(0, force=True)
+
+        if row != total:
+            raise RuntimeError(f"Expected {total} rows, encoded {row}; re-run ingestion")
+        embeddings.flush()
+        encode_time = time.time() - start
+
+        # Add to the index block by block, reading back from the memmap
+        index = faiss.IndexFlatIP(encoder.dim)
+        for block_start in range(0, total, args.chunk_size):
+            index.add(np.ascontiguousarray(embeddings[block_start:block_start + args.chunk_size]))
+        faiss.write_index(index, paths["faiss_index.bin"])
+        del embeddings
+    finally:
+        encoder.close()
+
+    elapsed = time.time() - start
+    return {"rows": total, "encode_time": encode_time, "total_time": elapsed, "rows_per_sec": total / elapsed}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Review dump (.csv, .tsv or .jsonl, optionally .gz)")
+    parser.add_argument("--artifacts-dir", default=artifacts.ARTIFACTS_DIR)
+    parser.add_argument("--text-col", default="review_body")
+    parser.add_argument("--rating-col", default="star_rating")
+    parser.add_argument("--title-col", default="product_title", help="Used first for brand detection")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--delta", action="store_true", help="Add the reviews as a segment instead of rebuilding the base")
+    parser.add_argument("--merge-threshold", type=int, default=segments.MERGE_THRESHOLD)
+    parser.add_argument("--compact", choices=quantize.EMBEDDING_DTYPES, default=quantize.EMBEDDING_DTYPE,
+                        help="Also write float16/int8 index and vectors (see quantize.py)")
+    parser.add_argument("--version", help="Name of the new version (default: the current time, activated at once); "
+                                           "with --delta, the version to add to (default: the active one)")
+    parser.add_argument("--activate", action="store_true", help="Make the built --version the one servers load")
+    args = parser.parse_args(argv)
+    args.columns = [c for c in (args.text_col, args.rating_col, args.title_col) if c]
+
+    if not args.delta:
+        version = args.version or artifacts.new_version_name()
+        args.output_dir = artifacts.new_build_dir(version, args.artifacts_dir)
+        try:
+            stats = build(args)
+            print(f"Near-duplicate clusters: {dedup.write_clusters(args.output_dir, args.chunk_size)}")
+            if args.compact != "float32":
+                quantize.write_compact(args.output_dir, args.compact)
+            segments.start_generation(args.output_dir, stats["rows"])
+            target = artifacts.publish_version(args.output_dir, version, args.artifacts_dir)
+        except BaseException:
+            shutil.rmtree(args.output_dir, ignore_errors=True)
+            raise
+        print(f"Built {stats['rows']:,} reviews in {stats['total_time']:.1f}s "
+              f"({stats['rows_per_sec']:,.0f} rows/s) -> {os.path.abspath(target)}")
+        if args.activate or not args.version:
+            artifacts.set_current_version(version, args.artifacts_dir)
+            print(f"Activated artifact version {version}")
+        return
+
+    version = args.version or artifacts.current_version(args.artifacts_dir)
+    base_dir = artifacts.version_dir(version, args.artifacts_dir)
+    args.output_dir = segments.new_segment_dir(base_dir)
+    try:
+        stats = build(args)
+        print(f"Near-duplicate clusters: {dedup.write_clusters(args.output_dir, args.chunk_size)}")
+        if args.compact != "float32":
+            quantize.write_compact(args.output_dir, args.compact)
+        segment = segments.publish_segment(base_dir, args.output_dir, stats["rows"])
+    except BaseException:
+        shutil.rmtree(args.output_dir, ignore_errors=True)
+        raise
+    print(f"Built segment of {stats['rows']:,} reviews in {stats['total_time']:.1f}s -> {segment}")
+
+    if len(segments.list_segments(base_dir)) > args.merge_threshold:
+        print(f"More than {args.merge_threshold} segments; merging into a new version")
+        print(artifacts.merge_version(version, args.artifacts_dir))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from typing import Callable, Dict, Any, Optional, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: recovery runs without the cross-process lock
+    fcntl = None
+
+from persistence import atomic_write_text
+
+
+# Lower runs first; interactive jobs overtake queued batch jobs
+JOB_PRIORITIES = {"interactive": 0, "batch": 1}
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+
+# Finished jobs (and their results) are deleted after this long
+JOB_RETENTION_SECONDS = 24 * 3600
+
+# Minimum seconds between sweeps for expired jobs
+JOB_PRUNE_INTERVAL_SECONDS = 600
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when the queue already holds max_queued jobs."""
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobManager:
+    """
+    Background analysis jobs with a bounded worker pool and priority queue.
+
+    Each job is stored as its own JSON file in jobs_dir, written atomically
+    on every state change, so any process serving the API (e.g. another
+    gunicorn worker) can answer polls for it and results survive a restart.
+    Jobs left queued or running by a process that is no longer alive are
+    picked up again by the next manager that starts.
+
+    Worker threads start on the first call to start(), submit() or get(),
+    and again after fork() in a child process.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Dict[str, Any]], Dict[str, Any]],
+        jobs_dir: str = "jobs",
+        workers: int = 2,
+        max_queued: int = 100,
+        retention_seconds: float = JOB_RETENTION_SECONDS,
+    ):
+        self.runner = runner
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = 0
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._last_prune = 0.0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads and resume orphaned jobs (idempotent)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked child: the parent's threads and queue did not come along
+                self._queue = queue.PriorityQueue()
+                self._jobs = {}
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            self._threads = [
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+        resumed = self._recover()
+        if resumed:
+            print(f"Resumed {resumed} unfinished job(s) from {self.jobs_dir}")
+        self.prune()
+
+    def _recover(self) -> int:
+        """Re-queue jobs whose owning process died before finishing them."""
+        lock_file = None
+        if fcntl is not None:
+            lock_file = open(os.path.join(self.jobs_dir, ".recover.lock"), "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            resumed = 0
+            for job in self._iter_stored_jobs():
+                if job["status"] not in ("queued", "running"):
+                    continue
+                if job.get("owner_pid") == os.getpid() or _pid_alive(job.get("owner_pid")):
+                    continue
+                job["status"] = "queued"
+                job["started_at"] = None
+                job["resumed"] = job.get("resumed", 0) + 1
+                self._enqueue(job)
+                resumed += 1
+            return resumed
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def submit(self, spec: Dict[str, Any], priority: str = "interactive") -> Dict[str, Any]:
+        """
+        Queue a job and return its state immediately.
+
+        Raises:
+            ValueError: unknown priority
+            JobQueueFull: max_queued jobs are already waiting
+        """
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"priority must be one of {list(JOB_PRIORITIES)}, got '{priority}'")
+        self.start()
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFull(f"{self._queue.qsize()} jobs already queued")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": priority,
+            "spec": spec,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self._enqueue(job)
+
+        if time.time() - self._last_prune > JOB_PRUNE_INTERVAL_SECONDS:
+            self.prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's state, including its result once completed."""
+        self.start()
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # Submitted by another process, or before a restart
+        try:
+            with open(self._job_path(job_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Number of queued jobs per priority in this process."""
+        depth = {priority: 0 for priority in JOB_PRIORITIES}
+        for job in list(self._jobs.values()):
+            if job["status"] == "queued":
+                depth[job["priority"]] += 1
+        return depth
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in list(self._jobs.values()):
+            counts[job["status"]] += 1
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued_by_priority": self.queue_depth(),
+            "jobs_by_status": counts,
+        }
+
+    def prune(self) -> int:
+        """Delete finished jobs older than the retention period."""
+        self._last_prune = time.time()
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for job in self._iter_stored_jobs():
+            if job["status"] in ("completed", "failed") and (job.get("finished_at") or 0) < cutoff:
+                try:
+                    os.unlink(self._job_path(job["job_id"]))
+                except OSError:
+                    continue
+                self._jobs.pop(job["job_id"], None)
+                removed += 1
+        return removed
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _job_path(self, job_id: str) -> str:
+        # Job IDs come from URLs; only accept the hex IDs submit() creates
+        if not job_id.isalnum():
+            raise ValueError(f"Invalid job id: {job_id}")
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _iter_stored_jobs(self):
+        if not os.path.isdir(self.jobs_dir):
+            return
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r") as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def _persist(self, job: Dict[str, Any]):
+        atomic_write_text(self._job_path(job["job_id"]), json.dumps(job, default=str), fsync=False)
+
+    def _enqueue(self, job: Dict[str, Any]):
+        job["owner_pid"] = os.getpid()
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._seq += 1
+            seq = self._seq
+        self._persist(job)
+        self._queue.put((JOB_PRIORITIES[job["priority"]], seq, job["job_id"]))
+
+    def _work(self):
+        """Worker loop: run the highest-priority queued job."""
+        while True:
+            _, _, job_id = self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self._persist(job)
+            try:
+                job["result"] = self.runner(job["spec"])
+                job["status"] = "completed"
+            except Exception as e:
+                print(f"Error in job {job_id}: {e}")
+                job["error"] = str(e)
+                job["status"] = "failed"
+            job["finished_at"] = time.time()
+            try:
+                self._persist(job)
+            except Exception as e:
+                print(f"Error saving job {job_id}: {e}")
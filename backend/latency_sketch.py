@@ -0,0 +1,172 @@
+import math
+import time
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+
+# Rolling windows: name -> (window length in seconds, number of ring slices).
+# Each slice covers window/slices seconds, so a window expires gradually
+# instead of resetting all at once.
+DEFAULT_WINDOWS = {
+    "1m": (60, 6),
+    "1h": (3600, 12),
+    "24h": (86400, 24),
+}
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LogHistogram:
+    """
+    Log-bucketed latency histogram with bounded relative error.
+
+    Values are mapped to buckets whose boundaries grow geometrically, so any
+    quantile is reported within `relative_accuracy` of the true value. The
+    number of buckets depends only on the [min_value, max_value] range,
+    never on how many values were recorded.
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = 0.02,
+        min_value: float = 1e-4,
+        max_value: float = 1e4,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+
+    def _bucket(self, value: float) -> int:
+        value = min(max(value, self.min_value), self.max_value)
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _bucket_value(self, bucket: int) -> float:
+        # Midpoint (in relative terms) of the bucket's (gamma^(i-1), gamma^i] range
+        return 2 * self._gamma ** bucket / (self._gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        """Record a value (in seconds)."""
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other: "LogHistogram"):
+        """Add another histogram's counts into this one."""
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0 <= q <= 1), or None if empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return self._bucket_value(bucket)
+        return self._bucket_value(max(self.buckets))
+
+    def clear(self):
+        self.buckets.clear()
+        self.count = 0
+        self.total = 0.0
+
+
+class WindowedHistogram:
+    """Ring of LogHistogram slices covering a rolling time window."""
+
+    def __init__(self, window_seconds: float, num_slices: int, **histogram_kwargs):
+        self.window_seconds = window_seconds
+        self.num_slices = num_slices
+        self.slice_seconds = window_seconds / num_slices
+        self._histogram_kwargs = histogram_kwargs
+        self._slice_ids = [None] * num_slices
+        self._slices = [LogHistogram(**histogram_kwargs) for _ in range(num_slices)]
+
+    def add(self, value: float, timestamp: float):
+        slice_id = int(timestamp // self.slice_seconds)
+        pos = slice_id % self.num_slices
+        if self._slice_ids[pos] != slice_id:
+            if self._slice_ids[pos] is not None and self._slice_ids[pos] > slice_id:
+                # Older than anything the ring still covers
+                return
+            self._slices[pos].clear()
+            self._slice_ids[pos] = slice_id
+        self._slices[pos].add(value)
+
+    def snapshot(self, now: float) -> LogHistogram:
+        """Merge the slices still inside the window ending at `now`."""
+        current = int(now // self.slice_seconds)
+        merged = LogHistogram(**self._histogram_kwargs)
+        for slice_id, hist in zip(self._slice_ids, self._slices):
+            if slice_id is not None and current - self.num_slices < slice_id <= current:
+                merged.merge(hist)
+        return merged
+
+
+class LatencySketches:
+    """
+    Per-node rolling latency sketches for several time windows.
+
+    Memory is bounded by (nodes x windows x slices x buckets), independent
+    of the number of recorded queries.
+    """
+
+    def __init__(self, windows: Optional[Dict[str, Any]] = None, **histogram_kwargs):
+        self.windows = windows or DEFAULT_WINDOWS
+        self._histogram_kwargs = histogram_kwargs
+        self._sketches: Dict[str, Dict[str, WindowedHistogram]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, node: str, seconds: float, timestamp: Optional[float] = None):
+        """Record one latency observation for a node."""
+        if seconds is None or seconds < 0:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            node_sketches = self._sketches.get(node)
+            if node_sketches is None:
+                node_sketches = {
+                    name: WindowedHistogram(length, slices, **self._histogram_kwargs)
+                    for name, (length, slices) in self.windows.items()
+                }
+                self._sketches[node] = node_sketches
+            for sketch in node_sketches.values():
+                sketch.add(seconds, timestamp)
+
+    def summary(
+        self,
+        quantiles: Iterable[float] = DEFAULT_QUANTILES,
+        now: Optional[float] = None
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get quantiles per node and window.
+
+        Returns:
+            {node: {window: {"count", "mean", "p50", "p90", "p99"}}}
+        """
+        now = time.time() if now is None else now
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self._lock:
+            for node, node_sketches in self._sketches.items():
+                result[node] = {}
+                for name, sketch in node_sketches.items():
+                    hist = sketch.snapshot(now)
+                    stats: Dict[str, Any] = {
+                        "count": hist.count,
+                        "mean": round(hist.total / hist.count, 4) if hist.count else None,
+                    }
+                    for q in quantiles:
+                        value = hist.quantile(q)
+                        stats[f"p{q * 100:g}"] = round(value, 4) if value is not None else None
+                    result[node][name] = stats
+        return result
@@ -0,0 +1,173 @@
+"""
+Load test for the pre-fork server: requests/sec versus worker count.
+
+Starts gunicorn (gunicorn.conf.py) once per worker count with stubbed LLM
+calls, so the measurement covers the CPU-bound part of /api/analyze
+(encode, FAISS search, pandas work, memory updates) rather than Groq
+latency. Every request uses a distinct query so none of them coalesce.
+Writes a markdown report.
+
+    python loadtest.py --workers 1 2 4 8 --concurrency 32 --duration 30
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import platform
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime
+
+import requests
+
+
+QUERY_TEMPLATES = [
+    "how is the battery life of this watch {n}",
+    "problems with the strap breaking {n}",
+    "is the display easy to read in sunlight {n}",
+    "what do people like about the design {n}",
+    "is it water resistant enough for swimming {n}",
+]
+
+
+def wait_until_ready(base_url: str, timeout: float) -> bool:
+    """Poll /api/ready until the server reports ready."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_load(base_url: str, concurrency: int, duration: float) -> dict:
+    """Send analyze requests from `concurrency` threads for `duration` seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = [0]
+    stop_at = time.time() + duration
+
+    def client():
+        session = requests.Session()
+        while time.time() < stop_at:
+            with lock:
+                counter[0] += 1
+                n = counter[0]
+            query = QUERY_TEMPLATES[n % len(QUERY_TEMPLATES)].format(n=n)
+            start = time.perf_counter()
+            try:
+                resp = session.post(f"{base_url}/api/analyze", json={"query": query}, timeout=60)
+                ok = resp.status_code in (200, 404)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50": pct(0.5),
+        "p99": pct(0.99),
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(port),
+        "WATCHSENSE_STUB_LLM": "1",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", default="loadtest_report.md")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    rows = []
+
+    for workers in args.workers:
+        print(f"Starting server with {workers} worker(s)...")
+        proc = start_server(workers, args.port)
+        try:
+            if not wait_until_ready(base_url, args.startup_timeout):
+                print(f"Server with {workers} worker(s) did not become ready, skipping")
+                continue
+            # Let every worker finish booting before measuring
+            time.sleep(2)
+            result = run_load(base_url, args.concurrency, args.duration)
+            result["workers"] = workers
+            rows.append(result)
+            print(f"  {result['rps']:.1f} req/s, p50 {result['p50'] * 1000:.0f}ms, "
+                  f"p99 {result['p99'] * 1000:.0f}ms, errors {result['errors']}")
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=60)
+
+    if not rows:
+        print("No results collected")
+        return
+
+    base_rps = rows[0]["rps"] or 1.0
+    lines = [
+        "# Pre-fork load test report",
+        "",
+        f"- Date: {datetime.now():%Y-%m-%d %H:%M}",
+        f"- Host: {platform.node()} ({platform.processor() or platform.machine()}), "
+        f"{multiprocessing.cpu_count()} CPUs",
+        f"- Endpoint: POST /api/analyze with stubbed LLM, unique queries (no coalescing)",
+        f"- Concurrency: {args.concurrency} clients, {args.duration:.0f}s per run",
+        "",
+        "| Workers | Requests | Errors | Req/s | Speedup | p50 (ms) | p99 (ms) |",
+        "|--------:|---------:|-------:|------:|--------:|---------:|---------:|",
+    ]
+    for r in rows:
+        lines.append(
+            f"| {r['workers']} | {r['requests']} | {r['errors']} | {r['rps']:.1f} | "
+            f"{r['rps'] / base_rps:.2f}x | {r['p50'] * 1000:.0f} | {r['p99'] * 1000:.0f} |"
+        )
+
+    with open(args.output, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
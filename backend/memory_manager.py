@@ -1,7 +1,79 @@
 import os
 import json
-from datetime import datetime
-from typing import Dict, Any
+import time
+import atexit
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+import numpy as np
+
+from persistence import BackgroundWriter, atomic_write_text, file_lock, fsync_file
+from latency_sketch import LatencySketches
+import tracing
+
+
+# Retention per long-term list: entries beyond max_count (oldest first) or
+# older than max_age_days are dropped during compaction. None disables a rule.
+# Age limits are opt-in (pass retention_policies), so a restart never prunes
+# history just because it is old; by default only the counts are bounded.
+DEFAULT_RETENTION_POLICIES = {
+    "query_history": {"max_count": 5000, "max_age_days": None},
+    "summary_history": {"max_count": 1000, "max_age_days": None},
+    "complete_analyses": {"max_count": 500, "max_age_days": None},
+    "performance_metrics": {"max_count": 2000, "max_age_days": None},
+    "performance_rollups": {"max_count": 24 * 365, "max_age_days": None},
+}
+
+# Raw performance metrics older than this are folded into hourly rollups
+PERFORMANCE_ROLLUP_AFTER_HOURS = 24
+
+# Minimum seconds between automatic compactions triggered by save_long_term
+COMPACTION_INTERVAL_SECONDS = 3600
+
+# Latency fields in performance metrics -> LangGraph node they time
+LATENCY_METRIC_NODES = {
+    "feature_extraction_time": "extract_features",
+    "retrieval_time": "retrieve",
+    "feature_analysis_time": "feature_analysis",
+    "summary_time": "summarize",
+    "faithfulness_time": "faithfulness",
+    "advisor_time": "advisor",
+    "evaluation_time": "evaluate_memory",
+    "total_latency": "total",
+}
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse a stored str(datetime) timestamp, returning None if invalid."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query for exact lookups (case and whitespace insensitive)."""
+    return " ".join(str(query or "").lower().split())
+
+
+def _analysis_content_hash(analysis_data: Dict[str, Any]) -> str:
+    """Hash the content of an analysis, ignoring volatile timing fields."""
+    content = {
+        k: v for k, v in analysis_data.items()
+        if k not in ("timestamp", "latency", "content_hash")
+    }
+    payload = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_key(entry: Any) -> str:
+    """Identity of a long-term list entry when merging with another process's writes."""
+    payload = json.dumps(entry, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
 
 class EnhancedMemoryManager:
@@ -10,10 +82,53 @@ class EnhancedMemoryManager:
     
     Short-term memory: Holds current conversation context (query, summaries, etc.)
     Long-term memory: Persists to JSON file for historical tracking
+    
+    Several processes (pre-fork workers) can share one memory file: every
+    write holds a file lock and first merges in what the others wrote since
+    this process last read or wrote the file, and lookups pick up their
+    changes with refresh().
     """
     
-    def __init__(self, file_path: str = "memory.json"):
+    def __init__(
+        self,
+        file_path: str = "memory.json",
+        retention_policies: Optional[Dict[str, Dict[str, Any]]] = None,
+        rollup_after_hours: float = PERFORMANCE_ROLLUP_AFTER_HOURS,
+        compaction_interval: float = COMPACTION_INTERVAL_SECONDS,
+        background_writes: bool = True,
+        flush_interval: float = 2.0,
+        flush_threshold: int = 20,
+        fsync_policy: str = "always",
+    ):
         self.file_path = file_path
+        self.fsync_policy = fsync_policy
+        # Guards long_term against concurrent mutation while it is serialized
+        self._lock = threading.RLock()
+        self.retention_policies = {
+            **DEFAULT_RETENTION_POLICIES,
+            **(retention_policies or {}),
+        }
+        self.rollup_after_hours = rollup_after_hours
+        self.compaction_interval = compaction_interval
+        # Loading never compacts; the first automatic compaction is due one
+        # interval after start (or run compact() / POST /api/memory/compact)
+        self._last_compaction = time.time()
+        # In-process counters of stored-analysis lookups (record_lookup)
+        self.cache_stats = {"hits": 0, "misses": 0}
+        
+        # normalized query -> latest analysis, kept in sync with complete_analyses
+        self._analysis_index: Dict[str, Dict[str, Any]] = {}
+        # Optional semantic lookup: embed_fn(list_of_texts) -> 2D array
+        self._query_embedder: Optional[Callable[[List[str]], Any]] = None
+        # (normalized queries, their embedding rows): replaced as a whole,
+        # never mutated, so lookups can read it without the lock
+        self._semantic_index: Tuple[List[str], Optional[np.ndarray]] = ([], None)
+        # Queries still to embed, and a counter bumped whenever the semantic
+        # index is dropped (both guarded by _lock)
+        self._pending_semantic_keys: List[str] = []
+        self._semantic_generation = 0
+        # Rolling per-node latency quantiles (in memory, seeded from history)
+        self.latency_sketches = LatencySketches()
         self.short_term = {
             "last_query": None,
             "retrieved_ids": [],
@@ -23,8 +138,21 @@ class EnhancedMemoryManager:
             "latency_metrics": None,
             "intent": None,  # Added intent tracking
         }
+        # Entry keys of each long-term list as of the last read or write of
+        # the file, and that file version (see _merge_from_disk). The version
+        # is kept open so its inode cannot be reused by a later write.
+        self._synced_keys: Dict[str, set] = {}
+        self._written_keys: Dict[str, set] = {}
+        self._synced_file = None
+        self._disk_signature: Optional[Tuple[int, int]] = None
         self.long_term = self._load_long_term()
         self._ensure_keys()
+        self._writer: Optional[BackgroundWriter] = None
+        if background_writes:
+            self._writer = self._make_writer(flush_interval, flush_threshold, fsync_policy)
+            atexit.register(self.close)
+        self._rebuild_analysis_index()
+        self._seed_latency_sketches()
 
     def _get_default_structure(self) -> Dict[str, Any]:
         """Get default memory structure."""
@@ -36,7 +164,9 @@ class EnhancedMemoryManager:
             "rejected_suggestions": [],
             "summary_history": [],
             "suggestion_ratings": [],
-            "performance_metrics": []
+            "performance_metrics": [],
+            "performance_rollups": [],
+            "complete_analyses": []
         }
 
     def _load_long_term(self) -> Dict[str, Any]:
@@ -44,13 +174,142 @@ class EnhancedMemoryManager:
         if not os.path.exists(self.file_path):
             return self._get_default_structure()
         try:
-            with open(self.file_path, "r") as f:
-                data = json.load(f)
+            f, data = self._read_version()
+            self._synced_keys = self._list_entry_keys(data)
+            self._pin_version(f)
             return data
         except Exception as e:
             print(f"Error loading memory file: {e}")
             return self._get_default_structure()
 
+    def _make_writer(self, flush_interval: float, flush_threshold: int, fsync_policy: str) -> BackgroundWriter:
+        return BackgroundWriter(
+            self.file_path,
+            self._sync_snapshot,
+            flush_interval=flush_interval,
+            flush_threshold=flush_threshold,
+            fsync_policy=fsync_policy,
+            lock=True,
+            on_written=self._mark_written,
+        )
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        """Identify the file version on disk; every atomic write gets a new inode."""
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def _read_version(self):
+        """Open and parse the file; returns (open file, data)."""
+        f = open(self.file_path, "r")
+        try:
+            return f, json.load(f)
+        except BaseException:
+            f.close()
+            raise
+
+    def _pin_version(self, f):
+        """Make the open file f the synced version, closing the previous one."""
+        st = os.fstat(f.fileno())
+        if self._synced_file is not None:
+            self._synced_file.close()
+        self._synced_file = f
+        self._disk_signature = (st.st_dev, st.st_ino)
+
+    @staticmethod
+    def _list_entry_keys(data: Dict[str, Any]) -> Dict[str, set]:
+        return {
+            key: {_entry_key(entry) for entry in entries}
+            for key, entries in data.items() if isinstance(entries, list)
+        }
+
+    def _merge_from_disk(self) -> bool:
+        """
+        Merge changes other processes wrote to the file into long_term.
+        
+        Relative to the version this process last read or wrote, entries it
+        has added since are kept, entries it has removed (compaction,
+        clear_memory) stay removed, and everything else comes from the file,
+        including other processes' additions and removals. Call with _lock
+        held. Returns True if the file had changed.
+        """
+        signature = self._file_signature()
+        if signature is None or signature == self._disk_signature:
+            return False
+        try:
+            f, disk = self._read_version()
+        except Exception as e:
+            print(f"Error loading memory file: {e}")
+            return False
+        
+        for key, disk_entries in disk.items():
+            local = self.long_term.get(key)
+            if not isinstance(disk_entries, list) or not isinstance(local, list):
+                self.long_term.setdefault(key, disk_entries)
+                continue
+            synced = self._synced_keys.get(key, set())
+            local_keys = [_entry_key(entry) for entry in local]
+            removed_here = synced.difference(local_keys)
+            merged, seen = [], set()
+            for entry in disk_entries:
+                entry_key = _entry_key(entry)
+                if entry_key not in removed_here and entry_key not in seen:
+                    merged.append(entry)
+                    seen.add(entry_key)
+            for entry, entry_key in zip(local, local_keys):
+                # Synced entries missing from the file were removed elsewhere
+                if entry_key not in synced and entry_key not in seen:
+                    merged.append(entry)
+                    seen.add(entry_key)
+            self.long_term[key] = merged
+        
+        # Two processes may have saved the same analysis; keep the newest copy
+        analyses = self.long_term.get("complete_analyses", [])
+        newest = {a.get("content_hash"): i for i, a in enumerate(analyses)}
+        self.long_term["complete_analyses"] = [
+            a for i, a in enumerate(analyses)
+            if a.get("content_hash") is None or newest[a.get("content_hash")] == i
+        ]
+        
+        self._synced_keys = self._list_entry_keys(disk)
+        self._pin_version(f)
+        self._rebuild_analysis_index()
+        return True
+
+    def _sync_snapshot(self) -> str:
+        """
+        Merge in other processes' changes, compact if due and serialize.
+        
+        Runs with file_lock held, so nothing can write the file between the
+        merge and the write; _mark_written then records the written version.
+        Only the merge and a shallow copy of the lists hold _lock: entries
+        are never changed once appended, so hashing and serializing the copy
+        happen without blocking request threads.
+        """
+        with self._lock:
+            self._merge_from_disk()
+            if time.time() - self._last_compaction >= self.compaction_interval:
+                self.compact(save=False)
+            snapshot = {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in self.long_term.items()
+            }
+        self._written_keys = self._list_entry_keys(snapshot)
+        return json.dumps(snapshot, indent=2)
+
+    def _mark_written(self):
+        """Record the version just written as the merge base."""
+        with self._lock:
+            self._synced_keys = self._written_keys
+            self._pin_version(open(self.file_path, "r"))
+
+    def refresh(self):
+        """Pick up changes other processes have written to the memory file."""
+        with self._lock:
+            self._merge_from_disk()
+
     def _ensure_keys(self):
         """Ensure all required keys exist in long_term memory."""
         default_structure = self._get_default_structure()
@@ -60,55 +319,218 @@ class EnhancedMemoryManager:
                 print(f"Added missing key '{key}' to memory")
 
     def save_long_term(self):
-        """Save long-term memory to file."""
+        """
+        Save long-term memory to file.
+        
+        With background writes enabled this only marks memory dirty; the
+        writer thread coalesces changes and writes memory.json atomically.
+        Either way the write merges in other processes' changes first and
+        runs any due compaction (_sync_snapshot).
+        """
+        with tracing.span("memory.save", background=self._writer is not None):
+            if self._writer is not None:
+                self._writer.mark_dirty()
+                return
+            try:
+                # Callers must not hold _lock: _sync_snapshot takes it after file_lock
+                with file_lock(self.file_path):
+                    atomic_write_text(
+                        self.file_path,
+                        self._sync_snapshot(),
+                        fsync=self.fsync_policy == "always"
+                    )
+                    self._mark_written()
+            except Exception as e:
+                print(f"Error saving memory file: {e}")
+
+    def flush(self):
+        """Write any pending long-term memory changes to disk immediately."""
+        if self._writer is None:
+            self.save_long_term()
+            return
         try:
-            with open(self.file_path, "w") as f:
-                json.dump(self.long_term, f, indent=2)
+            self._writer.flush()
         except Exception as e:
             print(f"Error saving memory file: {e}")
+
+    def close(self):
+        """Flush pending changes and stop the background writer."""
+        try:
+            if self._writer is not None:
+                self._writer.close()
+            elif self.fsync_policy == "close" and os.path.exists(self.file_path):
+                # Synchronous saves skipped fsync under this policy
+                with file_lock(self.file_path):
+                    fsync_file(self.file_path)
+        except Exception as e:
+            print(f"Error saving memory file: {e}")
+
+    def after_fork(self):
+        """
+        Re-create locks and the writer thread in a forked worker process.
+        
+        Threads do not survive fork(), so a manager created in a pre-fork
+        master must call this in each worker before use.
+        """
+        self._lock = threading.RLock()
+        if self._writer is not None:
+            old = self._writer
+            self._writer = self._make_writer(old.flush_interval, old.flush_threshold, old.fsync_policy)
     
-    def save_complete_analysis(self, analysis_data: Dict[str, Any]):
-        """Save complete analysis data including all details."""
-        if "complete_analyses" not in self.long_term:
-            self.long_term["complete_analyses"] = []
+    def save_complete_analysis(self, analysis_data: Dict[str, Any]) -> str:
+        """
+        Save complete analysis data including all details.
+        
+        Analyses are deduplicated by content hash: saving an analysis identical
+        to a stored one replaces the older copy instead of adding another.
+        The summary itself is already recorded in summary_history by
+        add_summary, so it is not appended a second time here.
         
-        self.long_term["complete_analyses"].append(analysis_data)
+        Returns:
+            The analysis's content hash (timing fields excluded)
+        """
+        with self._lock:
+            analyses = self.long_term.setdefault("complete_analyses", [])
+            content_hash = _analysis_content_hash(analysis_data)
+            analyses[:] = [a for a in analyses if a.get("content_hash") != content_hash]
+            analysis = {**analysis_data, "content_hash": content_hash}
+            analyses.append(analysis)
+            self._index_analysis(analysis)
         self.save_long_term()
+        return content_hash
 
     def get_analysis_by_query(self, query: str) -> Dict[str, Any]:
-        """Retrieve complete analysis for a specific query."""
-        analyses = self.long_term.get("complete_analyses", [])
-        # Find the most recent analysis matching this query
-        for analysis in reversed(analyses):
-            if analysis.get("query", "").lower() == query.lower():
-                return analysis
-        return None
-    
-    def save_complete_analysis(self, analysis_data: Dict[str, Any]):
-        """Save complete analysis data including all details."""
-        if "complete_analyses" not in self.long_term:
-            self.long_term["complete_analyses"] = []
+        """Retrieve the most recent complete analysis for a specific query."""
+        self.refresh()
+        return self._analysis_index.get(_normalize_query(query))
+
+    def set_query_embedder(self, embed_fn: Callable[[List[str]], Any]):
+        """
+        Enable semantic lookups with find_closest_analysis.
         
-        self.long_term["complete_analyses"].append(analysis_data)
+        Args:
+            embed_fn: Callable mapping a list of texts to a 2D embedding array
+        """
+        with self._lock:
+            self._query_embedder = embed_fn
+            self._reset_semantic_index()
+
+    def find_closest_analysis(
+        self,
+        query: str,
+        min_similarity: float = 0.75
+    ) -> Tuple[Optional[Dict[str, Any]], float]:
+        """
+        Find the stored analysis whose query is semantically closest.
         
-        # Also update summary_history for backward compatibility
-        if analysis_data.get("summary"):
-            self.long_term["summary_history"].append({
-                "query": analysis_data.get("query"),
-                "summary": analysis_data.get("summary"),
-                "timestamp": analysis_data.get("timestamp")
-            })
+        Args:
+            query: Query text to match
+            min_similarity: Minimum cosine similarity to accept a match
+            
+        Returns:
+            (analysis, similarity), or (None, best_similarity) if no match
+        """
+        self.refresh()
+        if self._query_embedder is None or not self._analysis_index:
+            return None, 0.0
         
-        self.save_long_term()
+        self._embed_pending_queries()
+        keys, matrix = self._semantic_index
+        if matrix is None or not keys:
+            return None, 0.0
+        
+        q_emb = self._normalize_rows(self._query_embedder([query]))[0]
+        scores = matrix @ q_emb
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        
+        if similarity < min_similarity:
+            return None, similarity
+        return self._analysis_index.get(keys[best]), similarity
 
-    def get_analysis_by_query(self, query: str) -> Dict[str, Any]:
-        """Retrieve complete analysis for a specific query."""
-        analyses = self.long_term.get("complete_analyses", [])
-        # Find the most recent analysis matching this query
-        for analysis in reversed(analyses):
-            if analysis.get("query", "").lower() == query.lower():
-                return analysis
-        return None
+    def _index_analysis(self, analysis: Dict[str, Any]):
+        """Point the index at an analysis, queueing new queries for embedding. Call with _lock held."""
+        key = _normalize_query(analysis.get("query", ""))
+        if key not in self._analysis_index:
+            self._pending_semantic_keys.append(key)
+        self._analysis_index[key] = analysis
+
+    def _rebuild_analysis_index(self):
+        """
+        Rebuild the query index from complete_analyses (oldest to newest).
+        
+        Cached query embeddings are kept unless a query dropped out of the
+        index; only new queries are queued for embedding. Call with _lock
+        held (or before the manager is shared).
+        """
+        index: Dict[str, Dict[str, Any]] = {}
+        for analysis in self.long_term.get("complete_analyses", []):
+            index[_normalize_query(analysis.get("query", ""))] = analysis
+        dropped = any(key not in index for key in self._analysis_index)
+        new_keys = [key for key in index if key not in self._analysis_index]
+        self._analysis_index = index
+        if dropped:
+            self._reset_semantic_index()
+        else:
+            self._pending_semantic_keys.extend(new_keys)
+
+    def _reset_semantic_index(self):
+        """Drop cached query embeddings so they are recomputed lazily. Call with _lock held."""
+        self._semantic_index = ([], None)
+        self._semantic_generation += 1
+        self._pending_semantic_keys = list(self._analysis_index.keys())
+
+    def _embed_pending_queries(self):
+        """
+        Embed queries added since the last semantic lookup.
+        
+        The embedding runs outside the lock; the rows are only added if the
+        index was not dropped meanwhile (the reset re-queued every query).
+        """
+        with self._lock:
+            pending = [k for k in self._pending_semantic_keys if k in self._analysis_index]
+            self._pending_semantic_keys = []
+            generation = self._semantic_generation
+        if not pending:
+            return
+        
+        try:
+            new_rows = self._normalize_rows(self._query_embedder(pending))
+        except BaseException:
+            with self._lock:
+                if generation == self._semantic_generation:
+                    self._pending_semantic_keys.extend(pending)
+            raise
+        with self._lock:
+            if generation != self._semantic_generation:
+                return
+            keys, matrix = self._semantic_index
+            matrix = new_rows if matrix is None else np.vstack([matrix, new_rows])
+            self._semantic_index = (keys + pending, matrix)
+
+    @staticmethod
+    def _normalize_rows(embeddings: Any) -> np.ndarray:
+        """L2-normalize embedding rows so dot products are cosine similarities."""
+        arr = np.asarray(embeddings, dtype="float32")
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        norms = np.linalg.norm(arr, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return arr / norms
+
+    # ========================================================================
+    # LOOKUP STATISTICS
+    # ========================================================================
+
+    def record_lookup(self, hit: bool):
+        """Count a stored-analysis lookup as a hit or a miss."""
+        with self._lock:
+            self.cache_stats["hits" if hit else "misses"] += 1
+
+    def get_cache_hit_rate(self) -> float:
+        """Percentage of stored-analysis lookups in this process that found an analysis."""
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+        return (self.cache_stats["hits"] / lookups * 100) if lookups else 0.0
 
     # ========================================================================
     # LONG-TERM MEMORY UPDATES
@@ -116,70 +538,203 @@ class EnhancedMemoryManager:
 
     def add_query(self, query: str):
         """Add query to history."""
-        self.long_term["query_history"].append({
-            "query": query,
-            "timestamp": str(datetime.now())
-        })
+        with self._lock:
+            self.long_term["query_history"].append({
+                "query": query,
+                "timestamp": str(datetime.now())
+            })
 
     def add_brand(self, brand: str):
         """Add brand to tracking."""
-        if brand and brand not in self.long_term["brands"]:
-            self.long_term["brands"].append(brand)
+        with self._lock:
+            if brand and brand not in self.long_term["brands"]:
+                self.long_term["brands"].append(brand)
 
     def add_category(self, title: str):
         """Add product category to tracking."""
-        if title and title not in self.long_term["product_categories"]:
-            self.long_term["product_categories"].append(title)
-
-    def add_summary(self, summary: Dict[str, Any], query: str = None, feature_analysis: Dict[str, Any] = None):
-        """Add complete analysis summary to history."""
-        self.long_term["summary_history"].append({
-            "query": query or self.short_term.get("last_query", ""),
-            "summary": summary,
-            "feature_analysis": feature_analysis,
-            "timestamp": str(datetime.now())
-        })
+        with self._lock:
+            if title and title not in self.long_term["product_categories"]:
+                self.long_term["product_categories"].append(title)
+
+    def add_summary(self, summary: Dict[str, Any], query: str, feature_analysis: Dict[str, Any] = None):
+        """Add an analysis summary to history, under the query of the request that produced it."""
+        with self._lock:
+            self.long_term["summary_history"].append({
+                "query": query,
+                "summary": summary,
+                "feature_analysis": feature_analysis,
+                "timestamp": str(datetime.now())
+            })
 
     def add_suggestion_rating(self, suggestion: str, rating: int, category: str):
         """Track suggestion ratings from users."""
-        self.long_term["suggestion_ratings"].append({
-            "suggestion": suggestion,
-            "rating": rating,
-            "category": category,
-            "timestamp": str(datetime.now())
-        })
+        with self._lock:
+            self.long_term["suggestion_ratings"].append({
+                "suggestion": suggestion,
+                "rating": rating,
+                "category": category,
+                "timestamp": str(datetime.now())
+            })
 
     def add_performance_metric(self, metrics: Dict[str, Any]):
         """Track system performance over time."""
-        if "performance_metrics" not in self.long_term:
-            self.long_term["performance_metrics"] = []
+        with self._lock:
+            if "performance_metrics" not in self.long_term:
+                self.long_term["performance_metrics"] = []
         
-        self.long_term["performance_metrics"].append({
-            "metrics": metrics,
-            "timestamp": str(datetime.now())
-        })
+            self.long_term["performance_metrics"].append({
+                "metrics": metrics,
+                "timestamp": str(datetime.now())
+            })
+        self._record_latencies(metrics)
 
     def accept_suggestion(self, suggestion: str, category: str):
         """Mark a suggestion as accepted."""
-        self.long_term["accepted_suggestions"].append({
-            "suggestion": suggestion,
-            "category": category,
-            "timestamp": str(datetime.now())
-        })
+        with self._lock:
+            self.long_term["accepted_suggestions"].append({
+                "suggestion": suggestion,
+                "category": category,
+                "timestamp": str(datetime.now())
+            })
         self.save_long_term()
 
     def reject_suggestion(self, suggestion: str, category: str, reason: str = None):
         """Mark a suggestion as rejected."""
-        entry = {
-            "suggestion": suggestion,
-            "category": category,
-            "timestamp": str(datetime.now())
-        }
-        if reason:
-            entry["reason"] = reason
-        self.long_term["rejected_suggestions"].append(entry)
+        with self._lock:
+            entry = {
+                "suggestion": suggestion,
+                "category": category,
+                "timestamp": str(datetime.now())
+            }
+            if reason:
+                entry["reason"] = reason
+            self.long_term["rejected_suggestions"].append(entry)
         self.save_long_term()
 
+    # ========================================================================
+    # RETENTION AND COMPACTION
+    # ========================================================================
+
+    def compact(self, save: bool = True) -> Dict[str, int]:
+        """
+        Apply retention policies to the long-term lists.
+        
+        Performance metrics older than rollup_after_hours (or evicted by
+        their count/age policy) are folded into hourly aggregates in
+        performance_rollups, so averages stay correct while raw entries
+        are dropped.
+        
+        Args:
+            save: Persist the compacted memory to disk if anything changed
+            
+        Returns:
+            Number of entries removed per list
+        """
+        with self._lock:
+            self._last_compaction = time.time()
+            now = datetime.now()
+            removed: Dict[str, int] = {}
+        
+            rolled_up = self._rollup_performance_metrics(now)
+            if rolled_up:
+                removed["performance_metrics"] = rolled_up
+        
+            for key, policy in self.retention_policies.items():
+                entries = self.long_term.get(key)
+                if not isinstance(entries, list) or not entries:
+                    continue
+                kept = self._apply_policy(key, entries, policy, now)
+                if len(kept) != len(entries):
+                    removed[key] = removed.get(key, 0) + len(entries) - len(kept)
+                    self.long_term[key] = kept
+        
+            if "complete_analyses" in removed:
+                self._rebuild_analysis_index()
+        
+        if removed:
+            print(f"Memory compacted: {removed}")
+            if save:
+                self.save_long_term()
+        return removed
+
+    def _apply_policy(
+        self,
+        key: str,
+        entries: list,
+        policy: Dict[str, Any],
+        now: datetime
+    ) -> list:
+        """Return the entries kept by a max_age_days/max_count policy."""
+        max_age_days = policy.get("max_age_days")
+        max_count = policy.get("max_count")
+        kept = entries
+        
+        if max_age_days is not None:
+            cutoff = now - timedelta(days=max_age_days)
+            kept = [
+                e for e in kept
+                if (_parse_timestamp(self._entry_timestamp(key, e)) or now) >= cutoff
+            ]
+        
+        if max_count is not None and len(kept) > max_count:
+            kept = kept[-max_count:] if max_count > 0 else []
+        
+        return kept
+
+    @staticmethod
+    def _entry_timestamp(key: str, entry: Dict[str, Any]) -> Any:
+        """Get the timestamp used for age-based retention of an entry."""
+        if key == "performance_rollups":
+            return entry.get("hour")
+        return entry.get("timestamp")
+
+    def _rollup_performance_metrics(self, now: datetime) -> int:
+        """Fold old or over-limit raw performance metrics into hourly rollups."""
+        metrics = self.long_term.get("performance_metrics", [])
+        if not metrics:
+            return 0
+        
+        policy = self.retention_policies.get("performance_metrics", {})
+        cutoff = now - timedelta(hours=self.rollup_after_hours)
+        max_age_days = policy.get("max_age_days")
+        if max_age_days is not None:
+            cutoff = max(cutoff, now - timedelta(days=max_age_days))
+        
+        max_count = policy.get("max_count")
+        overflow = len(metrics) - max_count if max_count is not None else 0
+        
+        kept, evicted = [], []
+        for i, entry in enumerate(metrics):
+            ts = _parse_timestamp(entry.get("timestamp"))
+            if i < overflow or (ts is not None and ts < cutoff):
+                evicted.append(entry)
+            else:
+                kept.append(entry)
+        
+        if not evicted:
+            return 0
+        
+        # Updated rollups are new dicts: a snapshot being serialized may hold the old ones
+        rollups = {
+            r["hour"]: {**r, **{field: dict(r.get(field, {})) for field in ("sums", "counts", "max")}}
+            for r in self.long_term.get("performance_rollups", [])
+        }
+        for entry in evicted:
+            ts = _parse_timestamp(entry.get("timestamp")) or now
+            hour = str(ts.replace(minute=0, second=0, microsecond=0))
+            rollup = rollups.setdefault(hour, {"hour": hour, "count": 0, "sums": {}, "counts": {}, "max": {}})
+            rollup["count"] += 1
+            for name, value in entry.get("metrics", {}).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                rollup["sums"][name] = rollup["sums"].get(name, 0) + value
+                rollup["counts"][name] = rollup["counts"].get(name, 0) + 1
+                rollup["max"][name] = max(rollup["max"].get(name, value), value)
+        
+        self.long_term["performance_rollups"] = sorted(rollups.values(), key=lambda r: r["hour"])
+        self.long_term["performance_metrics"] = kept
+        return len(evicted)
+
     # ========================================================================
     # SHORT-TERM MEMORY UPDATES
     # ========================================================================
@@ -218,16 +773,20 @@ class EnhancedMemoryManager:
 
     def clear_memory(self):
         """Clear both short-term and long-term memory."""
-        self.long_term = self._get_default_structure()
-        self.short_term = {
-            "last_query": None,
-            "retrieved_ids": [],
-            "summary": None,
-            "advisor": None,
-            "feature_analysis": None,
-            "latency_metrics": None,
-            "intent": None,
-        }
+        with self._lock:
+            # Include other processes' latest entries in what is cleared
+            self._merge_from_disk()
+            self.long_term = self._get_default_structure()
+            self._rebuild_analysis_index()
+            self.short_term = {
+                "last_query": None,
+                "retrieved_ids": [],
+                "summary": None,
+                "advisor": None,
+                "feature_analysis": None,
+                "latency_metrics": None,
+                "intent": None,
+            }
         self.save_long_term()
         print("Memory cleared successfully")
 
@@ -249,35 +808,60 @@ class EnhancedMemoryManager:
         return history[-n:] if len(history) > n else history
 
     def get_performance_summary(self) -> Dict[str, Any]:
-        """Get summary of system performance metrics."""
+        """Get summary of system performance metrics, including hourly rollups."""
         metrics = self.long_term.get("performance_metrics", [])
+        rollups = self.long_term.get("performance_rollups", [])
         
-        if not metrics:
+        if not metrics and not rollups:
             return {"message": "No performance metrics available"}
         
-        # Calculate averages
-        total_latencies = []
-        retrieval_counts = []
-        suggestion_counts = []
+        # Accumulate sums and counts from raw entries and rollups alike
+        sums = {"total_latency": 0.0, "retrieval_count": 0.0, "suggestions_generated": 0.0}
+        counts = {name: 0 for name in sums}
         
         for entry in metrics:
             m = entry.get("metrics", {})
-            if "total_latency" in m:
-                total_latencies.append(m["total_latency"])
-            if "retrieval_count" in m:
-                retrieval_counts.append(m["retrieval_count"])
-            if "suggestions_generated" in m:
-                suggestion_counts.append(m["suggestions_generated"])
+            for name in sums:
+                if name in m:
+                    sums[name] += m[name]
+                    counts[name] += 1
+        
+        for rollup in rollups:
+            for name in sums:
+                sums[name] += rollup.get("sums", {}).get(name, 0)
+                counts[name] += rollup.get("counts", {}).get(name, 0)
+        
+        def average(name: str) -> float:
+            return sums[name] / counts[name] if counts[name] else 0
         
         summary = {
-            "total_queries": len(metrics),
-            "avg_latency": sum(total_latencies) / len(total_latencies) if total_latencies else 0,
-            "avg_retrievals": sum(retrieval_counts) / len(retrieval_counts) if retrieval_counts else 0,
-            "avg_suggestions": sum(suggestion_counts) / len(suggestion_counts) if suggestion_counts else 0,
+            "total_queries": len(metrics) + sum(r.get("count", 0) for r in rollups),
+            "avg_latency": average("total_latency"),
+            "avg_retrievals": average("retrieval_count"),
+            "avg_suggestions": average("suggestions_generated"),
         }
         
         return summary
 
+    def get_latency_percentiles(self) -> Dict[str, Any]:
+        """Get rolling p50/p90/p99 latency per LangGraph node for 1m/1h/24h windows."""
+        return self.latency_sketches.summary()
+
+    def _record_latencies(self, metrics: Dict[str, Any], timestamp: float = None):
+        """Feed the latency fields of a performance metric into the sketches."""
+        for field, node in LATENCY_METRIC_NODES.items():
+            value = metrics.get(field)
+            if isinstance(value, (int, float)):
+                self.latency_sketches.record(node, value, timestamp)
+
+    def _seed_latency_sketches(self):
+        """Replay stored metrics from the last 24h so windows survive restarts."""
+        cutoff = datetime.now() - timedelta(days=1)
+        for entry in self.long_term.get("performance_metrics", []):
+            ts = _parse_timestamp(entry.get("timestamp"))
+            if ts is not None and ts >= cutoff:
+                self._record_latencies(entry.get("metrics", {}), ts.timestamp())
+
     def get_suggestion_feedback_summary(self) -> Dict[str, Any]:
         """Get summary of suggestion acceptance/rejection rates."""
         accepted = len(self.long_term.get("accepted_suggestions", []))
@@ -338,13 +922,16 @@ class EnhancedMemoryManager:
             with open(import_path, "r") as f:
                 data = json.load(f)
             
-            if "long_term" in data:
-                self.long_term = data["long_term"]
-                self._ensure_keys()
-            
-            if "short_term" in data:
-                self.short_term = data["short_term"]
-            
+            with self._lock:
+                if "long_term" in data:
+                    self.long_term = data["long_term"]
+                    self._ensure_keys()
+                    self.compact(save=False)
+                    self._rebuild_analysis_index()
+                
+                if "short_term" in data:
+                    self.short_term = data["short_term"]
+                
             self.save_long_term()
             print(f"Memory imported from {import_path}")
             return True
@@ -376,6 +963,7 @@ class EnhancedMemoryManager:
         print(f"  Product Categories: {len(self.long_term.get('product_categories', []))}")
         print(f"  Summary History: {len(self.long_term.get('summary_history', []))}")
         print(f"  Performance Metrics: {len(self.long_term.get('performance_metrics', []))}")
+        print(f"  Performance Rollups: {len(self.long_term.get('performance_rollups', []))}")
         print(f"  Accepted Suggestions: {len(self.long_term.get('accepted_suggestions', []))}")
         print(f"  Rejected Suggestions: {len(self.long_term.get('rejected_suggestions', []))}")
         
@@ -1,14 +1,21 @@
+from __future__ import annotations
+
 import os
 import json
-import pandas as pd
 import numpy as np
 import time
-from typing import TypedDict, Dict, Any, Optional
+import asyncio
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TypedDict, Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime
 
-from sentence_transformers import SentenceTransformer
-import faiss
-from groq import Groq
+# Process start, used to report how long startup and warm-up took
+PROCESS_START = time.time()
+
 from dotenv import load_dotenv
 
 # Load .env file (works locally)
@@ -17,54 +24,212 @@ load_dotenv()
 
 # Get API key from environment variable
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-# LangGraph
-from langgraph.graph import StateGraph, END
 
 from memory_manager import EnhancedMemoryManager
+from resources import LazyResource, timed_import, IMPORT_TIMINGS
+from artifacts import ArtifactManager
+from brands import BRANDS
+from reranker import CrossEncoderReranker, RERANK_ENABLED, RERANK_TOP_N, CROSS_ENCODER_MODEL
+from diversity import mmr_select, MMR_ENABLED, MMR_LAMBDA, MMR_TOP_N
+from telemetry import NODE_LATENCY, LLM_LATENCY, LLM_ERRORS, EMBED_LATENCY, FAISS_SEARCH_LATENCY
+import tracing
+import profiling
 
-# Validate it exists
-if not GROQ_API_KEY:
-    raise ValueError(
-        "GROQ_API_KEY not found in environment variables. "
-        "Set it in .env locally or in Render dashboard for production."
-    )
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 # # Initialize
 # os.environ["GROQ_API_KEY"] = "PASS YOUR API KEY"
 
-# Load FAISS index and embeddings
-index = faiss.read_index("faiss_index.bin")
-emb_norm = np.load("embeddings.npy")
-map_df = pd.read_csv("mapping.csv", index_col=0)
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
+# ============================================================================
+# LAZILY LOADED RESOURCES
+# ============================================================================
+# torch/sentence-transformers, faiss, pandas, groq and langgraph are only
+# imported when the resource that needs them is first used (or by warm_up
+# in the background), so the memory endpoints start without waiting for them.
+
+def _load_embed_model():
+    sentence_transformers = timed_import("sentence_transformers")
+    return sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2")
+
+
+def _load_retrieval_store():
+    # The active artifact version (see artifacts.py): base faiss_index.bin +
+    # mapping.csv plus any delta segments, hot-swapped when CURRENT changes
+    return ArtifactManager().load_current()
+
+
+def _load_embeddings():
+    # Memory-mapped: pages are read on access instead of holding the corpus in RSS
+    return np.load("embeddings.npy", mmap_mode="r")
+
+
+def _load_cross_encoder():
+    sentence_transformers = timed_import("sentence_transformers")
+    return sentence_transformers.CrossEncoder(CROSS_ENCODER_MODEL, device="cpu")
+
+
+def _load_groq_client():
+    # Validate it exists
+    if not GROQ_API_KEY:
+        raise ValueError(
+            "GROQ_API_KEY not found in environment variables. "
+            "Set it in .env locally or in Render dashboard for production."
+        )
+    groq = timed_import("groq")
+    return groq.Groq(api_key=GROQ_API_KEY)
+
+
+def _load_async_groq_client():
+    if not GROQ_API_KEY:
+        raise ValueError(
+            "GROQ_API_KEY not found in environment variables. "
+            "Set it in .env locally or in Render dashboard for production."
+        )
+    groq = timed_import("groq")
+    return groq.AsyncGroq(api_key=GROQ_API_KEY)
+
+
+EMBED_MODEL = LazyResource("embed_model", _load_embed_model)
+RETRIEVAL_STORE = LazyResource("retrieval_store", _load_retrieval_store)
+EMBEDDINGS = LazyResource("embeddings", _load_embeddings)
+CROSS_ENCODER = LazyResource("cross_encoder", _load_cross_encoder)
+GROQ_CLIENT = LazyResource("groq_client", _load_groq_client)
+ASYNC_GROQ_CLIENT = LazyResource("async_groq_client", _load_async_groq_client)
+
+# Loaded by warm_up(); embeddings are not needed on the request path. The Groq
+# clients load on the first real LLM call, so readiness does not depend on
+# GROQ_API_KEY (warm-up and WATCHSENSE_STUB_LLM=1 never call the API).
+PIPELINE_RESOURCES = [EMBED_MODEL, RETRIEVAL_STORE] + ([CROSS_ENCODER] if RERANK_ENABLED else [])
 
-# Initialize Groq
-groq_client = Groq(api_key=GROQ_API_KEY)
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
-# Initialize memory
+# Bounded pool for CPU-bound work (encode, FAISS search, pandas) on the async
+# serving path, so the event loop only ever waits on I/O
+CPU_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("WATCHSENSE_CPU_WORKERS", os.cpu_count() or 4)),
+    thread_name_prefix="cpu-bound"
+)
+
+# Optional cross-encoder stage between retrieve and summarize
+RERANKER = CrossEncoderReranker(CROSS_ENCODER.get)
+
+# Initialize memory (semantic analysis lookups reuse the review embedder)
 memory = EnhancedMemoryManager()
+memory.set_query_embedder(lambda texts: EMBED_MODEL.get().encode(texts, convert_to_numpy=True))
 
 # Top K for complaints/praises
 TOP_K = 5
 
-def groq_chat(system_prompt: str, user_prompt: str, json_mode: bool = False) -> str:
-    """Wrapper around Groq chat completions."""
-    params = {
-        "model": GROQ_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "temperature": 0.3
-    }
-    
-    if json_mode:
-        params["response_format"] = {"type": "json_object"}
-    
-    resp = groq_client.chat.completions.create(**params)
-    return resp.choices[0].message.content
+# Adaptive retrieval depth: search up to ADAPTIVE_MAX_K, then cut at the
+# similarity threshold or the elbow of the score curve, whichever comes
+# first, keeping at least ADAPTIVE_MIN_K reviews
+ADAPTIVE_K = os.getenv("WATCHSENSE_ADAPTIVE_K", "1") == "1"
+ADAPTIVE_MIN_K = int(os.getenv("WATCHSENSE_ADAPTIVE_MIN_K", "15"))
+ADAPTIVE_MAX_K = int(os.getenv("WATCHSENSE_ADAPTIVE_MAX_K", "100"))
+SIMILARITY_THRESHOLD = float(os.getenv("WATCHSENSE_SIMILARITY_THRESHOLD", "0.3"))
+# Minimum drop below the first-to-last chord (on the normalized curve) to count as an elbow
+ELBOW_MIN_PROMINENCE = 0.05
+
+# A star filter is applied to search results, so the search over-fetches
+# by the filter's selectivity, up to this many times k
+FILTER_OVERFETCH_MAX = 10
+
+# Collapse near-duplicate reviews (clusters from dedup.py) to one weighted
+# representative in retrieval results
+COLLAPSE_DUPLICATES = os.getenv("WATCHSENSE_COLLAPSE_DUPLICATES", "1") == "1"
+
+# Per-thread LLM stub used by warm_up() so it never calls the real API
+_llm_stub = threading.local()
+
+# WATCHSENSE_STUB_LLM=1 answers every LLM call with canned JSON; used by
+# loadtest.py to measure serving throughput without API latency or cost
+STUB_LLM = os.getenv("WATCHSENSE_STUB_LLM", "0") == "1"
+
+
+def _record_llm_usage(span, resp):
+    """Copy token counts from a chat completion response onto its span."""
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        span.set_attribute("prompt_tokens", getattr(usage, "prompt_tokens", None))
+        span.set_attribute("completion_tokens", getattr(usage, "completion_tokens", None))
+
+
+def groq_chat(system_prompt: str, user_prompt: str, json_mode: bool = False, call_type: str = "chat") -> str:
+    """Wrapper around Groq chat completions, timed per call_type."""
+    with tracing.span(f"llm.{call_type}", model=GROQ_MODEL, json_mode=json_mode,
+                      prompt_chars=len(system_prompt) + len(user_prompt)) as span:
+        stub = getattr(_llm_stub, "responder", None) or (_stub_llm_reply if STUB_LLM else None)
+        if stub is not None:
+            span.set_attribute("stub", True)
+            return stub(call_type)
+        
+        params = {
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": 0.3
+        }
+        
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        
+        try:
+            with LLM_LATENCY.time(call_type=call_type):
+                resp = GROQ_CLIENT.get().chat.completions.create(**params)
+        except Exception:
+            LLM_ERRORS.inc(call_type=call_type)
+            raise
+        _record_llm_usage(span, resp)
+        return resp.choices[0].message.content
+
+
+async def agroq_chat(system_prompt: str, user_prompt: str, json_mode: bool = False, call_type: str = "chat") -> str:
+    """Awaitable groq_chat: the request waits on the LLM without holding a thread."""
+    with tracing.span(f"llm.{call_type}", model=GROQ_MODEL, json_mode=json_mode,
+                      prompt_chars=len(system_prompt) + len(user_prompt)) as span:
+        stub = getattr(_llm_stub, "responder", None) or (_stub_llm_reply if STUB_LLM else None)
+        if stub is not None:
+            span.set_attribute("stub", True)
+            return stub(call_type)
+        
+        params = {
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": 0.3
+        }
+        
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        
+        try:
+            with LLM_LATENCY.time(call_type=call_type):
+                resp = await ASYNC_GROQ_CLIENT.get().chat.completions.create(**params)
+        except Exception:
+            LLM_ERRORS.inc(call_type=call_type)
+            raise
+        _record_llm_usage(span, resp)
+        return resp.choices[0].message.content
+
+
+async def run_cpu_bound(fn, *args, **kwargs):
+    """Run a blocking function on CPU_EXECUTOR and await its result."""
+    loop = asyncio.get_running_loop()
+    # Carry the context over so spans started in fn join the caller's trace
+    # and the executor thread is sampled if the request is being profiled
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(CPU_EXECUTOR, partial(ctx.run, _run_tracked, fn, *args, **kwargs))
+
+
+def _run_tracked(fn, *args, **kwargs):
+    with profiling.track_thread():
+        return fn(*args, **kwargs)
 
 
 # ============================================================================
@@ -96,16 +261,36 @@ def detect_query_intent(query: str) -> str:
     return "overall"
 
 
-def build_reviews_snippet(reviews_df: pd.DataFrame, max_reviews: int = 40) -> str:
+# Reviews shown to the summarizer; faithfulness checks the summary against the same ones
+SUMMARY_MAX_REVIEWS = 40
+
+
+def build_reviews_snippet(reviews_df: pd.DataFrame, max_reviews: int = SUMMARY_MAX_REVIEWS) -> str:
     """Convert reviews to text format."""
     rows = []
     for _, r in reviews_df.head(max_reviews).iterrows():
-        rows.append(f"- [{r['star_rating']}] {r['review_body']}")
+        weight = r.get("weight", 1)
+        # Collapsed near-duplicates: say how many reviewers wrote the same thing
+        repeated = f" (x{weight} similar reviews)" if weight > 1 else ""
+        rows.append(f"- [{r['star_rating']}]{repeated} {r['review_body']}")
     return "\n".join(rows)
 
 
-def analyze_features(reviews_df: pd.DataFrame, memory: EnhancedMemoryManager) -> Dict[str, Any]:
-    """Extract and analyze specific watch features."""
+def review_weights(reviews_df: pd.DataFrame) -> pd.Series:
+    """
+    Reviews each row stands for: its near-duplicate cluster size after
+    collapse_duplicates, else 1.
+    """
+    if "weight" not in reviews_df:
+        return reviews_df.assign(weight=1)["weight"]
+    return reviews_df["weight"].fillna(1).astype(np.int64)
+
+
+def feature_stats(reviews_df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Mentions, average rating and sentiment per watch feature. A collapsed
+    near-duplicate counts once per review it stands for (review_weights).
+    """
     feature_keywords = {
         "strap": ["strap", "band", "bracelet", "leather", "metal", "rubber"],
         "battery": ["battery", "charge", "power", "charging"],
@@ -124,40 +309,82 @@ def analyze_features(reviews_df: pd.DataFrame, memory: EnhancedMemoryManager) ->
         ]
         
         if not relevant_reviews.empty:
-            avg_rating = relevant_reviews['star_rating'].mean()
-            positive = len(relevant_reviews[relevant_reviews['star_rating'] >= 4])
-            negative = len(relevant_reviews[relevant_reviews['star_rating'] <= 2])
+            weights = review_weights(relevant_reviews)
+            stars = relevant_reviews['star_rating']
+            mentions = int(weights.sum())
+            avg_rating = (stars * weights).sum() / mentions
+            positive = int(weights[stars >= 4].sum())
+            negative = int(weights[stars <= 2].sum())
             
             feature_analysis[feature] = {
-                "mention_count": len(relevant_reviews),
-                "avg_rating": round(avg_rating, 2),
+                "mention_count": mentions,
+                "avg_rating": round(float(avg_rating), 2),
                 "sentiment": {
                     "positive": positive,
                     "negative": negative,
-                    "neutral": len(relevant_reviews) - positive - negative
+                    "neutral": mentions - positive - negative
                 },
                 "sample_reviews": relevant_reviews['review_body'].head(3).tolist()
             }
     
+    return feature_analysis
+
+
+def analyze_features(reviews_df: pd.DataFrame, memory: EnhancedMemoryManager) -> Dict[str, Any]:
+    """Extract and analyze specific watch features."""
+    feature_analysis = feature_stats(reviews_df)
     memory.update_short_term(feature_analysis=feature_analysis)
     return feature_analysis
 
 
+def rating_stats(reviews_df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Average, distribution and sentiment split of star ratings, counting a
+    collapsed near-duplicate once per review it stands for (review_weights).
+    """
+    weights = review_weights(reviews_df)
+    stars = reviews_df['star_rating']
+    total_reviews = int(weights.sum())
+    positive_pct = weights[stars >= 4].sum() / total_reviews * 100
+    negative_pct = weights[stars <= 2].sum() / total_reviews * 100
+    neutral_pct = 100 - positive_pct - negative_pct
+    
+    return {
+        "average": round(float((stars * weights).sum() / total_reviews), 2),
+        "distribution": {star: int(count) for star, count in weights.groupby(stars).sum().items()},
+        "total_reviews": total_reviews,
+        "sentiment_percentages": {
+            "positive": round(positive_pct, 1),
+            "negative": round(negative_pct, 1),
+            "neutral": round(neutral_pct, 1)
+        }
+    }
+
+
 def evaluate_system_performance(
     query: str,
     retrieved_reviews: pd.DataFrame,
     summary: Dict[str, Any],
-    advisor: Dict[str, Any]
+    advisor: Dict[str, Any],
+    target_count: int = 40,
+    summary_reviews: Optional[pd.DataFrame] = None
 ) -> Dict[str, Any]:
-    """Evaluate system performance with various metrics."""
+    """
+    Evaluate system performance with various metrics. Retrieval metrics use
+    retrieved_reviews; the summary is checked against summary_reviews (the
+    reviews it was written from, default retrieved_reviews).
+    """
+    if summary_reviews is None:
+        summary_reviews = retrieved_reviews
     metrics: Dict[str, Any] = {}
     relevant_count = len(retrieved_reviews)
     metrics["retrieval_count"] = relevant_count
-    metrics["retrieval_precision"] = min(1.0, relevant_count / 40)  # target ~40 reviews
+    # Share of the intended depth that survived filtering (the adaptive k, or ~40)
+    metrics["retrieval_precision"] = min(1.0, relevant_count / max(1, target_count))
     
     summary_text = json.dumps(summary)
     sample_review_words = set()
-    for review in retrieved_reviews['review_body'].head(10):
+    for review in summary_reviews['review_body'].head(10):
         sample_review_words.update(str(review).lower().split())
     
     summary_words = set(summary_text.lower().split())
@@ -179,9 +406,12 @@ def calculate_better_faithfulness(
     retrieved_reviews: pd.DataFrame,
     summary: Dict[str, Any]
 ) -> Dict[str, Any]:
-    """Calculate improved faithfulness score by verifying complaints and praises."""
+    """
+    Calculate improved faithfulness score by verifying complaints and praises
+    against the reviews the summary was written from.
+    """
     review_texts = ' '.join(
-        retrieved_reviews['review_body'].head(20).astype(str).tolist()
+        retrieved_reviews['review_body'].head(SUMMARY_MAX_REVIEWS).astype(str).tolist()
     )
     
     complaints = summary.get('top_complaints', [])
@@ -254,9 +484,7 @@ def calculate_better_faithfulness(
 # AGENT FUNCTIONS
 # ============================================================================
 
-def extract_product_features(query: str) -> Dict[str, Any]:
-    """Extract product type, material, brand from query using LLM."""
-    system_prompt = """
+FEATURE_EXTRACTION_PROMPT = """
     Extract product features from the user query.
     Return JSON with:
     - brand: extracted brand name (or null)
@@ -264,63 +492,167 @@ def extract_product_features(query: str) -> Dict[str, Any]:
     - watch_type: type of watch (digital, analog, smart, sport, etc.)
     - features_mentioned: list of features (battery, strap, display, design, etc.)
     """
-    
-    result = groq_chat(system_prompt, query, json_mode=True)
+
+
+def extract_product_features(query: str) -> Dict[str, Any]:
+    """Extract product type, material, brand from query using LLM."""
+    result = groq_chat(FEATURE_EXTRACTION_PROMPT, query, json_mode=True, call_type="extract_features")
+    return json.loads(result)
+
+
+async def aextract_product_features(query: str) -> Dict[str, Any]:
+    """Async version of extract_product_features."""
+    result = await agroq_chat(FEATURE_EXTRACTION_PROMPT, query, json_mode=True, call_type="extract_features")
     return json.loads(result)
 
 
+def select_depth(
+    scores: np.ndarray,
+    min_k: int = ADAPTIVE_MIN_K,
+    max_k: int = ADAPTIVE_MAX_K,
+    threshold: float = SIMILARITY_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    Choose how many of the (descending) scores to keep.
+
+    k is the smaller of the number of scores above `threshold` and the
+    elbow of the score curve (the point furthest below the chord from the
+    first to the last score), clamped to [min_k, max_k]. A curve without a
+    clear elbow (a broad query) keeps everything above the threshold. With
+    min_k=0 and no score above the threshold, k is 0 and cutoff_score None.
+    """
+    n = min(len(scores), max_k)
+    if n == 0:
+        return {"k": 0, "cutoff_score": None, "reason": "empty"}
+    scores = scores[:n]
+    
+    above = int(np.count_nonzero(scores >= threshold))
+    elbow = n
+    if n > 2 and scores[0] > scores[-1]:
+        x = np.linspace(0.0, 1.0, n)
+        y = (scores - scores[-1]) / (scores[0] - scores[-1])
+        drop = (1.0 - x) - y
+        if drop.max() >= ELBOW_MIN_PROMINENCE:
+            # Keep the scores before the knee point
+            elbow = max(1, int(drop.argmax()))
+    
+    k = min(above, elbow)
+    reason = "threshold" if above <= elbow else "elbow"
+    if k < min_k:
+        k, reason = min(min_k, n), "min_k"
+    elif k == n and n == max_k:
+        reason = "max_k"
+    cutoff_score = round(float(scores[k - 1]), 4) if k else None
+    return {"k": k, "cutoff_score": cutoff_score, "reason": reason}
+
+
+def filtered_fetch(store, k: int, min_star: Optional[int], max_star: Optional[int]) -> int:
+    """Candidates to search for so that about k survive the star filter."""
+    if min_star is None and max_star is None:
+        return k
+    fraction = store.star_fraction(min_star, max_star)
+    return k * FILTER_OVERFETCH_MAX if fraction <= 0 else int(np.ceil(k / max(fraction, 1 / FILTER_OVERFETCH_MAX)))
+
+
+def trim_hits(store, scores: np.ndarray, indices: np.ndarray, k: int, min_star: Optional[int],
+              max_star: Optional[int], adaptive: bool, collapse: bool):
+    """
+    Star-filter search hits, then cut them to k or the adaptive depth, then
+    collapse near-duplicates. Filtering first means the depth is chosen
+    from, and duplicates collapse onto, reviews the caller will keep.
+    Returns (scores, indices, weights, depth).
+    """
+    keep = store.filter_mask(indices, None, min_star, max_star)
+    scores, indices = scores[keep], indices[keep]
+    if adaptive:
+        depth = select_depth(scores, max_k=k)
+    else:
+        depth = {"k": min(k, len(indices)), "cutoff_score": None, "reason": "fixed"}
+    scores, indices = scores[:depth["k"]], indices[:depth["k"]]
+    weights = np.ones(len(indices), dtype=np.int32)
+    if collapse:
+        scores, indices, weights = store.collapse_duplicates(scores, indices)
+    return scores, indices, weights, depth
+
+
 def retrieve_reviews(
     query: str,
     memory: EnhancedMemoryManager,
     k: int = 40,
     brand: Optional[str] = None,
     min_star: Optional[int] = None,
-    max_star: Optional[int] = None
+    max_star: Optional[int] = None,
+    collapse_duplicates: bool = COLLAPSE_DUPLICATES,
+    adaptive: bool = False,
+    with_vectors: bool = False
 ) -> pd.DataFrame:
     """
     Deterministic tool:
-    - uses embeddings + FAISS for semantic search (no randomness)
+    - uses embeddings + FAISS for semantic search (no randomness); with a
+      brand the search runs within that brand's reviews, and star filters
+      apply before the depth is chosen
+    - with adaptive=True, k is an upper bound and select_depth() picks the
+      depth from the filtered scores; the choice is in
+      results.attrs["retrieval_depth"]
+    - near-duplicate reviews collapse to their best hit, with the cluster
+      size in the "weight" column
+    - with_vectors=True adds each review's embedding in an "embedding"
+      column, read from the same artifact version as the rows
     """
     memory.add_query(query)
     
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
+    with tracing.span("embed.encode", texts=1), EMBED_LATENCY.time():
+        q_emb = EMBED_MODEL.get().encode([query], convert_to_numpy=True)
     q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
     
-    D, I = index.search(q_emb, k)
-    indices = I[0]
-    scores = D[0]
+    # The whole lookup runs against one artifact version, even if a swap
+    # happens meanwhile; the copy below holds no reference to the store
+    with RETRIEVAL_STORE.get().acquire() as store:
+        store.maybe_refresh()
+        fetch = filtered_fetch(store, k, min_star, max_star)
+        with tracing.span("faiss.search", k=fetch) as span, FAISS_SEARCH_LATENCY.time():
+            span.set_attribute("ntotal", store.ntotal)
+            span.set_attribute("segments", len(store.segments))
+            span.set_attribute("artifact_version", store.version)
+            if brand:
+                # Free-text brand -> brand code via aliases/fuzzy match; an
+                # unknown brand matches no reviews
+                brand_code = BRANDS.resolve(brand)
+                if brand_code is None:
+                    scores, indices = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+                else:
+                    scores, indices = store.search_brands(q_emb, fetch, [brand_code])[brand_code]
+            else:
+                scores, indices = store.search(q_emb, fetch)
+        
+        retrieved = len(indices)
+        scores, indices, weights, depth = trim_hits(
+            store, scores, indices, k, min_star, max_star, adaptive, collapse_duplicates
+        )
+        if adaptive:
+            tracing.set_attribute("adaptive_k", depth["k"])
+        if collapse_duplicates:
+            tracing.set_attribute("duplicates_collapsed", min(retrieved, depth["k"]) - len(indices))
+        results = store.rows(indices).copy()
+        if with_vectors:
+            results["embedding"] = list(store.vectors(indices))
     
     memory.update_short_term(last_query=query, retrieved_ids=indices.tolist())
-    
-    results = map_df.iloc[indices].copy()
-    results["score"] = scores
-    
     if brand:
         memory.add_brand(brand)
-        results = results[
-            results["detected_brand"].str.lower() == brand.lower()
-        ]
-    
-    if min_star is not None:
-        results = results[results["star_rating"] >= min_star]
-    
-    if max_star is not None:
-        results = results[results["star_rating"] <= max_star]
     
+    results["score"] = scores
+    results["weight"] = weights
+    results.attrs["retrieval_depth"] = depth
     return results
 
 
-def summarize_reviews_agent(
+def _prepare_summary_prompts(
     reviews_df: pd.DataFrame,
     query_text: str,
-    memory: EnhancedMemoryManager
-) -> Dict[str, Any]:
-    """Summarize reviews with enhanced analysis and intent detection."""
-    
-    # Detect Query Intent
-    intent = detect_query_intent(query_text)
-    memory.update_short_term(intent=intent)
-    
+    intent: str
+) -> Tuple[str, str, Dict[str, Any]]:
+    """Build the summarizer prompts and the rating stats enforced on its output."""
     if intent == "negative":
         focus_instruction = "Focus mainly on recurring complaints. Complaints should be more detailed than praises."
     elif intent == "positive":
@@ -332,13 +664,8 @@ def summarize_reviews_agent(
     reviews_text = build_reviews_snippet(reviews_df)
     
     # Compute Rating Stats
-    rating_dist = reviews_df['star_rating'].value_counts().to_dict()
-    avg_rating = reviews_df['star_rating'].mean()
-    total_reviews = len(reviews_df)
-    
-    positive_pct = len(reviews_df[reviews_df['star_rating'] >= 4]) / total_reviews * 100
-    negative_pct = len(reviews_df[reviews_df['star_rating'] <= 2]) / total_reviews * 100
-    neutral_pct = 100 - positive_pct - negative_pct
+    stats = rating_stats(reviews_df)
+    sentiment = stats["sentiment_percentages"]
     
     # SYSTEM PROMPT
     system_prompt = f"""
@@ -355,13 +682,13 @@ Return ONLY a JSON object with the following fields:
 2. "top_praises": list of the top {TOP_K} recurring praises
 3. "summary_text": a concise 3–5 sentence summary
 4. "rating_stats": an object containing:
-    - "average": {avg_rating:.2f}
+    - "average": {stats["average"]:.2f}
     - "distribution": the rating distribution dictionary
-    - "total_reviews": {total_reviews}
+    - "total_reviews": {stats["total_reviews"]}
     - "sentiment_percentages":
-        - "positive": {round(positive_pct,1)}
-        - "negative": {round(negative_pct,1)}
-        - "neutral": {round(neutral_pct,1)}
+        - "positive": {sentiment["positive"]}
+        - "negative": {sentiment["negative"]}
+        - "neutral": {sentiment["neutral"]}
 
 Do NOT include explanations, markdown, or commentary.
 Return ONLY valid JSON.
@@ -375,25 +702,20 @@ Here are the customer reviews:
 {reviews_text}
 """
     
-    # Call LLM in JSON mode
-    summary_json_str = groq_chat(
-        system_prompt,
-        user_prompt,
-        json_mode=True
-    )
+    return system_prompt, user_prompt, stats
+
+
+def _finish_summary(
+    summary_json_str: str,
+    rating_stats: Dict[str, Any],
+    query_text: str,
+    memory: EnhancedMemoryManager
+) -> Dict[str, Any]:
+    """Parse the summarizer output, enforce rating stats and record it."""
     summary = json.loads(summary_json_str)
     
     # Enforce Correct Rating Stats
-    summary["rating_stats"] = {
-        "average": round(avg_rating, 2),
-        "distribution": rating_dist,
-        "total_reviews": total_reviews,
-        "sentiment_percentages": {
-            "positive": round(positive_pct, 1),
-            "negative": round(negative_pct, 1),
-            "neutral": round(neutral_pct, 1)
-        }
-    }
+    summary["rating_stats"] = rating_stats
     
     # Update Memory
     memory.update_short_term(summary=summary)
@@ -402,17 +724,57 @@ Here are the customer reviews:
     return summary
 
 
-def advisor_agent(
-    summary: Dict[str, Any],
-    feature_analysis: Dict[str, Any],
-    brand: Optional[str],
+def summarize_reviews_agent(
+    reviews_df: pd.DataFrame,
+    query_text: str,
     memory: EnhancedMemoryManager
 ) -> Dict[str, Any]:
-    """Generate actionable recommendations with intent awareness."""
+    """Summarize reviews with enhanced analysis and intent detection."""
     
-    # Get user intent from memory
-    intent = memory.short_term.get("intent", "overall")
+    # Detect Query Intent
+    intent = detect_query_intent(query_text)
+    memory.update_short_term(intent=intent)
+    
+    system_prompt, user_prompt, rating_stats = _prepare_summary_prompts(reviews_df, query_text, intent)
     
+    # Call LLM in JSON mode
+    summary_json_str = groq_chat(
+        system_prompt,
+        user_prompt,
+        json_mode=True,
+        call_type="summarize"
+    )
+    return _finish_summary(summary_json_str, rating_stats, query_text, memory)
+
+
+async def asummarize_reviews_agent(
+    reviews_df: pd.DataFrame,
+    query_text: str,
+    memory: EnhancedMemoryManager
+) -> Dict[str, Any]:
+    """Async version of summarize_reviews_agent; prompt building runs on the CPU executor."""
+    intent = detect_query_intent(query_text)
+    memory.update_short_term(intent=intent)
+    
+    system_prompt, user_prompt, rating_stats = await run_cpu_bound(
+        _prepare_summary_prompts, reviews_df, query_text, intent
+    )
+    summary_json_str = await agroq_chat(
+        system_prompt,
+        user_prompt,
+        json_mode=True,
+        call_type="summarize"
+    )
+    return _finish_summary(summary_json_str, rating_stats, query_text, memory)
+
+
+def _prepare_advisor_prompts(
+    summary: Dict[str, Any],
+    feature_analysis: Dict[str, Any],
+    brand: Optional[str],
+    intent: str
+) -> Tuple[str, str]:
+    """Build the advisor system and user prompts."""
     if intent == "negative":
         advisor_focus = "Prioritize product improvements addressing customer complaints and vulnerabilities."
     elif intent == "positive":
@@ -461,19 +823,54 @@ Feature Analysis:
 {json.dumps(feature_analysis, indent=2)}
 """
     
-    advisor_json_str = groq_chat(system_prompt, user_prompt, json_mode=True)
+    return system_prompt, user_prompt
+
+
+def _finish_advisor(advisor_json_str: str, memory: EnhancedMemoryManager) -> Dict[str, Any]:
+    """Parse the advisor output and record it in memory."""
     advisor = json.loads(advisor_json_str)
     
+    # summary_history already has this analysis's entry (_finish_summary);
+    # the advisor output is stored with the complete analysis
     memory.update_short_term(advisor=advisor)
-    memory.add_summary({
-        "advisor_recommendations": advisor,
-        "query": memory.short_term.get("last_query", "")
-    })
-    memory.save_long_term()
     
     return advisor
 
 
+def advisor_agent(
+    summary: Dict[str, Any],
+    feature_analysis: Dict[str, Any],
+    brand: Optional[str],
+    memory: EnhancedMemoryManager,
+    intent: Optional[str] = None,
+    query: Optional[str] = None
+) -> Dict[str, Any]:
+    """Generate actionable recommendations with intent awareness."""
+    
+    # Use the request's own intent or query; short-term memory is shared across requests
+    intent = intent or (detect_query_intent(query) if query else "overall")
+    
+    system_prompt, user_prompt = _prepare_advisor_prompts(summary, feature_analysis, brand, intent)
+    advisor_json_str = groq_chat(system_prompt, user_prompt, json_mode=True, call_type="advisor")
+    return _finish_advisor(advisor_json_str, memory)
+
+
+async def aadvisor_agent(
+    summary: Dict[str, Any],
+    feature_analysis: Dict[str, Any],
+    brand: Optional[str],
+    memory: EnhancedMemoryManager,
+    intent: Optional[str] = None,
+    query: Optional[str] = None
+) -> Dict[str, Any]:
+    """Async version of advisor_agent."""
+    intent = intent or (detect_query_intent(query) if query else "overall")
+    
+    system_prompt, user_prompt = _prepare_advisor_prompts(summary, feature_analysis, brand, intent)
+    advisor_json_str = await agroq_chat(system_prompt, user_prompt, json_mode=True, call_type="advisor")
+    return _finish_advisor(advisor_json_str, memory)
+
+
 # ============================================================================
 # LANGGRAPH STATE AND NODES
 # ============================================================================
@@ -485,7 +882,9 @@ class SentimentState(TypedDict, total=False):
     max_star: Optional[int]
     
     extracted_features: Dict[str, Any]
-    retrieved: pd.DataFrame
+    retrieved: Any  # pandas DataFrame of retrieved reviews
+    summary_reviews: Any  # reviews sent to the summarizer (reranked subset, or retrieved)
+    retrieval_depth: Dict[str, Any]  # k, cutoff_score and reason chosen by retrieve
     summary: Dict[str, Any]
     feature_analysis: Dict[str, Any]
     advisor: Dict[str, Any]
@@ -493,6 +892,8 @@ class SentimentState(TypedDict, total=False):
     latency_metrics: Dict[str, float]
     faithfulness: Dict[str, Any]
     memory_context: Dict[str, Any]
+    intent: str
+    analysis_hash: str  # content hash of the stored analysis (ETag source)
 
 
 def node_extract_features(state: SentimentState) -> SentimentState:
@@ -519,10 +920,12 @@ def node_retrieve(state: SentimentState) -> SentimentState:
     retrieved = retrieve_reviews(
         query=state["user_query"],
         memory=memory,
-        k=60,
+        k=ADAPTIVE_MAX_K if ADAPTIVE_K else 60,
         brand=state.get("brand"),
         min_star=state.get("min_star"),
         max_star=state.get("max_star"),
+        adaptive=ADAPTIVE_K,
+        with_vectors=MMR_ENABLED,
     )
     elapsed = time.time() - start
     
@@ -530,6 +933,39 @@ def node_retrieve(state: SentimentState) -> SentimentState:
     latency["retrieval_time"] = round(elapsed, 3)
     
     state["retrieved"] = retrieved
+    state["retrieval_depth"] = retrieved.attrs.get("retrieval_depth", {})
+    state["latency_metrics"] = latency
+    return state
+
+
+def select_diverse_reviews(reviews_df: pd.DataFrame, n: int = MMR_TOP_N, lambda_: float = MMR_LAMBDA) -> pd.DataFrame:
+    """MMR subset of reviews (needs the "embedding" column), by rerank_score if present, else score."""
+    if len(reviews_df) <= n or "embedding" not in reviews_df.columns:
+        return reviews_df
+    relevance = reviews_df["rerank_score"] if "rerank_score" in reviews_df.columns else reviews_df["score"]
+    vectors = np.stack(reviews_df["embedding"].to_numpy())
+    with tracing.span("mmr.select", candidates=len(reviews_df), n=n):
+        selected = mmr_select(vectors, relevance.to_numpy(), n, lambda_)
+    return reviews_df.iloc[selected]
+
+
+def node_rerank(state: SentimentState) -> SentimentState:
+    """
+    Pick the reviews to summarize: cross-encoder scores if enabled, then an
+    MMR selection for diversity if enabled; by default all retrieved reviews.
+    """
+    start = time.time()
+    reviews = state["retrieved"]
+    if RERANK_ENABLED:
+        # With MMR the cross-encoder only scores; MMR does the cut
+        reviews = RERANKER.rerank(state["user_query"], reviews, None if MMR_ENABLED else RERANK_TOP_N)
+    if MMR_ENABLED:
+        reviews = select_diverse_reviews(reviews)
+    state["summary_reviews"] = reviews
+    elapsed = time.time() - start
+    
+    latency = state.get("latency_metrics", {})
+    latency["rerank_time"] = round(elapsed, 3)
     state["latency_metrics"] = latency
     return state
 
@@ -537,14 +973,15 @@ def node_retrieve(state: SentimentState) -> SentimentState:
 def node_summarize(state: SentimentState) -> SentimentState:
     """Summarize reviews."""
     start = time.time()
-    retrieved = state["retrieved"]
-    summary = summarize_reviews_agent(retrieved, state["user_query"], memory)
+    reviews = state.get("summary_reviews", state["retrieved"])
+    summary = summarize_reviews_agent(reviews, state["user_query"], memory)
     elapsed = time.time() - start
     
     latency = state.get("latency_metrics", {})
     latency["summary_time"] = round(elapsed, 3)
     
     state["summary"] = summary
+    state["intent"] = detect_query_intent(state["user_query"])
     state["latency_metrics"] = latency
     return state
 
@@ -566,7 +1003,7 @@ def node_feature_analysis(state: SentimentState) -> SentimentState:
 def node_faithfulness(state: SentimentState) -> SentimentState:
     """Calculate faithfulness score."""
     start = time.time()
-    faith = calculate_better_faithfulness(state["retrieved"], state["summary"])
+    faith = calculate_better_faithfulness(state.get("summary_reviews", state["retrieved"]), state["summary"])
     elapsed = time.time() - start
     
     latency = state.get("latency_metrics", {})
@@ -584,7 +1021,9 @@ def node_advisor(state: SentimentState) -> SentimentState:
         summary=state["summary"],
         feature_analysis=state["feature_analysis"],
         brand=state.get("brand"),
-        memory=memory
+        memory=memory,
+        intent=state.get("intent"),
+        query=state["user_query"]
     )
     elapsed = time.time() - start
     
@@ -603,8 +1042,14 @@ def node_evaluate_and_memory(state: SentimentState) -> SentimentState:
         query=state["user_query"],
         retrieved_reviews=state["retrieved"],
         summary=state["summary"],
-        advisor=state["advisor"]
+        advisor=state["advisor"],
+        target_count=state.get("retrieval_depth", {}).get("k") or 40,
+        summary_reviews=state.get("summary_reviews")
     )
+    depth = state.get("retrieval_depth", {})
+    eval_metrics["retrieval_k"] = depth.get("k")
+    eval_metrics["retrieval_cutoff_score"] = depth.get("cutoff_score")
+    eval_metrics["retrieval_k_reason"] = depth.get("reason")
     # merge improved faithfulness
     if "faithfulness" in state:
         eval_metrics["improved_faithfulness"] = state["faithfulness"]["improved_faithfulness"]
@@ -620,9 +1065,9 @@ def node_evaluate_and_memory(state: SentimentState) -> SentimentState:
     state["memory_context"] = memory.get_context()
     
     # NEW: Save complete analysis to memory
-    memory.save_complete_analysis({
+    state["analysis_hash"] = memory.save_complete_analysis({
         "query": state["user_query"],
-        "intent": memory.short_term.get("intent", "overall"),
+        "intent": state.get("intent") or detect_query_intent(state["user_query"]),
         "summary": state["summary"],
         "feature_analysis": state["feature_analysis"],
         "advisor": state["advisor"],
@@ -641,38 +1086,314 @@ def node_evaluate_and_memory(state: SentimentState) -> SentimentState:
     memory.save_long_term()
     return state
 
+# ============================================================================
+# ASYNC LANGGRAPH NODES
+# ============================================================================
+# LLM-bound nodes await the async Groq client; CPU-bound nodes reuse the sync
+# node functions on CPU_EXECUTOR.
+
+async def anode_extract_features(state: SentimentState) -> SentimentState:
+    """Extract product features from query (async)."""
+    start = time.time()
+    query = state["user_query"]
+    
+    extracted = await aextract_product_features(query)
+    brand = state.get("brand") or extracted.get("brand")
+    elapsed = time.time() - start
+    
+    latency = state.get("latency_metrics", {})
+    latency["feature_extraction_time"] = round(elapsed, 3)
+    
+    state["extracted_features"] = extracted
+    state["brand"] = brand
+    state["latency_metrics"] = latency
+    return state
+
+
+async def anode_retrieve(state: SentimentState) -> SentimentState:
+    """Retrieve relevant reviews (async)."""
+    return await run_cpu_bound(node_retrieve, state)
+
+
+async def anode_rerank(state: SentimentState) -> SentimentState:
+    """Rerank reviews for the summarizer (async)."""
+    return await run_cpu_bound(node_rerank, state)
+
+
+async def anode_feature_analysis(state: SentimentState) -> SentimentState:
+    """Analyze features (async)."""
+    return await run_cpu_bound(node_feature_analysis, state)
+
+
+async def anode_summarize(state: SentimentState) -> SentimentState:
+    """Summarize reviews (async)."""
+    start = time.time()
+    reviews = state.get("summary_reviews", state["retrieved"])
+    summary = await asummarize_reviews_agent(reviews, state["user_query"], memory)
+    elapsed = time.time() - start
+    
+    latency = state.get("latency_metrics", {})
+    latency["summary_time"] = round(elapsed, 3)
+    
+    state["summary"] = summary
+    state["intent"] = detect_query_intent(state["user_query"])
+    state["latency_metrics"] = latency
+    return state
+
+
+async def anode_faithfulness(state: SentimentState) -> SentimentState:
+    """Calculate faithfulness score (async)."""
+    return await run_cpu_bound(node_faithfulness, state)
+
+
+async def anode_advisor(state: SentimentState) -> SentimentState:
+    """Generate advisor recommendations (async)."""
+    start = time.time()
+    advisor = await aadvisor_agent(
+        summary=state["summary"],
+        feature_analysis=state["feature_analysis"],
+        brand=state.get("brand"),
+        memory=memory,
+        intent=state.get("intent"),
+        query=state["user_query"]
+    )
+    elapsed = time.time() - start
+    
+    latency = state.get("latency_metrics", {})
+    latency["advisor_time"] = round(elapsed, 3)
+    
+    state["advisor"] = advisor
+    state["latency_metrics"] = latency
+    return state
+
+
+async def anode_evaluate_and_memory(state: SentimentState) -> SentimentState:
+    """Evaluate system performance and update memory (async)."""
+    return await run_cpu_bound(node_evaluate_and_memory, state)
+
+
 # ============================================================================
 # BUILD LANGGRAPH WORKFLOW
 # ============================================================================
 
-def build_workflow():
-    """Build and compile the LangGraph workflow."""
+# groq_chat calls made by one full pipeline run (extract_features, summarize, advisor)
+LLM_CALLS_PER_ANALYSIS = 3
+
+# (node name, sync node, async node) in pipeline order
+PIPELINE_NODES = [
+    ("extract_features", node_extract_features, anode_extract_features),
+    ("retrieve", node_retrieve, anode_retrieve),
+    ("rerank", node_rerank, anode_rerank),
+    ("feature_analysis", node_feature_analysis, anode_feature_analysis),
+    ("summarize", node_summarize, anode_summarize),
+    ("faithfulness", node_faithfulness, anode_faithfulness),
+    ("advisor", node_advisor, anode_advisor),
+    ("evaluate_memory", node_evaluate_and_memory, anode_evaluate_and_memory),
+]
+
+def instrument_node(name: str, node_fn):
+    """Wrap a node in a tracing span and record its wall time in the node latency histogram."""
+    def timed_node(state: SentimentState) -> SentimentState:
+        with tracing.span(f"node.{name}"), profiling.track_thread(), NODE_LATENCY.time(node=name):
+            return node_fn(state)
+    timed_node.__name__ = node_fn.__name__
+    return timed_node
+
+
+def instrument_async_node(name: str, node_fn):
+    """Async counterpart of instrument_node."""
+    async def timed_node(state: SentimentState) -> SentimentState:
+        with tracing.span(f"node.{name}"), NODE_LATENCY.time(node=name):
+            return await node_fn(state)
+    timed_node.__name__ = node_fn.__name__
+    return timed_node
+
+
+def build_workflow(use_async: bool = False):
+    """Build and compile the LangGraph workflow (async nodes for ainvoke if use_async)."""
+    langgraph_graph = timed_import("langgraph.graph")
+    StateGraph, END = langgraph_graph.StateGraph, langgraph_graph.END
+    
     graph = StateGraph(SentimentState)
     
-    graph.add_node("extract_features", node_extract_features)
-    graph.add_node("retrieve", node_retrieve)
-    graph.add_node("summarize", node_summarize)
-    graph.add_node("feature_analysis", node_feature_analysis)
-    graph.add_node("faithfulness", node_faithfulness)
-    graph.add_node("advisor", node_advisor)
-    graph.add_node("evaluate_memory", node_evaluate_and_memory)
+    for name, sync_fn, async_fn in PIPELINE_NODES:
+        if use_async:
+            graph.add_node(name, instrument_async_node(name, async_fn))
+        else:
+            graph.add_node(name, instrument_node(name, sync_fn))
     
     # Edges (pipeline)
-    graph.set_entry_point("extract_features")
-    graph.add_edge("extract_features", "retrieve")
-    graph.add_edge("retrieve", "feature_analysis")
-    graph.add_edge("feature_analysis", "summarize")
-    graph.add_edge("summarize", "faithfulness")
-    graph.add_edge("faithfulness", "advisor")
-    graph.add_edge("advisor", "evaluate_memory")
-    graph.add_edge("evaluate_memory", END)
+    names = [name for name, _, _ in PIPELINE_NODES]
+    graph.set_entry_point(names[0])
+    for current, following in zip(names, names[1:]):
+        graph.add_edge(current, following)
+    graph.add_edge(names[-1], END)
     
     app = graph.compile()
     
-    print("LangGraph multi-agent workflow compiled.")
+    print(f"LangGraph multi-agent workflow compiled ({'async' if use_async else 'sync'}).")
     return app
 
 
+# ============================================================================
+# PIPELINE LIFECYCLE
+# ============================================================================
+
+_workflow = None
+_async_workflow = None
+_workflow_lock = threading.Lock()
+
+# Startup timings and readiness, reported by /api/ready
+STARTUP_STATS: Dict[str, Any] = {
+    "ready": False,
+    "warming_up": False,
+    "compile_time": None,
+    "warmup_time": None,
+    "warmup_steps": {},
+    "startup_time": None,
+    "first_request_latency": None,
+    "error": None,
+}
+
+# Canned LLM replies for the warm-up pass and stub mode, keyed by call_type
+_STUB_LLM_REPLIES = {
+    "extract_features": {"brand": None, "material": None, "watch_type": None, "features_mentioned": []},
+    "summarize": {"top_complaints": [], "top_praises": [], "summary_text": ""},
+    "advisor": {
+        "product_improvements": [],
+        "marketing_suggestions": [],
+        "competitive_advantages": [],
+        "risk_areas": [],
+    },
+    "compare": {"summary_text": "", "brands": {}, "feature_winners": {}, "recommendation": ""},
+}
+
+
+def _stub_llm_reply(call_type: str) -> str:
+    return json.dumps(_STUB_LLM_REPLIES.get(call_type, {}))
+
+
+def get_workflow():
+    """Return the compiled LangGraph workflow, compiling it on first use."""
+    global _workflow
+    if _workflow is None:
+        with _workflow_lock:
+            if _workflow is None:
+                start = time.time()
+                _workflow = build_workflow()
+                STARTUP_STATS["compile_time"] = round(time.time() - start, 3)
+    return _workflow
+
+
+def get_async_workflow():
+    """Return the compiled async LangGraph workflow, compiling it on first use."""
+    global _async_workflow
+    if _async_workflow is None:
+        with _workflow_lock:
+            if _async_workflow is None:
+                _async_workflow = build_workflow(use_async=True)
+    return _async_workflow
+
+
+def warm_up(
+    query: str = "how is the battery life of this watch",
+    async_workflow: bool = False
+) -> Dict[str, Any]:
+    """
+    Load resources, compile the workflow and exercise every stage once.
+    
+    Loads the lazily-initialized model, index and mapping, runs a real encode and FAISS search, then a pass through the agents with
+    a stubbed LLM and a throwaway memory store, so the first user request
+    does not pay for lazy initialization. Marks the pipeline ready when done.
+    
+    Returns:
+        STARTUP_STATS
+    """
+    STARTUP_STATS["warming_up"] = True
+    steps = STARTUP_STATS["warmup_steps"]
+    start = time.time()
+    
+    try:
+        for resource in PIPELINE_RESOURCES:
+            resource.get()
+            steps[f"load_{resource.name}"] = resource.load_time
+        
+        get_workflow()
+        steps["compile"] = STARTUP_STATS["compile_time"]
+        if async_workflow:
+            t = time.time()
+            get_async_workflow()
+            steps["compile_async"] = round(time.time() - t, 3)
+        
+        t = time.time()
+        q_emb = EMBED_MODEL.get().encode([query], convert_to_numpy=True)
+        q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
+        steps["encode"] = round(time.time() - t, 3)
+        
+        t = time.time()
+        with RETRIEVAL_STORE.get().acquire() as store:
+            store.search(q_emb, 10)
+        steps["faiss_search"] = round(time.time() - t, 3)
+        
+        t = time.time()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            scratch = EnhancedMemoryManager(
+                os.path.join(tmp_dir, "warmup_memory.json"),
+                background_writes=False
+            )
+            _llm_stub.responder = _stub_llm_reply
+            try:
+                extract_product_features(query)
+                reviews = retrieve_reviews(query, scratch, k=10)
+                if not reviews.empty:
+                    features = analyze_features(reviews, scratch)
+                    if RERANK_ENABLED:
+                        RERANKER.rerank(query, reviews)
+                    summary = summarize_reviews_agent(reviews, query, scratch)
+                    calculate_better_faithfulness(reviews, summary)
+                    advisor_agent(summary, features, None, scratch, query=query)
+            finally:
+                _llm_stub.responder = None
+        steps["stub_llm_pass"] = round(time.time() - t, 3)
+        
+        STARTUP_STATS["ready"] = True
+    except Exception as e:
+        STARTUP_STATS["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+    finally:
+        STARTUP_STATS["warming_up"] = False
+        STARTUP_STATS["warmup_time"] = round(time.time() - start, 3)
+        STARTUP_STATS["startup_time"] = round(time.time() - PROCESS_START, 3)
+    
+    print(f"Pipeline warm-up finished in {STARTUP_STATS['warmup_time']}s "
+          f"(ready={STARTUP_STATS['ready']}, steps={steps})")
+    return STARTUP_STATS
+
+
+def get_startup_report() -> Dict[str, Any]:
+    """Readiness, warm-up timings, per-resource load state and import times."""
+    return {
+        **STARTUP_STATS,
+        "module_import_time": MODULE_IMPORT_TIME,
+        "resources": {r.name: r.status() for r in PIPELINE_RESOURCES + [EMBEDDINGS, GROQ_CLIENT, ASYNC_GROQ_CLIENT]},
+        "retrieval_store": RETRIEVAL_STORE.get().stats() if RETRIEVAL_STORE.loaded else None,
+        "reranker": RERANKER.stats() if RERANK_ENABLED else None,
+        "import_times": dict(IMPORT_TIMINGS),
+    }
+
+
+def start_warm_up(async_workflow: bool = False) -> threading.Thread:
+    """Run warm_up() in a background thread so the server can start accepting health checks."""
+    thread = threading.Thread(
+        target=warm_up,
+        kwargs={"async_workflow": async_workflow},
+        name="pipeline-warmup",
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+
 # ============================================================================
 # MAIN EXECUTION FUNCTION
 # ============================================================================
@@ -695,8 +1416,8 @@ def run_multi_agent_query(
     Returns:
         Dictionary containing all results and metrics
     """
-    # Build the workflow
-    app = build_workflow()
+    request_start = time.time()
+    app = get_workflow()
     
     # Initial state
     initial_state: SentimentState = {
@@ -707,7 +1428,50 @@ def run_multi_agent_query(
     }
     
     # Run the workflow
-    result_state = app.invoke(initial_state)
+    with tracing.span("pipeline", query=user_query, brand=brand or "", mode="sync") as span:
+        result_state = app.invoke(initial_state)
+        span.set_attribute("retrieved_count", len(result_state["retrieved"]))
+    
+    return _build_query_result(user_query, result_state, request_start)
+
+
+async def arun_multi_agent_query(
+    user_query: str,
+    brand: Optional[str] = None,
+    min_star: Optional[int] = None,
+    max_star: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Async version of run_multi_agent_query for the ASGI app.
+    
+    LLM calls are awaited and CPU-bound stages run on CPU_EXECUTOR, so many
+    analyses can be in flight on one event loop.
+    """
+    request_start = time.time()
+    app = await run_cpu_bound(get_async_workflow)
+    
+    initial_state: SentimentState = {
+        "user_query": user_query,
+        "brand": brand,
+        "min_star": min_star,
+        "max_star": max_star,
+    }
+    
+    with tracing.span("pipeline", query=user_query, brand=brand or "", mode="async") as span:
+        result_state = await app.ainvoke(initial_state)
+        span.set_attribute("retrieved_count", len(result_state["retrieved"]))
+    
+    return _build_query_result(user_query, result_state, request_start)
+
+
+def _build_query_result(
+    user_query: str,
+    result_state: SentimentState,
+    request_start: float
+) -> Dict[str, Any]:
+    """Assemble the pipeline result returned to the API layer."""
+    if STARTUP_STATS["first_request_latency"] is None:
+        STARTUP_STATS["first_request_latency"] = round(time.time() - request_start, 3)
     
     # Check if retrieval failed
     if result_state["retrieved"].empty:
@@ -715,13 +1479,239 @@ def run_multi_agent_query(
     
     return {
         "query": user_query,
-        "intent": memory.short_term.get("intent", "overall"),
+        "intent": result_state.get("intent") or detect_query_intent(user_query),
         "extracted_features": result_state["extracted_features"],
         "summary": result_state["summary"],
         "feature_analysis": result_state["feature_analysis"],
         "advisor": result_state["advisor"],
-        "latency_metrics": result_state["latency_metrics"],
+        # Node timings are summed into total_latency; wall_time is end to end
+        "latency_metrics": {
+            **result_state["latency_metrics"],
+            "wall_time": round(time.time() - request_start, 3)
+        },
         "eval_metrics": result_state["eval_metrics"],
         "faithfulness": result_state["faithfulness"],
-        "retrieved_count": len(result_state["retrieved"])
+        "retrieved_count": len(result_state["retrieved"]),
+        "analysis_hash": result_state.get("analysis_hash")
+    }
+
+
+# ============================================================================
+# BRAND COMPARISON
+# ============================================================================
+# /api/compare answers one query for several brands with one encode, one
+# batched per-brand search and a single LLM call, instead of a full
+# pipeline run per brand.
+
+# Reviews retrieved per brand (upper bound when ADAPTIVE_K is on)
+COMPARE_K = int(os.getenv("WATCHSENSE_COMPARE_K", "40"))
+
+# Reviews per brand quoted in the comparison prompt
+COMPARE_PROMPT_REVIEWS = 15
+
+LLM_CALLS_PER_COMPARISON = 1
+
+
+def retrieve_brand_reviews(
+    query: str,
+    brands: List[str],
+    k: int = COMPARE_K,
+    min_star: Optional[int] = None,
+    max_star: Optional[int] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Top reviews for the query within each brand, from one query encode and
+    one SegmentedIndex.search_brands pass. Brands that do not resolve to a
+    known brand get an empty frame. Frames have the same score, weight and
+    (with MMR) embedding columns as retrieve_reviews.
+    """
+    memory.add_query(query)
+    
+    with tracing.span("embed.encode", texts=1), EMBED_LATENCY.time():
+        q_emb = EMBED_MODEL.get().encode([query], convert_to_numpy=True)
+    q_emb = q_emb / np.linalg.norm(q_emb, axis=1, keepdims=True)
+    
+    codes = {brand: BRANDS.resolve(brand) for brand in brands}
+    results = {}
+    with RETRIEVAL_STORE.get().acquire() as store:
+        store.maybe_refresh()
+        known = sorted({code for code in codes.values() if code is not None})
+        fetch = filtered_fetch(store, k, min_star, max_star)
+        with tracing.span("faiss.search_brands", k=fetch, brands=len(known)) as span, FAISS_SEARCH_LATENCY.time():
+            span.set_attribute("artifact_version", store.version)
+            hits = store.search_brands(q_emb, fetch, known)
+        
+        for brand, code in codes.items():
+            if code is None:
+                results[brand] = store.rows(np.empty(0, dtype=np.int64)).copy()
+                continue
+            scores, indices, weights, _ = trim_hits(
+                store, *hits[code], k, min_star, max_star, ADAPTIVE_K, COLLAPSE_DUPLICATES
+            )
+            frame = store.rows(indices).copy()
+            if MMR_ENABLED:
+                frame["embedding"] = list(store.vectors(indices))
+            frame["score"] = scores
+            frame["weight"] = weights
+            results[brand] = frame
+            memory.add_brand(brand)
+    return results
+
+
+def _prepare_comparison(
+    query: str,
+    brands: List[str],
+    min_star: Optional[int],
+    max_star: Optional[int]
+) -> Tuple[Dict[str, Dict[str, Any]], str, str, Dict[str, float]]:
+    """
+    Retrieve per brand and compute each brand's rating and feature stats
+    locally. Returns (per-brand results, system prompt, user prompt,
+    timings); the prompts are None when no brand has matching reviews.
+    """
+    start = time.time()
+    frames = retrieve_brand_reviews(query, brands, min_star=min_star, max_star=max_star)
+    retrieval_time = time.time() - start
+    
+    start = time.time()
+    brand_results = {}
+    sections = []
+    for brand, reviews_df in frames.items():
+        if reviews_df.empty:
+            brand_results[brand] = {"review_count": 0}
+            continue
+        stats = rating_stats(reviews_df)
+        features = feature_stats(reviews_df)
+        brand_results[brand] = {
+            "review_count": len(reviews_df),
+            "rating_stats": stats,
+            "feature_analysis": features,
+        }
+        
+        feature_lines = "\n".join(
+            f"  - {name}: {f['mention_count']} mentions, avg rating {f['avg_rating']}"
+            for name, f in features.items()
+        )
+        prompt_reviews = select_diverse_reviews(reviews_df, COMPARE_PROMPT_REVIEWS) if MMR_ENABLED else reviews_df
+        sections.append(f"""
+### {brand}
+Average rating: {stats["average"]} over {stats["total_reviews"]} reviews \
+({stats["sentiment_percentages"]["positive"]}% positive, {stats["sentiment_percentages"]["negative"]}% negative)
+Feature mentions:
+{feature_lines or "  (none)"}
+Reviews:
+{build_reviews_snippet(prompt_reviews, COMPARE_PROMPT_REVIEWS)}
+""")
+    stats_time = time.time() - start
+    timings = {"retrieval_time": round(retrieval_time, 3), "feature_analysis_time": round(stats_time, 3)}
+    
+    if not sections:
+        return brand_results, None, None, timings
+    
+    compared = [brand for brand in brands if brand_results[brand]["review_count"]]
+    system_prompt = f"""
+You are a Review Comparison Agent for watch products.
+
+Compare how customers talk about these brands for the user's query: {", ".join(compared)}.
+Base every statement on the reviews and statistics provided; the
+statistics are exact, do not restate different numbers.
+
+Return ONLY a JSON object with the following fields:
+
+1. "summary_text": a concise 3–5 sentence comparison
+2. "brands": an object keyed by brand name, each with
+    - "top_praises": list of up to {TOP_K} recurring praises
+    - "top_complaints": list of up to {TOP_K} recurring complaints
+3. "feature_winners": an object mapping each feature mentioned for more
+   than one brand to the brand customers rate best on it
+4. "recommendation": one sentence on which brand fits the query best and why
+
+Do NOT include explanations, markdown, or commentary.
+Return ONLY valid JSON.
+"""
+    user_prompt = f"""
+Query: {query}
+
+{"".join(sections)}
+"""
+    return brand_results, system_prompt, user_prompt, timings
+
+
+def _finish_comparison(
+    comparison_json_str: Optional[str],
+    query: str,
+    brand_results: Dict[str, Dict[str, Any]],
+    latency: Dict[str, float],
+    request_start: float
+) -> Dict[str, Any]:
+    """Merge the LLM's comparison with the locally computed per-brand stats."""
+    if comparison_json_str is None:
+        return {"error": "No matching reviews found for any brand."}
+    
+    comparison = json.loads(comparison_json_str)
+    llm_brands = comparison.get("brands") or {}
+    brands = []
+    for brand, result in brand_results.items():
+        insights = llm_brands.get(brand) or {}
+        brands.append({
+            "brand": brand,
+            **result,
+            "top_praises": insights.get("top_praises", []),
+            "top_complaints": insights.get("top_complaints", []),
+        })
+    
+    latency["total_latency"] = round(sum(latency.values()), 3)
+    latency["wall_time"] = round(time.time() - request_start, 3)
+    return {
+        "query": query,
+        "intent": detect_query_intent(query),
+        "brands": brands,
+        "summary_text": comparison.get("summary_text", ""),
+        "feature_winners": comparison.get("feature_winners", {}),
+        "recommendation": comparison.get("recommendation", ""),
+        "latency_metrics": latency,
     }
+
+
+def compare_brands(
+    user_query: str,
+    brands: List[str],
+    min_star: Optional[int] = None,
+    max_star: Optional[int] = None
+) -> Dict[str, Any]:
+    """Compare brands for one query: shared retrieval, local stats, one LLM call."""
+    request_start = time.time()
+    with tracing.span("compare", query=user_query, brands=",".join(brands), mode="sync"):
+        brand_results, system_prompt, user_prompt, latency = _prepare_comparison(
+            user_query, brands, min_star, max_star
+        )
+        comparison_json_str = None
+        if system_prompt is not None:
+            start = time.time()
+            comparison_json_str = groq_chat(system_prompt, user_prompt, json_mode=True, call_type="compare")
+            latency["summary_time"] = round(time.time() - start, 3)
+    return _finish_comparison(comparison_json_str, user_query, brand_results, latency, request_start)
+
+
+async def acompare_brands(
+    user_query: str,
+    brands: List[str],
+    min_star: Optional[int] = None,
+    max_star: Optional[int] = None
+) -> Dict[str, Any]:
+    """Async version of compare_brands; retrieval and stats run on the CPU executor."""
+    request_start = time.time()
+    with tracing.span("compare", query=user_query, brands=",".join(brands), mode="async"):
+        brand_results, system_prompt, user_prompt, latency = await run_cpu_bound(
+            _prepare_comparison, user_query, brands, min_star, max_star
+        )
+        comparison_json_str = None
+        if system_prompt is not None:
+            start = time.time()
+            comparison_json_str = await agroq_chat(system_prompt, user_prompt, json_mode=True, call_type="compare")
+            latency["summary_time"] = round(time.time() - start, 3)
+    return _finish_comparison(comparison_json_str, user_query, brand_results, latency, request_start)
+
+
+# How long importing this module took (heavy dependencies excluded)
+MODULE_IMPORT_TIME = round(time.time() - PROCESS_START, 3)
@@ -0,0 +1,222 @@
+import os
+import stat
+import time
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are only serialized within the process
+    fcntl = None
+
+
+# fsync policies:
+#   "always" - fsync the file and its directory on every flush
+#   "close"  - only fsync on shutdown (the final flush, or the last write)
+#   "never"  - rely on the OS to write pages back
+FSYNC_POLICIES = ("always", "close", "never")
+
+# Permissions of files created by atomic_write_text (existing files keep theirs)
+NEW_FILE_MODE = 0o644
+
+
+def atomic_write_text(path: str, text: str, fsync: bool = True):
+    """
+    Write text to path atomically.
+
+    The data goes to a temporary file in the same directory which is then
+    renamed over the target, so readers (and a crash) only ever see the old
+    or the new complete file, never a partial one. The target keeps its
+    permissions; a new file gets NEW_FILE_MODE.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # mkstemp creates the file 0600, which the rename would carry over
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync:
+        _fsync_directory(directory)
+
+
+def fsync_file(path: str):
+    """fsync an already written file and its directory entry."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def _fsync_directory(directory: str):
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive advisory lock on path + ".lock" for the block.
+
+    Serializes read-modify-write cycles on path across processes (pre-fork
+    workers) as well as threads; the lock file itself stays empty.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, NEW_FILE_MODE)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class BackgroundWriter:
+    """
+    Coalescing background writer for a single file.
+
+    Callers mark the state dirty with mark_dirty(); a daemon thread serializes
+    it with snapshot_fn and writes it atomically once flush_threshold changes
+    have accumulated or flush_interval seconds have passed since the first
+    unsaved change, whichever comes first.
+
+    With lock=True every write holds file_lock(file_path), so snapshot_fn
+    can merge in what other processes wrote before it serializes; on_written
+    runs after each write, still under the lock.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        snapshot_fn: Callable[[], str],
+        flush_interval: float = 2.0,
+        flush_threshold: int = 20,
+        fsync_policy: str = "always",
+        lock: bool = False,
+        on_written: Optional[Callable[[], None]] = None,
+    ):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}, got '{fsync_policy}'")
+
+        self.file_path = file_path
+        self.snapshot_fn = snapshot_fn
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.fsync_policy = fsync_policy
+        self.lock = lock
+        self.on_written = on_written
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending = 0
+        self._first_dirty_at: Optional[float] = None
+        self._closed = False
+        self.flush_count = 0
+        self.last_flush_at: Optional[float] = None
+
+        self._thread = threading.Thread(
+            target=self._run, name="memory-writer", daemon=True
+        )
+        self._thread.start()
+
+    def mark_dirty(self):
+        """Record a change; the write happens later on the writer thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._pending += 1
+            if self._first_dirty_at is None:
+                # Wake the writer so it starts the flush_interval timer
+                self._first_dirty_at = time.monotonic()
+                self._cond.notify()
+            elif self._pending >= self.flush_threshold:
+                self._cond.notify()
+
+    @property
+    def pending(self) -> int:
+        """Number of changes not yet written to disk."""
+        return self._pending
+
+    def flush(self, fsync: Optional[bool] = None):
+        """Write the current state now, on the calling thread."""
+        with self._cond:
+            self._pending = 0
+            self._first_dirty_at = None
+        self._write(self.fsync_policy == "always" if fsync is None else fsync)
+
+    def close(self):
+        """Stop the writer thread and flush any unsaved changes."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            had_pending = self._pending > 0
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        if had_pending or self._pending:
+            self.flush(fsync=self.fsync_policy != "never")
+        elif self.fsync_policy == "close" and self.flush_count:
+            with self._write_lock:
+                fsync_file(self.file_path)
+
+    def _run(self):
+        """Writer loop: wait for a size or time threshold, then flush."""
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending >= self.flush_threshold:
+                        break
+                    if self._first_dirty_at is not None:
+                        remaining = self.flush_interval - (time.monotonic() - self._first_dirty_at)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(timeout=remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error in background memory writer: {e}")
+                # Retry on the next change or interval rather than spinning
+                with self._cond:
+                    self._pending = max(self._pending, 1)
+                    self._first_dirty_at = time.monotonic()
+
+    def _write(self, fsync: bool):
+        """Serialize and atomically write the state."""
+        with self._write_lock, (file_lock(self.file_path) if self.lock else nullcontext()):
+            text = self.snapshot_fn()
+            atomic_write_text(self.file_path, text, fsync=fsync)
+            if self.on_written is not None:
+                self.on_written()
+            self.flush_count += 1
+            self.last_flush_at = time.time()
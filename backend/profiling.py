@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Set
+
+import telemetry
+
+
+# Seconds between stack samples while a request is being profiled
+PROFILE_INTERVAL = float(os.getenv("WATCHSENSE_PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Fraction of analyze requests profiled without being asked to (0 disables)
+PROFILE_SAMPLE_RATE = float(os.getenv("WATCHSENSE_PROFILE_SAMPLE_RATE", "0"))
+
+# Hard cap on the fraction of analyze requests that may be profiled,
+# whether requested by header/flag or sampled
+PROFILE_MAX_FRACTION = float(os.getenv("WATCHSENSE_PROFILE_MAX_FRACTION", "0.01"))
+
+PROFILE_DIR = os.getenv("WATCHSENSE_PROFILE_DIR", "profiles")
+PROFILE_MAX_STORED = int(os.getenv("WATCHSENSE_PROFILE_MAX_STORED", "50"))
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler for one request.
+
+    A daemon thread snapshots the stacks of the request's threads every
+    `interval` seconds and counts identical stacks. Nothing is hooked into
+    the profiled code, so overhead stays roughly constant however many
+    calls it makes. The output uses the folded-stack format read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._threads: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.root_thread: Optional[int] = None
+        self.duration = 0.0
+
+    def add_thread(self, thread_id: int):
+        with self._lock:
+            self._threads.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            self._threads.discard(thread_id)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self._start
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_ids = list(self._threads)
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        """Stacks in folded format: 'outer;inner;leaf count' per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+_active_profiler: contextvars.ContextVar = contextvars.ContextVar("watchsense_profiler", default=None)
+
+
+@contextmanager
+def track_thread():
+    """
+    Include the current thread in the active request's profile while the
+    block runs. Used around pipeline nodes, which LangGraph may run on its
+    own worker threads.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profiler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        # The request's own thread stays tracked until the profile ends
+        if thread_id != profiler.root_thread:
+            profiler.remove_thread(thread_id)
+
+
+class ProfileGuard:
+    """
+    Decides which requests get profiled.
+
+    Every request earns max_fraction of a token (up to one banked token) and
+    each profile spends a whole one, so no more than max_fraction of traffic
+    (plus one request) is ever profiled, however many clients ask for it.
+    At most max_concurrent profiles run at once.
+    """
+
+    def __init__(self, max_fraction: float, sample_rate: float, max_concurrent: int = 1):
+        self.max_fraction = max_fraction
+        self.sample_rate = sample_rate
+        self.max_concurrent = max_concurrent
+        self._tokens = 1.0
+        self._active = 0
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def acquire(self, requested: bool) -> Optional[str]:
+        """Return the profile reason ('requested'/'sampled') if admitted, else None."""
+        sampled = not requested and self.sample_rate > 0 and random.random() < self.sample_rate
+        with self._lock:
+            self._tokens = min(1.0, self._tokens + self.max_fraction)
+            if not (requested or sampled):
+                return None
+            if self._tokens < 1.0 or self._active >= self.max_concurrent:
+                self.denied += 1
+                return None
+            self._tokens -= 1.0
+            self._active += 1
+        return "requested" if requested else "sampled"
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+
+class ProfileStore:
+    """Profile artifacts on disk: <id>.folded stacks plus <id>.json metadata."""
+
+    def __init__(self, directory: str, max_stored: int):
+        self.directory = directory
+        self.max_stored = max_stored
+
+    def save(self, profiler: SamplingProfiler, metadata: Dict[str, Any]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        metadata = {
+            **metadata,
+            "profile_id": profile_id,
+            "created_at": time.time(),
+            "duration": round(profiler.duration, 3),
+            "samples": profiler.samples,
+            "interval_ms": profiler.interval * 1000,
+            "format": "folded",
+        }
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as f:
+            f.write(profiler.folded())
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as f:
+            json.dump(metadata, f, default=str)
+        self._prune()
+        return profile_id
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of stored profiles, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), "r") as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(profiles, key=lambda p: p.get("created_at", 0), reverse=True)
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Path of a profile's folded stacks, or None if unknown."""
+        if not profile_id.replace("_", "").isalnum():
+            return None
+        path = os.path.join(self.directory, f"{profile_id}.folded")
+        return path if os.path.exists(path) else None
+
+    def _prune(self):
+        for stale in self.list()[self.max_stored:]:
+            for ext in (".folded", ".json"):
+                try:
+                    os.unlink(os.path.join(self.directory, stale["profile_id"] + ext))
+                except OSError:
+                    pass
+
+
+GUARD = ProfileGuard(PROFILE_MAX_FRACTION, PROFILE_SAMPLE_RATE)
+STORE = ProfileStore(PROFILE_DIR, PROFILE_MAX_STORED)
+
+
+class ProfileHandle:
+    """Yielded by profile_request(); profile_id is set once the artifact is saved."""
+
+    def __init__(self, reason: Optional[str]):
+        self.reason = reason
+        self.profile_id: Optional[str] = None
+
+
+def should_profile(requested: bool) -> Optional[str]:
+    """
+    Ask the guard whether to profile this request; call once per request.
+
+    Returns 'requested' or 'sampled' if admitted, else None. An admitted
+    request must then run under profile_request(), which frees the slot.
+    """
+    reason = GUARD.acquire(requested)
+    if reason is not None:
+        telemetry.PROFILES_TAKEN.inc(reason=reason)
+    elif requested:
+        telemetry.PROFILES_DENIED.inc()
+    return reason
+
+
+@contextmanager
+def profile_request(reason: Optional[str], track_current_thread: bool = True, **metadata):
+    """
+    Profile the enclosed block on the current thread if reason is set.
+
+    On an event loop pass track_current_thread=False: the loop thread runs
+    other requests too, so only the threads that join via track_thread()
+    (pipeline nodes, CPU_EXECUTOR work) are sampled.
+
+    Yields a ProfileHandle whose profile_id names the stored artifact once
+    the block has finished.
+    """
+    handle = ProfileHandle(reason)
+    if reason is None:
+        yield handle
+        return
+
+    profiler = SamplingProfiler()
+    if track_current_thread:
+        profiler.root_thread = threading.get_ident()
+        profiler.add_thread(profiler.root_thread)
+    token = _active_profiler.set(profiler)
+    profiler.start()
+    try:
+        yield handle
+    finally:
+        profiler.stop()
+        _active_profiler.reset(token)
+        GUARD.release()
+        try:
+            handle.profile_id = STORE.save(profiler, {**metadata, "reason": reason})
+            print(f"Saved {reason} profile {handle.profile_id} ({profiler.samples} samples)")
+        except Exception as e:
+            print(f"Error saving profile: {e}")
@@ -0,0 +1,249 @@
+"""
+Compact float16 / int8 copies of the retrieval embeddings.
+
+    python quantize.py build int8              # write the int8 variants next to the base
+    python quantize.py report --queries 1000   # memory saving vs recall, per dtype
+
+For each dtype two files are written beside the float32 artifacts:
+
+    faiss_index_<dtype>.bin   FAISS scalar-quantizer index (fp16, or 8-bit
+                              with per-dimension ranges trained on the data)
+    embeddings_<dtype>.npy    the vectors themselves; int8 rows are scaled
+                              per vector, with the scales in
+                              embeddings_int8_scale.npy
+
+With WATCHSENSE_EMBEDDING_DTYPE=float16 or int8 the retrieval store loads
+the compact index instead of the float32 one. Each search over-fetches
+RERANK_FACTOR x k candidates from the compact index and reranks them by
+exact dot products against the float32 embeddings.npy, memory-mapped so
+only the candidate rows are read; the rerank therefore recovers the
+quantizer's recall loss rather than repeating it. The compact vectors are
+only a fallback for directories without embeddings.npy. The report
+command measures resident index memory and recall on held-out corpus
+vectors.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from resources import timed_import
+
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+# Serving dtype; float32 keeps the original artifacts
+EMBEDDING_DTYPE = os.getenv("WATCHSENSE_EMBEDDING_DTYPE", "float32")
+
+# Candidates fetched from a compact index per result, before the rerank
+RERANK_FACTOR = int(os.getenv("WATCHSENSE_RERANK_FACTOR", "4"))
+
+# Vectors used to train the 8-bit quantizer's per-dimension ranges
+TRAIN_SAMPLE = 100000
+
+
+def index_path(directory: str, dtype: str) -> str:
+    name = "faiss_index.bin" if dtype == "float32" else f"faiss_index_{dtype}.bin"
+    return os.path.join(directory, name)
+
+
+def embeddings_path(directory: str, dtype: str) -> str:
+    name = "embeddings.npy" if dtype == "float32" else f"embeddings_{dtype}.npy"
+    return os.path.join(directory, name)
+
+
+def scale_path(directory: str) -> str:
+    return os.path.join(directory, "embeddings_int8_scale.npy")
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-vector symmetric int8 codes and float32 scales (vector ~= codes * scale)."""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class CompactVectors:
+    """Memory-mapped compact vectors; dot() dequantizes only the rows it needs."""
+
+    def __init__(self, directory: str, dtype: str):
+        self.dtype = dtype
+        self.vectors = np.load(embeddings_path(directory, dtype), mmap_mode="r")
+        self.scales = np.load(scale_path(directory), mmap_mode="r") if dtype == "int8" else None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def rows(self, local_ids: np.ndarray) -> np.ndarray:
+        """float32 copies of the given rows."""
+        rows = np.asarray(self.vectors[local_ids], dtype=np.float32)
+        if self.scales is not None:
+            rows *= np.asarray(self.scales[local_ids])[:, None]
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+
+def load_index(directory: str, dtype: str = EMBEDDING_DTYPE):
+    """
+    The FAISS index and compact vectors to serve from a directory: the
+    compact pair for dtype if it exists there, else the float32 index and
+    no compact vectors (no rerank).
+    """
+    faiss = timed_import("faiss")
+    if dtype != "float32" and os.path.exists(index_path(directory, dtype)):
+        return faiss.read_index(index_path(directory, dtype)), CompactVectors(directory, dtype)
+    return faiss.read_index(index_path(directory, "float32")), None
+
+
+def rerank_search(index, exact_rows: Optional[Callable[[np.ndarray], np.ndarray]], query: np.ndarray, k: int,
+                  rerank_factor: int = RERANK_FACTOR) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search one query: plain FAISS search when exact_rows is None, else
+    over-fetch from the (compact) index and rerank by dot product against
+    exact_rows(local ids), the float32 vectors of the candidates.
+    Returns 1-D (scores, local ids) sorted by score, -1 ids dropped.
+    """
+    fetch = min(index.ntotal, k if exact_rows is None else k * rerank_factor)
+    D, I = index.search(query, fetch)
+    scores, ids = D[0], I[0]
+    valid = ids >= 0
+    scores, ids = scores[valid], ids[valid]
+    if exact_rows is not None and len(ids):
+        # Read the candidates in file order; a memory-mapped source then
+        # touches each page at most once
+        by_row = np.argsort(ids)
+        scores = np.empty(len(ids), dtype=np.float32)
+        scores[by_row] = exact_rows(ids[by_row]) @ query.ravel().astype(np.float32)
+        order = np.argsort(-scores, kind="stable")[:k]
+        scores, ids = scores[order], ids[order]
+    return scores, ids
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+def write_compact(directory: str, dtype: str, block_rows: int = 50000) -> Dict[str, int]:
+    """Write the compact index and vectors for dtype from directory/embeddings.npy."""
+    faiss = timed_import("faiss")
+    if dtype not in EMBEDDING_DTYPES or dtype == "float32":
+        raise ValueError(f"dtype must be float16 or int8, got {dtype!r}")
+
+    source = np.load(embeddings_path(directory, "float32"), mmap_mode="r")
+    total, dim = source.shape
+    qtype = faiss.ScalarQuantizer.QT_fp16 if dtype == "float16" else faiss.ScalarQuantizer.QT_8bit
+    index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    sample = np.random.default_rng(0).choice(total, size=min(total, TRAIN_SAMPLE), replace=False)
+    index.train(np.ascontiguousarray(source[np.sort(sample)], dtype=np.float32))
+
+    tmp_vectors = embeddings_path(directory, dtype) + ".tmp"
+    tmp_index = index_path(directory, dtype) + ".tmp"
+    tmp_scales = scale_path(directory) + ".tmp"
+    vectors = np.lib.format.open_memmap(
+        tmp_vectors, mode="w+", dtype=np.float16 if dtype == "float16" else np.int8, shape=(total, dim)
+    )
+    scales = np.lib.format.open_memmap(tmp_scales, mode="w+", dtype=np.float32, shape=(total,)) if dtype == "int8" else None
+    for start in range(0, total, block_rows):
+        block = np.ascontiguousarray(source[start:start + block_rows], dtype=np.float32)
+        index.add(block)
+        if scales is None:
+            vectors[start:start + len(block)] = block.astype(np.float16)
+        else:
+            vectors[start:start + len(block)], scales[start:start + len(block)] = quantize_int8(block)
+    vectors.flush()
+    del vectors
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_vectors, embeddings_path(directory, dtype))
+    if scales is not None:
+        scales.flush()
+        del scales
+        os.replace(tmp_scales, scale_path(directory))
+    os.replace(tmp_index, index_path(directory, dtype))
+    return {"rows": total, "dim": dim}
+
+
+def compact_dtypes(directory: str) -> List[str]:
+    """Compact dtypes already built in a directory."""
+    return [d for d in EMBEDDING_DTYPES[1:] if os.path.exists(index_path(directory, d))]
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def _index_bytes(index) -> int:
+    faiss = timed_import("faiss")
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def report(directory: str, queries: int = 1000, k: int = 40, seed: int = 0) -> Dict[str, Dict]:
+    """
+    Resident index memory and recall@k of each dtype against exact
+    float32 search, without and with the float32 rerank.
+
+    Queries are corpus vectors held out from the results: each query's
+    own row is dropped from both the exact and the compact top-k, so the
+    trivial self-match does not inflate recall.
+    """
+    faiss = timed_import("faiss")
+    source = np.load(embeddings_path(directory, "float32"), mmap_mode="r")
+    exact_index = faiss.read_index(index_path(directory, "float32"))
+    rng = np.random.default_rng(seed)
+    query_ids = np.sort(rng.choice(len(source), size=min(queries, len(source)), replace=False))
+    query_vectors = np.ascontiguousarray(source[query_ids], dtype=np.float32)
+
+    _, exact = exact_index.search(query_vectors, k + 1)
+    truth = [set(row[row != qid][:k].tolist()) for row, qid in zip(exact, query_ids)]
+
+    def exact_rows(local_ids):
+        return np.asarray(source[local_ids], dtype=np.float32)
+
+    # The float32 embeddings are memory-mapped in every mode, so the
+    # resident cost that differs between dtypes is the index
+    results = {"float32": {
+        "index_bytes": _index_bytes(exact_index),
+        "recall_at_k": 1.0,
+    }}
+    for dtype in compact_dtypes(directory):
+        index, _ = load_index(directory, dtype)
+        entry = {"index_bytes": _index_bytes(index)}
+        for label, rows in (("no_rerank", None), ("rerank", exact_rows)):
+            hits, start = 0, time.perf_counter()
+            for qid, query, expected in zip(query_ids, query_vectors, truth):
+                _, ids = rerank_search(index, rows, query[None, :], k + 1)
+                hits += len(expected & set(ids[ids != qid][:k].tolist()))
+            entry[f"recall_at_k_{label}"] = round(hits / max(1, sum(len(t) for t in truth)), 4)
+            entry[f"ms_per_query_{label}"] = round((time.perf_counter() - start) * 1000 / len(query_ids), 3)
+        entry["memory_saving"] = round(1 - entry["index_bytes"] / results["float32"]["index_bytes"], 3)
+        results[dtype] = entry
+    return {"k": k, "queries": len(query_ids), "rows": len(source), "dtypes": results}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=".", help="Artifact directory (base or version)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Write compact index and vectors")
+    build.add_argument("dtype", choices=EMBEDDING_DTYPES[1:])
+    rep = sub.add_parser("report", help="Index memory saving vs recall for each built dtype")
+    rep.add_argument("--queries", type=int, default=1000)
+    rep.add_argument("--k", type=int, default=40)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.time()
+        stats = write_compact(args.dir, args.dtype)
+        print(f"Wrote {args.dtype} artifacts for {stats['rows']:,} vectors in {time.time() - start:.1f}s")
+    else:
+        print(json.dumps(report(args.dir, args.queries, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+import telemetry
+import tracing
+
+
+# Rerank retrieved reviews with a cross-encoder before summarizing
+RERANK_ENABLED = os.getenv("WATCHSENSE_RERANK", "0") == "1"
+
+# Small CPU cross-encoder (~22M parameters)
+CROSS_ENCODER_MODEL = os.getenv("WATCHSENSE_CROSS_ENCODER", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Reviews sent to the summarizer after reranking
+RERANK_TOP_N = int(os.getenv("WATCHSENSE_RERANK_TOP_N", "20"))
+
+RERANK_BATCH_SIZE = 64
+RERANK_CACHE_SIZE = int(os.getenv("WATCHSENSE_RERANK_CACHE_SIZE", "50000"))
+
+# Reviews are truncated before scoring; the model's window is 512 tokens
+MAX_REVIEW_CHARS = 1000
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, review) pairs with a cross-encoder in one batched
+    predict() call and keeps the top_n reviews.
+
+    Scores are cached per (query, review id). Each entry also keeps a
+    hash of the review text, so an id that points at a different review
+    after a merge or artifact swap is rescored rather than reused.
+    """
+
+    def __init__(self, model_loader: Callable, cache_size: int = RERANK_CACHE_SIZE,
+                 batch_size: int = RERANK_BATCH_SIZE):
+        self._model_loader = model_loader
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def scores(self, query: str, review_ids, texts) -> np.ndarray:
+        """Cross-encoder relevance score of each review for the query."""
+        digests = [hashlib.blake2b(t.encode("utf-8"), digest_size=8).hexdigest() for t in texts]
+        scores = np.empty(len(texts), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, (review_id, digest) in enumerate(zip(review_ids, digests)):
+                cached = self._cache.get((query, int(review_id)))
+                if cached is not None and cached[0] == digest:
+                    self._cache.move_to_end((query, int(review_id)))
+                    scores[i] = cached[1]
+                else:
+                    missing.append(i)
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            pairs = [(query, texts[i][:MAX_REVIEW_CHARS]) for i in missing]
+            with tracing.span("rerank.predict", pairs=len(pairs)), telemetry.RERANK_LATENCY.time():
+                predicted = self._model_loader().predict(
+                    pairs, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False
+                )
+            scores[missing] = predicted
+            with self._lock:
+                for i, score in zip(missing, predicted):
+                    self._cache[(query, int(review_ids[i]))] = (digests[i], float(score))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, reviews_df, top_n: Optional[int] = RERANK_TOP_N):
+        """The top_n reviews (all if None) by cross-encoder score, with a rerank_score column."""
+        if reviews_df.empty:
+            return reviews_df
+        scores = self.scores(query, reviews_df.index.to_numpy(), reviews_df["review_body"].astype(str).tolist())
+        tracing.set_attribute("rerank_candidates", len(reviews_df))
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        reranked = reviews_df.iloc[order].copy()
+        reranked["rerank_score"] = scores[order]
+        return reranked
+
+    def stats(self):
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,81 @@
+import os
+import time
+import importlib
+import threading
+from typing import Callable, Dict, Any, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+# Print each heavy import and resource load as it happens
+PROFILE_STARTUP = os.getenv("WATCHSENSE_PROFILE_STARTUP", "0") == "1"
+
+# module name -> seconds spent importing it through timed_import()
+IMPORT_TIMINGS: Dict[str, float] = {}
+
+
+def timed_import(module_name: str):
+    """Import a module, recording how long the first import took."""
+    start = time.time()
+    module = importlib.import_module(module_name)
+    if module_name not in IMPORT_TIMINGS:
+        IMPORT_TIMINGS[module_name] = round(time.time() - start, 3)
+        if PROFILE_STARTUP:
+            print(f"[startup] import {module_name}: {IMPORT_TIMINGS[module_name]:.3f}s")
+    return module
+
+
+class LazyResource(Generic[T]):
+    """
+    Thread-safe holder for an expensive resource loaded on first use.
+
+    The loader runs at most once at a time; if it raises, the error is kept
+    for reporting and the next get() tries again.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], T]):
+        self.name = name
+        self._loader = loader
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_time: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        """Return the resource, loading it first if needed."""
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.time()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_time = round(time.time() - start, 3)
+                self.error = None
+                self._loaded = True
+                if PROFILE_STARTUP:
+                    print(f"[startup] load {self.name}: {self.load_time:.3f}s")
+        return self._value
+
+    def load_in_background(self) -> threading.Thread:
+        """Start loading the resource on a daemon thread."""
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                print(f"Error loading {self.name}: {e}")
+
+        thread = threading.Thread(target=load, name=f"load-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Any]:
+        return {"loaded": self._loaded, "load_time": self.load_time, "error": self.error}
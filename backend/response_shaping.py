@@ -0,0 +1,129 @@
+import gzip
+import json
+import hashlib
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: responses fall back to gzip
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: faster serialization
+    orjson = None
+
+
+# ?schema= values for /api/analyze. "full" is the original frontend payload;
+# "compact" drops the top-level copies of the advisor lists and `metrics`,
+# which duplicate `advisor` and `performance_metrics`.
+RESPONSE_SCHEMAS = ("full", "compact")
+
+COMPACT_DROPPED_FIELDS = (
+    "recommendations", "marketing_suggestions", "competitive_advantages", "risk_areas", "metrics"
+)
+
+# Bodies smaller than this are sent uncompressed; the header overhead and
+# CPU cost outweigh the savings
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def parse_shaping_params(args) -> Tuple[str, Optional[List[str]]]:
+    """
+    Read ?schema= and ?fields= from request query args.
+
+    fields is a comma-separated list of top-level or dotted paths,
+    e.g. fields=summary,advisor.risk_areas.
+
+    Raises:
+        ValueError: unknown schema
+    """
+    schema = args.get("schema") or "full"
+    if schema not in RESPONSE_SCHEMAS:
+        raise ValueError(f"schema must be one of {list(RESPONSE_SCHEMAS)}")
+    raw_fields = args.get("fields")
+    fields = [f.strip() for f in raw_fields.split(",") if f.strip()] if raw_fields else None
+    return schema, fields
+
+
+def shape_payload(payload: Dict[str, Any], schema: str = "full", fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Apply the schema, then keep only the selected fields (unknown paths are ignored)."""
+    if schema == "compact":
+        payload = {k: v for k, v in payload.items() if k not in COMPACT_DROPPED_FIELDS}
+    if not fields:
+        return payload
+
+    selected: Dict[str, Any] = {}
+    for path in fields:
+        parts = path.split(".")
+        value: Any = payload
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = selected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return selected
+
+
+def dumps(payload: Any) -> bytes:
+    """Serialize a payload to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> set:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress body with brotli or gzip if the client accepts it and it is large enough."""
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    ETag from the parts that identify one representation of a result, e.g.
+    the request key, the stored analysis's content hash, schema and fields.
+
+    Weak, because representations that differ only in timing fields, and
+    the gzip, brotli and identity encodings of a body, share it.
+    """
+    identity = "\x1f".join("" if part is None else str(part) for part in parts)
+    return 'W/"' + hashlib.sha1(identity.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
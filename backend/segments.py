@@ -0,0 +1,631 @@
+"""
+Segment-based retrieval store: the base artifacts plus small delta segments.
+
+    python segments.py list
+    python segments.py delete 1041 1042      # tombstone review ids
+    python segments.py merge                 # fold segments into the base
+
+New reviews are appended with `python ingest.py new_reviews.tsv --delta`,
+which encodes them into a segment under segments/ without touching the
+base index. Searches run over the base and every segment and merge the
+results; deleted review ids are tombstoned and filtered out. Run `merge`
+on a schedule (e.g. nightly cron) to fold segments and tombstones into a
+new base; ingest --delta also merges once more than MERGE_THRESHOLD
+segments have accumulated.
+
+Review ids are global: the base holds ids 0..base_rows-1 and each segment
+a contiguous range starting at its id_start. Segments and tombstones are
+only ever appended to a store directory. A merge renumbers ids, so it
+writes a new artifact version instead (artifacts.merge_version) and marks
+the old directory superseded; servers swap to the new version as a
+whole. A store that sees its generation change (a base rebuilt in place)
+marks itself stale rather than reloading, and ArtifactManager swaps in a
+freshly loaded one.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+from brands import BRANDS
+from dedup import load_clusters, write_clusters
+from quantize import CompactVectors, compact_dtypes, load_index, rerank_search, write_compact
+from persistence import atomic_write_text
+from resources import timed_import
+
+
+SEGMENTS_DIR = "segments"
+MANIFEST = "manifest.json"
+TOMBSTONES = "tombstones.txt"
+SEGMENT_META = "segment.json"
+LOCK_FILE = ".lock"
+
+BASE_FILES = ("faiss_index.bin", "embeddings.npy", "mapping.csv")
+
+# ingest --delta merges automatically beyond this many segments
+MERGE_THRESHOLD = 8
+
+# Minimum seconds between checks for new segments or tombstones
+REFRESH_INTERVAL_SECONDS = 30
+
+# Rows scored per matrix product in search_brands
+SCORE_BLOCK_ROWS = 65536
+
+
+# ============================================================================
+# ON-DISK LAYOUT
+# ============================================================================
+
+def segments_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, SEGMENTS_DIR)
+
+
+@contextmanager
+def store_lock(base_dir: str):
+    """
+    Exclusive lock for changes to the store (publishing a segment, adding
+    tombstones, merging), so a merge never races with ids being assigned.
+    """
+    os.makedirs(segments_dir(base_dir), exist_ok=True)
+    with open(os.path.join(segments_dir(base_dir), LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_manifest(base_dir: str) -> Dict[str, Any]:
+    """
+    Store manifest: generation (bumped when the base is rebuilt), next_id
+    (next free review id) and, once merged, the superseding version.
+    """
+    path = os.path.join(segments_dir(base_dir), MANIFEST)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"generation": 0, "next_id": None}
+
+
+def write_manifest(base_dir: str, manifest: Dict[str, Any]):
+    os.makedirs(segments_dir(base_dir), exist_ok=True)
+    atomic_write_text(os.path.join(segments_dir(base_dir), MANIFEST), json.dumps(manifest, indent=2))
+
+
+def read_tombstones(base_dir: str) -> set:
+    path = os.path.join(segments_dir(base_dir), TOMBSTONES)
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r") as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def check_not_superseded(base_dir: str):
+    """
+    Raises:
+        ValueError: the store was merged into a newer version, so changes
+            made here would never be served
+    """
+    superseded_by = read_manifest(base_dir).get("superseded_by")
+    if superseded_by:
+        raise ValueError(f"{base_dir} was merged into artifact version {superseded_by}; apply changes there")
+
+
+def mark_superseded(base_dir: str, version: str):
+    """Record that the store was merged into version; call with store_lock held."""
+    write_manifest(base_dir, {**read_manifest(base_dir), "superseded_by": version})
+
+
+def add_tombstones(base_dir: str, review_ids: List[int]):
+    """Mark review ids as deleted; they stop appearing in search results."""
+    with store_lock(base_dir):
+        check_not_superseded(base_dir)
+        with open(os.path.join(segments_dir(base_dir), TOMBSTONES), "a") as f:
+            f.write("".join(f"{int(i)}\n" for i in review_ids))
+
+
+def list_segments(base_dir: str) -> List[Dict[str, Any]]:
+    """Metadata of complete segments, oldest first."""
+    directory = segments_dir(base_dir)
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        meta_path = os.path.join(directory, name, SEGMENT_META)
+        # Segments are renamed into place complete; anything else is in progress
+        if name.startswith(".") or not os.path.exists(meta_path):
+            continue
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        meta["path"] = os.path.join(directory, name)
+        segments.append(meta)
+    return sorted(segments, key=lambda m: m["id_start"])
+
+
+def base_rows(base_dir: str) -> int:
+    faiss = timed_import("faiss")
+    return faiss.read_index(os.path.join(base_dir, "faiss_index.bin")).ntotal
+
+
+def next_review_id(base_dir: str) -> int:
+    """First unused global review id."""
+    manifest = read_manifest(base_dir)
+    segments = list_segments(base_dir)
+    if segments:
+        return segments[-1]["id_start"] + segments[-1]["rows"]
+    if manifest.get("next_id") is not None:
+        return manifest["next_id"]
+    return base_rows(base_dir)
+
+
+def new_segment_dir(base_dir: str) -> str:
+    """Hidden working directory for a segment being built."""
+    os.makedirs(segments_dir(base_dir), exist_ok=True)
+    return os.path.join(segments_dir(base_dir), f".building_{uuid.uuid4().hex[:8]}")
+
+
+def publish_segment(base_dir: str, working_dir: str, rows: int) -> str:
+    """Assign a built segment the next review ids and rename it into place."""
+    with store_lock(base_dir):
+        check_not_superseded(base_dir)
+        generation = read_manifest(base_dir)["generation"]
+        id_start = next_review_id(base_dir)
+        meta = {"id_start": id_start, "rows": rows, "generation": generation, "created_at": time.time()}
+        atomic_write_text(os.path.join(working_dir, SEGMENT_META), json.dumps(meta, indent=2))
+        final = os.path.join(segments_dir(base_dir), f"seg_{id_start:012d}")
+        os.rename(working_dir, final)
+    return final
+
+
+# ============================================================================
+# SEARCH
+# ============================================================================
+
+def _group_rows(keys: np.ndarray, id_start: int) -> Dict[int, np.ndarray]:
+    """key -> sorted global ids of the rows with that key."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    bounds = np.flatnonzero(np.diff(sorted_keys)) + 1
+    starts = np.concatenate(([0], bounds)) if len(keys) else []
+    groups = np.split(order.astype(np.int64) + id_start, bounds)
+    return {int(sorted_keys[start]): ids for start, ids in zip(starts, groups)}
+
+
+def _merge_rows(parts: List["_Part"], attr: str) -> Dict[int, np.ndarray]:
+    """Combine per-part row-id arrays; parts are in id order, so results stay sorted."""
+    keys = {key for part in parts for key in getattr(part, attr)}
+    return {
+        key: np.concatenate([getattr(part, attr)[key] for part in parts if key in getattr(part, attr)])
+        for key in keys
+    }
+
+
+def _member(ids: np.ndarray, sorted_rows: Optional[np.ndarray]) -> np.ndarray:
+    """Mask of ids present in a sorted id array (binary search, O(k log n))."""
+    if sorted_rows is None or len(sorted_rows) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_rows, ids), len(sorted_rows) - 1)
+    return sorted_rows[pos] == ids
+
+
+class _Part:
+    """
+    The base or one segment: a FAISS index, its mapping rows, and sorted
+    global row ids per brand code and per star rating for filtering.
+    """
+
+    def __init__(self, name: str, id_start: int, index, mapping, clusters: Optional[np.ndarray] = None,
+                 compact: Optional[CompactVectors] = None, embeddings: Optional[np.ndarray] = None):
+        pd = timed_import("pandas")
+        self.name = name
+        self.id_start = id_start
+        self.index = index
+        # float16/int8 vectors, set when the index is compact (quantize.py)
+        self.compact = compact
+        # Memory-mapped float32 embeddings, read only for the rows vectors() asks for
+        self.embeddings = embeddings
+        # Global review ids as the index, whatever the CSV's own index was
+        mapping.index = np.arange(id_start, id_start + len(mapping))
+
+        brand_codes = BRANDS.encode(mapping["detected_brand"].tolist())
+        mapping["detected_brand"] = pd.Categorical.from_codes(brand_codes, categories=list(BRANDS.names))
+        stars = pd.to_numeric(mapping["star_rating"], errors="coerce").fillna(0).to_numpy(dtype=np.int8)
+        self.brand_rows = _group_rows(brand_codes, id_start)
+        self.star_rows = _group_rows(stars, id_start)
+        self.mapping = mapping
+
+        # Near-duplicate clusters (dedup.py): representative id and cluster
+        # size per row; without clusters.npy every review is its own cluster
+        if clusters is None:
+            clusters = np.arange(id_start, id_start + len(mapping))
+        self.clusters = clusters
+        self.cluster_sizes = np.bincount(clusters - id_start, minlength=len(mapping))[clusters - id_start].astype(np.int32)
+
+    def vectors(self, local_ids: np.ndarray) -> np.ndarray:
+        """float32 vectors of local rows: the embeddings file, else compact copies, else the index."""
+        if self.embeddings is not None:
+            return np.asarray(self.embeddings[local_ids], dtype=np.float32)
+        if self.compact is not None:
+            return self.compact.rows(local_ids)
+        return self.index.reconstruct_batch(local_ids)
+
+    @property
+    def rerank_rows(self) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+        """Exact vectors to rerank a compact index's candidates against (None: no rerank)."""
+        return self.vectors if self.compact is not None else None
+
+    @classmethod
+    def load(cls, name: str, directory: str, id_start: int) -> "_Part":
+        pd = timed_import("pandas")
+        index, compact = load_index(directory)
+        mapping = pd.read_csv(os.path.join(directory, "mapping.csv"), index_col=0)
+        if index.ntotal != len(mapping):
+            raise ValueError(f"{name}: index has {index.ntotal} vectors but mapping has {len(mapping)} rows")
+        embeddings_file = os.path.join(directory, "embeddings.npy")
+        embeddings = np.load(embeddings_file, mmap_mode="r") if os.path.exists(embeddings_file) else None
+        return cls(name, id_start, index, mapping, load_clusters(directory, id_start, len(mapping)),
+                   compact, embeddings)
+
+
+class SegmentedIndex:
+    """
+    Base index plus delta segments, searched as one.
+
+    search() fans out to every part, drops tombstoned ids and merges the
+    results by score; rows() returns mapping rows for global review ids.
+    maybe_refresh() picks up segments and tombstones written by other
+    processes. The base is never replaced in place: if its generation
+    changes, the store turns stale and must be loaded afresh.
+    """
+
+    def __init__(self, base_dir: str = "."):
+        self.base_dir = base_dir
+        # Artifact version this store was loaded from (set by artifacts.load_version)
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        # Set once the base on disk was rebuilt; ArtifactManager then loads a new store
+        self.stale = False
+        self.generation = read_manifest(base_dir)["generation"]
+        self.base = _Part.load("base", base_dir, 0)
+        self.segments: List[_Part] = []
+        # brand code / star rating -> sorted global ids across all parts
+        self.brand_rows: Dict[int, np.ndarray] = {}
+        self.star_rows: Dict[int, np.ndarray] = {}
+        self.tombstones: set = set()
+        self._tombstones_mtime = None
+        self.refresh()
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.index.ntotal + sum(s.index.ntotal for s in self.segments)
+
+    @property
+    def parts(self) -> List[_Part]:
+        return [self.base] + self.segments
+
+    def refresh(self):
+        """Load new segments and tombstones; mark the store stale if the base was rebuilt."""
+        with self._lock:
+            if self.stale:
+                return
+            generation = read_manifest(self.base_dir)["generation"]
+            if generation != self.generation:
+                # Ids were renumbered: requests in flight keep this store as it
+                # is, and later ones get a freshly loaded store
+                print(f"Retrieval store generation {self.generation} -> {generation}, store is stale")
+                self.stale = True
+                return
+            reloaded = self._last_refresh == 0.0
+
+            known = {s.name for s in self.segments}
+            segments = list(self.segments)
+            for meta in list_segments(self.base_dir):
+                name = os.path.basename(meta["path"])
+                if name not in known and meta["generation"] == self.generation:
+                    segments.append(_Part.load(name, meta["path"], meta["id_start"]))
+                    print(f"Loaded segment {name} ({meta['rows']} reviews)")
+            if reloaded or len(segments) != len(self.segments):
+                self.segments = sorted(segments, key=lambda s: s.id_start)
+                self.brand_rows = _merge_rows(self.parts, "brand_rows")
+                self.star_rows = _merge_rows(self.parts, "star_rows")
+
+            self._last_refresh = time.time()
+            path = os.path.join(segments_dir(self.base_dir), TOMBSTONES)
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if mtime != self._tombstones_mtime:
+                self.tombstones = read_tombstones(self.base_dir)
+                self._tombstones_mtime = mtime
+
+    def maybe_refresh(self, interval: float = REFRESH_INTERVAL_SECONDS):
+        if time.time() - self._last_refresh >= interval:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing retrieval segments: {e}")
+
+    def search(self, query_emb: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, global review ids) for one query vector across all parts."""
+        parts, tombstones = self.parts, self.tombstones
+        all_scores, all_ids = [], []
+        for part in parts:
+            # Over-fetch by the number of tombstones so deletions cannot starve k
+            fetch = min(part.index.ntotal, k + len(tombstones))
+            if fetch == 0:
+                continue
+            scores, ids = rerank_search(part.index, part.rerank_rows, query_emb, fetch)
+            all_scores.append(scores)
+            all_ids.append(ids + part.id_start)
+
+        scores = np.concatenate(all_scores) if all_scores else np.empty(0, dtype=np.float32)
+        ids = np.concatenate(all_ids) if all_ids else np.empty(0, dtype=np.int64)
+        if tombstones:
+            alive = ~np.isin(ids, np.fromiter(tombstones, dtype=np.int64))
+            scores, ids = scores[alive], ids[alive]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return scores[order], ids[order]
+
+    def collapse_duplicates(self, scores: np.ndarray, review_ids: np.ndarray):
+        """
+        Keep the best-scoring review of each near-duplicate cluster.
+
+        Returns (scores, review_ids, weights) in score order, where weight
+        is the representative's cluster size across the corpus.
+        """
+        clusters = np.empty(len(review_ids), dtype=np.int64)
+        weights = np.ones(len(review_ids), dtype=np.int32)
+        for part in self.parts:
+            in_part = (review_ids >= part.id_start) & (review_ids < part.id_start + len(part.mapping))
+            local = review_ids[in_part] - part.id_start
+            clusters[in_part] = part.clusters[local]
+            weights[in_part] = part.cluster_sizes[local]
+        # Results are sorted by score, so each cluster's first hit is its best
+        _, first = np.unique(clusters, return_index=True)
+        keep = np.sort(first)
+        return scores[keep], review_ids[keep], weights[keep]
+
+    def filter_mask(
+        self,
+        review_ids: np.ndarray,
+        brand_code: Optional[int] = None,
+        min_star: Optional[int] = None,
+        max_star: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Mask of review ids matching a brand code and star range, by binary
+        search in the precomputed row-id arrays rather than string compares.
+        """
+        mask = np.ones(len(review_ids), dtype=bool)
+        if brand_code is not None:
+            mask &= _member(review_ids, self.brand_rows.get(brand_code))
+        if min_star is not None or max_star is not None:
+            in_range = np.zeros(len(review_ids), dtype=bool)
+            for star, rows in self.star_rows.items():
+                if (min_star is None or star >= min_star) and (max_star is None or star <= max_star):
+                    in_range |= _member(review_ids, rows)
+            mask &= in_range
+        return mask
+
+    def star_fraction(self, min_star: Optional[int] = None, max_star: Optional[int] = None) -> float:
+        """Fraction of rows whose star rating is within the range (tombstones included)."""
+        if self.ntotal == 0:
+            return 0.0
+        matching = sum(
+            len(rows) for star, rows in self.star_rows.items()
+            if (min_star is None or star >= min_star) and (max_star is None or star <= max_star)
+        )
+        return matching / self.ntotal
+
+    def rows(self, review_ids: np.ndarray):
+        """Mapping rows for global review ids, in the given order."""
+        pd = timed_import("pandas")
+        frames = []
+        for part in self.parts:
+            local = review_ids[(review_ids >= part.id_start) & (review_ids < part.id_start + len(part.mapping))]
+            if len(local):
+                frames.append(part.mapping.loc[local])
+        if not frames:
+            return self.base.mapping.iloc[:0]
+        return pd.concat(frames).loc[review_ids]
+
+    def vectors(self, review_ids: np.ndarray) -> np.ndarray:
+        """float32 embeddings of global review ids, in the given order."""
+        vectors = np.zeros((len(review_ids), self.base.index.d), dtype=np.float32)
+        for part in self.parts:
+            in_part = (review_ids >= part.id_start) & (review_ids < part.id_start + len(part.mapping))
+            if not in_part.any():
+                continue
+            vectors[in_part] = part.vectors(review_ids[in_part] - part.id_start)
+        return vectors
+
+    def search_brands(
+        self,
+        query_emb: np.ndarray,
+        k: int,
+        brand_codes: List[int],
+        block_rows: int = SCORE_BLOCK_ROWS
+    ) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Exact top-k (scores, global review ids) within each brand for one
+        query vector.
+
+        The rows of all requested brands are scored together in one pass
+        over their vectors, block by block, then split per brand. Unlike
+        filtering a global top-k, a brand with few reviews near the query
+        still gets its own k results. The parts' indexes are flat scans, on
+        which a FAISS id selector only filters and never prunes, so reading
+        just the brands' rows is the cheaper search.
+        """
+        q = query_emb.ravel().astype(np.float32)
+        empty = np.empty(0, dtype=np.int64)
+        brand_ids = {code: self.brand_rows.get(code, empty) for code in brand_codes}
+        ids = np.unique(np.concatenate(list(brand_ids.values()))) if brand_ids else empty
+        if self.tombstones:
+            ids = ids[~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))]
+
+        scores = np.empty(len(ids), dtype=np.float32)
+        for part in self.parts:
+            lo, hi = np.searchsorted(ids, [part.id_start, part.id_start + len(part.mapping)])
+            for start in range(lo, hi, block_rows):
+                end = min(start + block_rows, hi)
+                scores[start:end] = part.vectors(ids[start:end] - part.id_start) @ q
+
+        results = {}
+        for code, rows in brand_ids.items():
+            rows = rows[_member(rows, ids)]
+            row_scores = scores[np.searchsorted(ids, rows)]
+            order = np.argsort(-row_scores, kind="stable")[:k]
+            results[code] = (row_scores[order], rows[order])
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "stale": self.stale,
+            "base_rows": self.base.index.ntotal,
+            "segments": [{"name": s.name, "id_start": s.id_start, "rows": s.index.ntotal} for s in self.segments],
+            "tombstones": len(self.tombstones),
+            "ntotal": self.ntotal,
+        }
+
+
+# ============================================================================
+# MERGE
+# ============================================================================
+
+def merge(base_dir: str, output_dir: str, block_rows: int = 10000) -> Dict[str, Any]:
+    """
+    Fold all segments into a new base in output_dir and drop tombstoned reviews.
+
+    Streams embeddings and mapping rows part by part into the base files
+    of output_dir, a fresh directory nothing serves yet, then writes its
+    clusters, compact variants and manifest. base_dir is only read.
+    Review ids are renumbered from 0. Call with store_lock(base_dir) held
+    so no segment or tombstone is added meanwhile (artifacts.merge_version).
+    """
+    faiss = timed_import("faiss")
+    pd = timed_import("pandas")
+
+    start = time.time()
+    manifest = read_manifest(base_dir)
+    segments = [m for m in list_segments(base_dir) if m["generation"] == manifest["generation"]]
+    tombstones = read_tombstones(base_dir)
+
+    parts = [(base_dir, 0)] + [(m["path"], m["id_start"]) for m in segments]
+    embeddings = [np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r") for path, _ in parts]
+    keep_masks = [
+        ~np.isin(np.arange(id_start, id_start + len(emb)), np.fromiter(tombstones, dtype=np.int64))
+        for (_, id_start), emb in zip(parts, embeddings)
+    ]
+    total = int(sum(mask.sum() for mask in keep_masks))
+    dim = embeddings[0].shape[1]
+
+    os.makedirs(output_dir, exist_ok=True)
+    merged = np.lib.format.open_memmap(
+        os.path.join(output_dir, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(total, dim)
+    )
+    index = faiss.IndexFlatIP(dim)
+    row = 0
+    with open(os.path.join(output_dir, "mapping.csv"), "w", newline="") as mapping_file:
+        for (path, _), emb, keep in zip(parts, embeddings, keep_masks):
+            for block_start, mapping in enumerate_blocks(pd, os.path.join(path, "mapping.csv"), block_rows):
+                block_keep = keep[block_start:block_start + len(mapping)]
+                block = np.ascontiguousarray(emb[block_start:block_start + len(mapping)][block_keep], dtype=np.float32)
+                mapping = mapping[block_keep]
+                merged[row:row + len(block)] = block
+                index.add(block)
+                mapping.index = pd.RangeIndex(row, row + len(mapping))
+                mapping.to_csv(mapping_file, header=mapping_file.tell() == 0)
+                row += len(block)
+    merged.flush()
+    del merged
+    faiss.write_index(index, os.path.join(output_dir, "faiss_index.bin"))
+
+    write_clusters(output_dir)
+    for dtype in compact_dtypes(base_dir):
+        write_compact(output_dir, dtype)
+    start_generation(output_dir, total)
+
+    return {
+        "rows": total,
+        "segments_merged": len(segments),
+        "tombstones_applied": len(tombstones),
+        "time": round(time.time() - start, 1),
+    }
+
+
+def start_generation(base_dir: str, base_rows: int) -> int:
+    """
+    Record that the base was (re)built, e.g. in a new version directory.
+
+    Bumping the generation makes running servers drop a store loaded from
+    the old base; segments and tombstones from the old generation no
+    longer apply and are removed.
+    """
+    directory = segments_dir(base_dir)
+    generation = read_manifest(base_dir)["generation"] + 1
+    write_manifest(base_dir, {"generation": generation, "next_id": base_rows})
+    tombstone_path = os.path.join(directory, TOMBSTONES)
+    if os.path.exists(tombstone_path):
+        os.unlink(tombstone_path)
+    for meta in list_segments(base_dir):
+        shutil.rmtree(meta["path"], ignore_errors=True)
+    return generation
+
+
+def enumerate_blocks(pd, mapping_path: str, block_rows: int):
+    """Yield (first row offset, mapping block) for a mapping.csv read in blocks."""
+    offset = 0
+    for block in pd.read_csv(mapping_path, index_col=0, chunksize=block_rows):
+        yield offset, block
+        offset += len(block)
+
+
+def main(argv: Optional[List[str]] = None):
+    # artifacts imports this module, so only the CLI imports it back
+    import artifacts
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts-dir", default=artifacts.ARTIFACTS_DIR)
+    parser.add_argument("--version", help="Artifact version (default: the active one)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show the base, segments and tombstones")
+    delete = sub.add_parser("delete", help="Tombstone review ids")
+    delete.add_argument("review_ids", type=int, nargs="+")
+    sub.add_parser("merge", help="Fold segments and tombstones into a new, activated version")
+    args = parser.parse_args(argv)
+    version = args.version or artifacts.current_version(args.artifacts_dir)
+    args.base_dir = artifacts.version_dir(version, args.artifacts_dir)
+
+    if args.command == "list":
+        print(json.dumps({
+            "manifest": read_manifest(args.base_dir),
+            "segments": list_segments(args.base_dir),
+            "tombstones": len(read_tombstones(args.base_dir)),
+        }, indent=2))
+    elif args.command == "delete":
+        add_tombstones(args.base_dir, args.review_ids)
+        print(f"Tombstoned {len(args.review_ids)} review id(s)")
+    elif args.command == "merge":
+        print(json.dumps(artifacts.merge_version(version, args.artifacts_dir), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
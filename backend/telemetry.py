@@ -0,0 +1,345 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans fast in-process work (encode, search) up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for a labelled metric family."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        # Unlabelled counters are exported as 0 before the first increment
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def set_function(self, fn: Callable[[], Dict[Tuple[str, ...], float]]):
+        """
+        Compute the gauge at scrape time.
+
+        fn returns {label_values_tuple: value}; use {(): value} when the
+        gauge has no labels.
+        """
+        self._callback = fn
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self):
+        if self._callback is not None:
+            try:
+                items = list(self._callback().items())
+            except Exception as e:
+                print(f"Error collecting gauge {self.name}: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, tuple(map(str, k)))} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed durations."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# APPLICATION METRICS
+# ============================================================================
+
+REGISTRY = Registry()
+
+NODE_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_node_duration_seconds",
+    "Wall time of each LangGraph node.",
+    ["node"],
+))
+
+LLM_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_llm_call_duration_seconds",
+    "Wall time of groq_chat calls by call type.",
+    ["call_type"],
+))
+
+LLM_ERRORS = REGISTRY.register(Counter(
+    "watchsense_llm_call_errors_total",
+    "groq_chat calls that raised, by call type.",
+    ["call_type"],
+))
+
+EMBED_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_embed_duration_seconds",
+    "Wall time of query embedding (embed_model.encode).",
+))
+
+FAISS_SEARCH_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_faiss_search_duration_seconds",
+    "Wall time of FAISS index searches.",
+))
+
+RERANK_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_rerank_duration_seconds",
+    "Wall time of batched cross-encoder scoring (cache misses only).",
+))
+
+CACHE_HITS = REGISTRY.register(Counter(
+    "watchsense_analysis_lookup_hits_total",
+    "Stored-analysis lookups (/api/memory/analysis) that found an analysis.",
+))
+
+CACHE_MISSES = REGISTRY.register(Counter(
+    "watchsense_analysis_lookup_misses_total",
+    "Stored-analysis lookups (/api/memory/analysis) that found none.",
+))
+
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "watchsense_coalesced_requests_total",
+    "Analyze requests that shared an identical in-flight computation.",
+))
+
+LLM_CALLS_SAVED = REGISTRY.register(Counter(
+    "watchsense_llm_calls_saved_total",
+    "LLM calls avoided by coalescing identical in-flight analyze requests.",
+))
+
+JOBS_SUBMITTED = REGISTRY.register(Counter(
+    "watchsense_jobs_submitted_total",
+    "Analysis jobs submitted through /api/jobs, by priority.",
+    ["priority"],
+))
+
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "watchsense_job_queue_depth",
+    "Analysis jobs waiting for a worker, by priority.",
+    ["priority"],
+))
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "watchsense_admission_queue_depth",
+    "Analysis requests waiting for an admission slot, by path (uncached/cached).",
+    ["path"],
+))
+
+ADMISSION_ACTIVE = REGISTRY.register(Gauge(
+    "watchsense_admission_active",
+    "Analysis requests holding an admission slot, by path (uncached/cached).",
+    ["path"],
+))
+
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "watchsense_admission_rejections_total",
+    "Analysis requests shed by admission control, by path and reason.",
+    ["path", "reason"],
+))
+
+ADMISSION_WAIT = REGISTRY.register(Histogram(
+    "watchsense_admission_wait_seconds",
+    "Time admitted analysis requests spent queued for a slot, by path.",
+    ["path"],
+))
+
+PROFILES_TAKEN = REGISTRY.register(Counter(
+    "watchsense_profiles_total",
+    "Analyze requests run under the sampling profiler, by reason (requested/sampled).",
+    ["reason"],
+))
+
+PROFILES_DENIED = REGISTRY.register(Counter(
+    "watchsense_profiles_denied_total",
+    "Profiling requests refused by the traffic-fraction guard.",
+))
+
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "watchsense_http_request_duration_seconds",
+    "Wall time of API requests by endpoint and status.",
+    ["endpoint", "status"],
+))
+
+INFLIGHT_REQUESTS = REGISTRY.register(Gauge(
+    "watchsense_inflight_requests",
+    "API requests currently being processed, by endpoint.",
+    ["endpoint"],
+))
+
+MEMORY_STORE_ENTRIES = REGISTRY.register(Gauge(
+    "watchsense_memory_store_entries",
+    "Entries held in each long-term memory list.",
+    ["store"],
+))
+
+MEMORY_STORE_BYTES = REGISTRY.register(Gauge(
+    "watchsense_memory_store_bytes",
+    "Size of the persisted memory file on disk.",
+))
@@ -0,0 +1,86 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# The backend modules are imported by name, as the apps import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashingEncoder:
+    """Bag-of-words vectors hashed into a few dimensions; stands in for the sentence model."""
+
+    dim = 32
+
+    def __init__(self, workers: int = 1, batch_size: int = 64):
+        pass
+
+    def encode(self, texts):
+        emb = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                emb[row, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+    def close(self):
+        pass
+
+
+BRAND_TITLES = {"Casio": "Casio G-Shock", "Seiko": "Seiko 5", "Timex": "Timex Weekender"}
+WORDS = "strap band battery display design comfort water time dial crown glass light heavy great poor".split()
+
+
+def synthetic_reviews(count: int, seed: int):
+    """Rows of (product_title, review_body, star_rating) spread over BRAND_TITLES."""
+    rng = np.random.RandomState(seed)
+    titles = list(BRAND_TITLES.values())
+    return [
+        (titles[i % len(titles)], " ".join(rng.choice(WORDS, size=rng.randint(4, 10))), int(rng.randint(1, 6)))
+        for i in range(count)
+    ]
+
+
+def write_dump(path, rows):
+    with open(path, "w") as f:
+        f.write("product_title\treview_body\tstar_rating\n")
+        for title, body, stars in rows:
+            f.write(f"{title}\t{body}\t{stars}\n")
+    return str(path)
+
+
+@pytest.fixture
+def artifacts_dir(tmp_path):
+    return str(tmp_path / "artifacts")
+
+
+@pytest.fixture
+def ingest_reviews(tmp_path, monkeypatch, artifacts_dir):
+    """
+    Run ingest.py over a synthetic dump of `count` reviews, encoded with
+    HashingEncoder; extra arguments are passed on (--version, --delta, ...).
+    """
+    import ingest
+
+    monkeypatch.setattr(ingest, "Encoder", HashingEncoder)
+
+    def run(name: str, count: int, seed: int, *args: str):
+        dump = write_dump(tmp_path / f"{name}.tsv", synthetic_reviews(count, seed))
+        ingest.main([dump, "--artifacts-dir", artifacts_dir, "--workers", "1",
+                     "--chunk-size", "25", "--compact", "float32", *args])
+
+    return run
+
+
+@pytest.fixture
+def review_store(ingest_reviews, artifacts_dir):
+    """
+    Artifact version "v1", built and activated by ingest.py: a 60-row base
+    plus one 30-row delta segment. Returns the version directory.
+    """
+    import artifacts
+
+    ingest_reviews("base", 60, 1, "--version", "v1", "--activate")
+    ingest_reviews("delta", 30, 2, "--delta")
+    return artifacts.version_dir("v1", artifacts_dir)
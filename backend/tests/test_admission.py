@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import (
+    AdmissionController,
+    AdmissionRejected,
+    AsyncAdmissionController,
+    analysis_admission_from_env,
+)
+
+
+def hold_slot(controller, release: threading.Event) -> threading.Thread:
+    """Occupy one slot from another thread until release is set."""
+    admitted = threading.Event()
+
+    def run():
+        with controller.admit():
+            admitted.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert admitted.wait(5)
+    return thread
+
+
+def test_full_queue_is_rejected_immediately():
+    controller = AdmissionController("test", max_concurrent=1, max_queued=0, queue_timeout=5)
+    release = threading.Event()
+    holder = hold_slot(controller, release)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.admit():
+                pass
+        assert time.perf_counter() - start < 1
+        assert (excinfo.value.status_code, excinfo.value.reason) == (429, "queue_full")
+        assert excinfo.value.retry_after >= 1
+    finally:
+        release.set()
+        holder.join()
+    assert controller.stats()["rejected"] == 1
+
+
+def test_queued_request_times_out():
+    controller = AdmissionController("test", max_concurrent=1, max_queued=1, queue_timeout=0.05)
+    release = threading.Event()
+    holder = hold_slot(controller, release)
+    try:
+        with pytest.raises(AdmissionRejected) as excinfo:
+            with controller.admit():
+                pass
+        assert (excinfo.value.status_code, excinfo.value.reason) == (503, "queue_timeout")
+        assert controller.queued == 0
+    finally:
+        release.set()
+        holder.join()
+
+
+def test_queued_request_gets_the_released_slot():
+    controller = AdmissionController("test", max_concurrent=1, max_queued=1, queue_timeout=5)
+    release = threading.Event()
+    holder = hold_slot(controller, release)
+    threading.Timer(0.05, release.set).start()
+    with controller.admit():
+        assert controller.active == 1
+    holder.join()
+    assert controller.stats()["admitted"] == 2
+    assert controller.active == 0
+
+
+def test_async_controller_queues_then_sheds():
+    async def scenario():
+        controller = AsyncAdmissionController("test", max_concurrent=1, max_queued=1, queue_timeout=0.05)
+        release = asyncio.Event()
+        admitted = asyncio.Event()
+
+        async def hold():
+            async with controller.admit():
+                admitted.set()
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await admitted.wait()
+
+        waiter = asyncio.ensure_future(controller.admit().__aenter__())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            async with controller.admit():
+                pass
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await waiter
+        release.set()
+        await holder
+        async with controller.admit():
+            pass
+        return controller, full.value, timed_out.value
+
+    controller, full, timed_out = asyncio.run(scenario())
+    assert (full.status_code, timed_out.status_code) == (429, 503)
+    assert (controller.active, controller.queued) == (0, 0)
+    assert controller.stats()["admitted"] == 2
+
+
+def test_budgets_from_env(monkeypatch):
+    monkeypatch.setenv("WATCHSENSE_MAX_CONCURRENT_ANALYSES", "3")
+    monkeypatch.setenv("WATCHSENSE_MAX_QUEUED_CACHED", "7")
+    budgets = analysis_admission_from_env(AsyncAdmissionController)
+    assert set(budgets) == {"uncached", "cached"}
+    assert isinstance(budgets["cached"], AsyncAdmissionController)
+    assert budgets["uncached"].max_concurrent == 3
+    assert budgets["cached"].max_queued == 7
+    assert budgets["cached"].max_concurrent > budgets["uncached"].max_concurrent
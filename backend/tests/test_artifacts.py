@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import artifacts
+import segments
+from conftest import HashingEncoder
+
+
+def test_swap_drains_the_old_store_after_its_last_reader(review_store, artifacts_dir, ingest_reviews):
+    manager = artifacts.ArtifactManager(artifacts_dir, poll_seconds=3600).load_current()
+    released = []
+    manager._released = released.append
+    query = HashingEncoder().encode(["battery strap"])
+
+    with manager.acquire() as old:
+        ingest_reviews("v2", 40, 3, "--version", "v2", "--activate")
+        assert manager.reload(background=False)
+        assert manager.version == "v2"
+        assert manager.stats()["draining"] == [{"version": "v1", "readers": 1}]
+        # The request that took the old store keeps searching it
+        assert old.version == "v1"
+        assert len(old.search(query, 5)[1]) == 5
+        with manager.acquire() as new:
+            assert new.version == "v2" and new.ntotal == 40
+        assert released == []
+
+    assert released == ["v1"]
+    assert manager.stats()["draining"] == []
+
+
+def test_swap_without_readers_releases_at_once(review_store, artifacts_dir, ingest_reviews):
+    manager = artifacts.ArtifactManager(artifacts_dir, poll_seconds=3600).load_current()
+    released = []
+    manager._released = released.append
+    ingest_reviews("v2", 40, 3, "--version", "v2", "--activate")
+    assert manager.reload(background=False)
+    assert released == ["v1"]
+    # Reloading the active version is a no-op
+    assert not manager.reload(background=False)
+
+
+def test_corrupt_version_keeps_the_old_store_serving(review_store, artifacts_dir, ingest_reviews):
+    manager = artifacts.ArtifactManager(artifacts_dir, poll_seconds=3600).load_current()
+    ingest_reviews("v2", 40, 3, "--version", "v2")
+    with open(f"{artifacts.version_dir('v2', artifacts_dir)}/mapping.csv", "a") as f:
+        f.write("999,tampered,5,Casio\n")
+    manager.reload("v2", background=False)
+    assert manager.version == "v1"
+    assert "Checksum mismatch" in manager.last_error
+
+
+def test_merge_folds_segments_and_tombstones_into_a_new_version(review_store, artifacts_dir):
+    segments.add_tombstones(review_store, [2, 70])
+    stats = artifacts.merge_version("v1", artifacts_dir)
+
+    assert (stats["rows"], stats["segments_merged"], stats["tombstones_applied"]) == (88, 1, 2)
+    assert artifacts.current_version(artifacts_dir) == stats["version"]
+    merged = artifacts.load_version(stats["version"], artifacts_dir)
+    assert (merged.ntotal, merged.segments, merged.tombstones) == (88, [], set())
+
+    old = segments.SegmentedIndex(review_store)
+    live = np.array(sorted(set(range(90)) - {2, 70}))
+    assert np.allclose(merged.vectors(np.arange(88)), old.vectors(live))
+    with pytest.raises(ValueError):
+        segments.add_tombstones(review_store, [1])
@@ -0,0 +1,29 @@
+import numpy as np
+
+from brands import BRAND_ALIASES, UNKNOWN_BRAND, BrandTable
+
+
+def make_table():
+    return BrandTable([UNKNOWN_BRAND, *BRAND_ALIASES])
+
+
+def test_encode_maps_spellings_to_the_canonical_code():
+    brands = make_table()
+    codes = brands.encode(["Casio", "casio", "CASIO", "g-shock", "Casio watches"])
+    assert codes.tolist() == [brands.resolve("casio")] * 5
+    assert len(brands.names) == len(BRAND_ALIASES) + 1
+
+
+def test_encode_registers_new_brands_once():
+    brands = make_table()
+    codes = brands.encode(["Rolex", "rolex", "ROLEX"])
+    assert len(set(codes.tolist())) == 1
+    assert brands.names[codes[0]] == "Rolex"
+    assert brands.resolve("rolex") == codes[0]
+
+
+def test_encode_missing_values_are_unknown():
+    brands = make_table()
+    unknown = brands.code(UNKNOWN_BRAND)
+    codes = brands.encode([None, np.nan, "", "  "])
+    assert codes.tolist() == [unknown] * 4
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import dedup
+
+
+def test_batched_signatures_match_per_text():
+    hasher = dedup.MinHasher()
+    texts = ["Great watch, love it", "", None, "the strap broke after a week of wear", "a"]
+    expected = np.stack([hasher.signature(t) for t in texts])
+    assert np.array_equal(hasher.signatures(texts), expected)
+
+
+def test_write_clusters_groups_near_duplicates(tmp_path):
+    template = "this watch keeps perfect time and the strap is very comfortable to wear all day long"
+    bodies = [
+        template,
+        "the battery died after two weeks and support never answered my emails",
+        template + " really",
+        template,
+    ]
+    pd.DataFrame({"review_body": bodies, "star_rating": [5, 1, 5, 4]}).to_csv(tmp_path / "mapping.csv")
+
+    stats = dedup.write_clusters(str(tmp_path), chunk_size=2)
+
+    clusters = np.load(tmp_path / dedup.CLUSTERS_FILE)
+    assert clusters.tolist() == [0, 1, 0, 0]
+    assert stats["duplicates"] == 2
+    assert sorted(os.listdir(tmp_path)) == ["clusters.npy", "mapping.csv"]
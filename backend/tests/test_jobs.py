@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager, JobQueueFull
+
+
+def wait_for(job_manager, job_id, status="completed", timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_manager.get(job_id)
+        if job and job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {job_manager.get(job_id)}")
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def stored_job(jobs_dir, job_id, status, owner_pid):
+    job = {
+        "job_id": job_id, "status": status, "priority": "batch", "spec": {"query": job_id},
+        "created_at": time.time(), "started_at": time.time(), "finished_at": None,
+        "result": None, "error": None, "owner_pid": owner_pid,
+    }
+    os.makedirs(jobs_dir, exist_ok=True)
+    with open(os.path.join(jobs_dir, f"{job_id}.json"), "w") as f:
+        json.dump(job, f)
+
+
+def test_job_result_is_readable_from_another_manager(tmp_path):
+    jobs_dir = str(tmp_path / "jobs")
+    manager = JobManager(lambda spec: {"echo": spec["query"]}, jobs_dir=jobs_dir, workers=1)
+    job = manager.submit({"query": "battery life"})
+    wait_for(manager, job["job_id"])
+
+    other = JobManager(lambda spec: {}, jobs_dir=jobs_dir, workers=1)
+    assert other.get(job["job_id"])["result"] == {"echo": "battery life"}
+
+
+def test_orphaned_jobs_are_resumed(tmp_path):
+    jobs_dir = str(tmp_path / "jobs")
+    stored_job(jobs_dir, "orphan", "running", dead_pid())
+    stored_job(jobs_dir, "alive", "running", os.getppid())
+    ran = []
+    manager = JobManager(lambda spec: ran.append(spec["query"]) or {"ok": True}, jobs_dir=jobs_dir, workers=1)
+    manager.start()
+
+    job = wait_for(manager, "orphan")
+    assert job["resumed"] == 1
+    assert job["owner_pid"] == os.getpid()
+    # A job whose owner is still alive is left to that process
+    assert manager.get("alive")["status"] == "running"
+    assert ran == ["orphan"]
+
+
+def test_interactive_jobs_overtake_batch_jobs(tmp_path):
+    started, release, order = threading.Event(), threading.Event(), []
+
+    def runner(spec):
+        if spec["query"] == "first":
+            started.set()
+            release.wait(5)
+        order.append(spec["query"])
+        return {}
+
+    manager = JobManager(runner, jobs_dir=str(tmp_path / "jobs"), workers=1)
+    first = manager.submit({"query": "first"}, priority="batch")
+    assert started.wait(5)
+    batch = manager.submit({"query": "batch"}, priority="batch")
+    interactive = manager.submit({"query": "interactive"}, priority="interactive")
+    release.set()
+    for job in (first, batch, interactive):
+        wait_for(manager, job["job_id"])
+    assert order == ["first", "interactive", "batch"]
+
+
+def test_submit_rejects_when_full_and_bad_priority(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def runner(spec):
+        started.set()
+        release.wait(5)
+        return {}
+
+    manager = JobManager(runner, jobs_dir=str(tmp_path / "jobs"), workers=1, max_queued=1)
+    try:
+        with pytest.raises(ValueError):
+            manager.submit({"query": "q"}, priority="urgent")
+        manager.submit({"query": "running"})
+        assert started.wait(5)
+        manager.submit({"query": "queued"})
+        with pytest.raises(JobQueueFull):
+            manager.submit({"query": "rejected"})
+    finally:
+        release.set()
@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+
+import pytest
+
+from memory_manager import EnhancedMemoryManager
+
+
+def open_memory(path, background_writes=False):
+    return EnhancedMemoryManager(str(path), background_writes=background_writes, fsync_policy="never")
+
+
+def stored_queries(path):
+    with open(path) as f:
+        return sorted(entry["query"] for entry in json.load(f)["query_history"])
+
+
+def write_queries(path, worker, count, background_writes):
+    memory = open_memory(path, background_writes)
+    for i in range(count):
+        memory.add_query(f"{worker}-{i}")
+        memory.save_long_term()
+    memory.close()
+
+
+@pytest.mark.parametrize("background_writes", [False, True])
+def test_processes_writing_one_file_keep_each_others_entries(tmp_path, background_writes):
+    path = tmp_path / "memory.json"
+    open_memory(path).save_long_term()
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=write_queries, args=(path, worker, 15, background_writes))
+        for worker in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+        assert process.exitcode == 0
+    assert stored_queries(path) == sorted(f"{w}-{i}" for w in range(4) for i in range(15))
+
+
+def test_removals_elsewhere_stay_removed(tmp_path):
+    path = tmp_path / "memory.json"
+    first, second = open_memory(path), open_memory(path)
+    first.add_query("old")
+    first.save_long_term()
+
+    second.clear_memory()
+    first.add_query("new")
+    first.save_long_term()
+
+    assert stored_queries(path) == ["new"]
+    second.refresh()
+    assert [entry["query"] for entry in second.long_term["query_history"]] == ["new"]
+
+
+def test_analyses_are_deduplicated_by_content_hash(tmp_path):
+    memory = open_memory(tmp_path / "memory.json")
+    analysis = {"query": "Strap Quality", "summary": {"summary_text": "Sturdy."}}
+    first = memory.save_complete_analysis({**analysis, "timestamp": "t1", "latency": {"total": 1.0}})
+    second = memory.save_complete_analysis({**analysis, "timestamp": "t2", "latency": {"total": 2.0}})
+
+    assert first == second
+    assert len(memory.long_term["complete_analyses"]) == 1
+    stored = memory.get_analysis_by_query("  strap   quality ")
+    assert (stored["content_hash"], stored["timestamp"]) == (first, "t2")
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from notebook_code import feature_stats, rating_stats
+
+
+def reviews(weights):
+    return pd.DataFrame({
+        "review_body": ["great strap", "strap broke", "fine"],
+        "star_rating": [5, 1, 3],
+        "weight": weights,
+    })
+
+
+def test_rating_stats_count_collapsed_duplicates():
+    stats = rating_stats(reviews([3, 1, 1]))
+    assert stats["total_reviews"] == 5
+    assert stats["average"] == round((5 * 3 + 1 + 3) / 5, 2)
+    assert stats["distribution"] == {1: 1, 3: 1, 5: 3}
+    assert stats["sentiment_percentages"]["positive"] == 60.0
+
+
+def test_feature_stats_count_collapsed_duplicates():
+    strap = feature_stats(reviews([3, 1, 1]))["strap"]
+    assert strap["mention_count"] == 4
+    assert strap["sentiment"] == {"positive": 3, "negative": 1, "neutral": 0}
+    assert strap["avg_rating"] == 4.0
+
+
+def test_stats_without_weights_count_rows():
+    stats = rating_stats(reviews([1, 1, 1]).drop(columns="weight"))
+    assert stats["total_reviews"] == 3
+    assert stats["average"] == 3.0
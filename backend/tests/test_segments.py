@@ -0,0 +1,72 @@
+import numpy as np
+
+import segments
+from brands import BRANDS
+from conftest import HashingEncoder
+
+
+def brute_force_brand_top_k(store, query, k, code):
+    ids = np.arange(store.ntotal)
+    ids = ids[store.filter_mask(ids, brand_code=code)]
+    ids = np.array([i for i in ids if i not in store.tombstones], dtype=np.int64)
+    scores = store.vectors(ids) @ query
+    order = np.argsort(-scores, kind="stable")[:k]
+    return scores[order], ids[order]
+
+
+def test_search_brands_matches_brute_force(review_store):
+    segments.add_tombstones(review_store, [0, 3, 61, 75])
+    store = segments.SegmentedIndex(review_store)
+    assert len(store.segments) == 1
+    query = HashingEncoder().encode(["strap comfort battery"])[0]
+    codes = [BRANDS.resolve(brand) for brand in ("casio", "seiko", "timex")]
+
+    for k in (3, 10, 40):
+        results = store.search_brands(query, k, codes)
+        for code in codes:
+            scores, ids = results[code]
+            expected_scores, expected_ids = brute_force_brand_top_k(store, query, k, code)
+            assert 0 < len(expected_ids) <= k
+            assert np.allclose(scores, expected_scores, atol=1e-6)
+            assert ids.tolist() == expected_ids.tolist()
+            assert not set(ids.tolist()) & store.tombstones
+
+
+def test_ingest_builds_a_searchable_base_and_segment(review_store):
+    store = segments.SegmentedIndex(review_store)
+    assert store.stats()["base_rows"] == 60
+    assert [(s["id_start"], s["rows"]) for s in store.stats()["segments"]] == [(60, 30)]
+
+    # A review's own text is its nearest neighbour, in the base and in the segment
+    for review_id in (7, 72):
+        body = store.rows(np.array([review_id]))["review_body"].iloc[0]
+        scores, ids = store.search(HashingEncoder().encode([body]), 5)
+        assert review_id in ids[scores > 1 - 1e-5]
+
+
+def test_search_skips_tombstoned_reviews(review_store):
+    segments.add_tombstones(review_store, [5, 64])
+    store = segments.SegmentedIndex(review_store)
+    scores, ids = store.search(HashingEncoder().encode(["strap battery"]), store.ntotal)
+    assert sorted(ids.tolist()) == sorted(set(range(90)) - {5, 64})
+    assert np.all(np.diff(scores) <= 1e-6)
+
+
+def test_new_tombstones_are_picked_up_on_refresh(review_store):
+    store = segments.SegmentedIndex(review_store)
+    segments.add_tombstones(review_store, [1])
+    store.refresh()
+    assert store.tombstones == {1}
+
+
+def test_filter_mask_matches_mapping_rows(review_store):
+    store = segments.SegmentedIndex(review_store)
+    ids = np.arange(store.ntotal)
+    mapping = store.rows(ids)
+    seiko = BRANDS.resolve("Seiko watches")
+
+    mask = store.filter_mask(ids, brand_code=seiko, min_star=4)
+    expected = (mapping["detected_brand"] == "Seiko") & (mapping["star_rating"] >= 4)
+    assert mask.tolist() == expected.tolist()
+    assert mask.any()
+    assert store.star_fraction(min_star=4) == (mapping["star_rating"] >= 4).mean()
@@ -0,0 +1,39 @@
+import numpy as np
+
+from notebook_code import select_depth
+
+
+def test_threshold_cuts_a_curve_without_elbow():
+    scores = np.linspace(0.9, 0.1, 17)  # steps of 0.05, no knee
+    depth = select_depth(scores, min_k=1, max_k=100, threshold=0.5)
+    assert depth == {"k": 9, "cutoff_score": 0.5, "reason": "threshold"}
+
+
+def test_elbow_cuts_before_the_knee():
+    scores = np.array([0.9] * 5 + [0.35] * 15)
+    depth = select_depth(scores, min_k=1, max_k=100, threshold=0.3)
+    assert depth == {"k": 5, "cutoff_score": 0.9, "reason": "elbow"}
+
+
+def test_min_k_keeps_results_below_the_threshold():
+    scores = np.linspace(0.2, 0.1, 10)
+    depth = select_depth(scores, min_k=3, max_k=100, threshold=0.5)
+    assert depth["k"] == 3
+    assert depth["reason"] == "min_k"
+    assert depth["cutoff_score"] == round(float(scores[2]), 4)
+
+
+def test_max_k_caps_the_depth():
+    scores = np.linspace(0.9, 0.6, 50)
+    depth = select_depth(scores, min_k=1, max_k=10, threshold=0.3)
+    assert depth["k"] == 10
+    assert depth["reason"] == "max_k"
+
+
+def test_zero_min_k_without_hits_has_no_cutoff():
+    depth = select_depth(np.linspace(0.2, 0.1, 10), min_k=0, max_k=100, threshold=0.5)
+    assert depth == {"k": 0, "cutoff_score": None, "reason": "threshold"}
+
+
+def test_empty_scores():
+    assert select_depth(np.empty(0))["reason"] == "empty"
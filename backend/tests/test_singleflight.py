@@ -0,0 +1,145 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(flights.do("k", fn)))
+    waiter.start()
+    while flights.stats["shared"] == 0:
+        pass
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("result", False), ("result", True)]
+    assert flights.in_flight() == 0
+
+
+def test_error_reaches_waiters():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do("k", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    while flights.stats["shared"] == 0:
+        pass
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+
+    assert len(errors) == 2
+    # The key is released, so the next call runs again
+    assert flights.do("k", lambda: 1) == (1, False)
+
+
+def test_async_calls_share_one_execution():
+    async def main():
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", fn) for _ in range(3)))
+        return calls, results, flights.in_flight()
+
+    calls, results, in_flight = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True]
+    assert all(result == "result" for result, _ in results)
+    assert in_flight == 0
+
+
+def test_async_error_reaches_waiters():
+    async def main():
+        flights = AsyncSingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flights.do("k", fn) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_async_leader_cancel_does_not_fail_waiters():
+    async def main():
+        flights = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flights.do("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.do("k", fn))
+        await asyncio.sleep(0)
+
+        # The leader's client disconnects
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        release.set()
+        return await waiter
+
+    assert asyncio.run(main()) == ("result", True)
+
+
+def test_async_waiter_cancel_does_not_cancel_the_call():
+    async def main():
+        flights = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flights.do("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.do("k", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        return await leader
+
+    assert asyncio.run(main()) == ("result", False)
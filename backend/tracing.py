@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+
+# Fraction of traces recorded; child spans follow their root's decision
+TRACE_SAMPLE_RATE = float(os.getenv("WATCHSENSE_TRACE_SAMPLE_RATE", "0.1"))
+
+# Finished traces are appended here as JSON lines (one span per line)
+TRACE_FILE = os.getenv("WATCHSENSE_TRACE_FILE", "traces.jsonl")
+
+# If set, traces are also POSTed to this OTLP/HTTP JSON endpoint,
+# e.g. http://localhost:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.getenv("WATCHSENSE_TRACE_OTLP_ENDPOINT")
+
+SERVICE_NAME = "watchsense-backend"
+
+
+class Span:
+    """A timed operation within a trace, with attributes and a parent span."""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_time", "end_time",
+                 "_start_perf", "duration", "attributes", "status")
+
+    def __init__(self, trace: "_Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_time = time.time()
+        self._start_perf = time.perf_counter()
+        self.end_time: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.attributes = dict(attributes)
+        self.status = "ok"
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        self.duration = time.perf_counter() - self._start_perf
+        self.end_time = self.start_time + self.duration
+        self.trace.finish_span(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled traces; records nothing."""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    """Spans of one sampled trace, exported together when the root span ends."""
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Span:
+        return Span(self, name, parent_id, attributes)
+
+    def finish_span(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if span.parent_id is not None:
+                return
+            spans = [s.to_dict() for s in self.spans]
+        EXPORTER.export(spans)
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("watchsense_span", default=None)
+
+
+def current_span():
+    """The active span in this context, or a no-op span."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def set_attribute(key: str, value: Any):
+    """Set an attribute on the active span, if any."""
+    current_span().set_attribute(key, value)
+
+
+@contextmanager
+def span(name: str, sample_rate: Optional[float] = None, **attributes):
+    """
+    Time a block as a span.
+
+    Nested spans become children of the active span. A span with no active
+    parent starts a new trace, which is recorded with probability
+    sample_rate (TRACE_SAMPLE_RATE by default); spans inside an unsampled
+    trace cost only a context variable lookup.
+    """
+    parent = _current_span.get()
+    if parent is NOOP_SPAN:
+        yield NOOP_SPAN
+        return
+
+    if parent is None:
+        rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        if random.random() >= rate:
+            token = _current_span.set(NOOP_SPAN)
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current_span.reset(token)
+            return
+        new_span = _Trace().start_span(name, None, attributes)
+    else:
+        new_span = parent.trace.start_span(name, parent.span_id, attributes)
+
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.status = "error"
+        new_span.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end()
+
+
+# ============================================================================
+# EXPORTERS
+# ============================================================================
+
+class TraceExporter:
+    """
+    Writes finished traces from a background thread so request threads never
+    block on file or network I/O. Traces are dropped (and counted) if the
+    queue backs up.
+    """
+
+    def __init__(self, file_path: Optional[str], otlp_endpoint: Optional[str] = None, max_queue: int = 1000):
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.exported = 0
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Dict[str, Any]]):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        # Also restarts the thread in a forked worker, where it did not survive
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                if self.file_path:
+                    self._write_file(spans)
+                if self.otlp_endpoint:
+                    self._post_otlp(spans)
+                self.exported += 1
+            except Exception as e:
+                print(f"Error exporting trace: {e}")
+
+    def _write_file(self, spans: List[Dict[str, Any]]):
+        # One append per trace keeps lines from different workers whole
+        text = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+        with open(self.file_path, "a") as f:
+            f.write(text)
+
+    def _post_otlp(self, spans: List[Dict[str, Any]]):
+        body = json.dumps(to_otlp(spans)).encode()
+        req = urllib.request.Request(
+            self.otlp_endpoint, data=body, headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(req, timeout=5).close()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert exported span dicts to an OTLP/HTTP JSON trace payload."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "watchsense.tracing"},
+                "spans": [{
+                    "traceId": s["trace_id"],
+                    "spanId": s["span_id"],
+                    "parentSpanId": s["parent_id"] or "",
+                    "name": s["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(int(s["start_time"] * 1e9)),
+                    "endTimeUnixNano": str(int(s["end_time"] * 1e9)),
+                    "attributes": [
+                        {"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()
+                    ],
+                    "status": {"code": 2 if s["status"] == "error" else 1},
+                } for s in spans],
+            }],
+        }],
+    }
+
+
+EXPORTER = TraceExporter(TRACE_FILE, TRACE_OTLP_ENDPOINT)